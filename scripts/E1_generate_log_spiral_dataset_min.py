@@ -2,47 +2,42 @@
 #!/usr/bin/env python3
 # E1_generate_log_spiral_dataset_min.py
 # Gera a base em espiral logarítmica com halos (p95) e marcação de primos especiais.
+# --embedding escolhe outra imersão registrada em embedding.py (archimedean, sacks, ulam).
 # Dependências: numpy, pandas, scipy (KDTree)
-import argparse, os, math
+import argparse, math, os
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np, pandas as pd
-from scipy.spatial import KDTree
-
-def is_prime(n:int) -> bool:
-    if n < 2: return False
-    if n % 2 == 0: return n == 2
-    r = int(math.isqrt(n))
-    f = 3
-    while f <= r:
-        if n % f == 0: return False
-        f += 2
-    return True
-
-def mark_specials(df: pd.DataFrame) -> pd.DataFrame:
-    primes = df.loc[df["is_prime"]==1, "n"].to_numpy()
-    P = set(map(int, primes.tolist()))
-    def twin(p):   return (p in P) and ((p-2 in P) or (p+2 in P))
-    def sexy(p):   return (p in P) and ((p-6 in P) or (p+6 in P))
-    def cousin(p): return (p in P) and ((p-4 in P) or (p+4 in P))
-    def sophie(p): return (p in P) and (2*p + 1 in P)
-    df["is_twin_prime"]      = df["n"].apply(lambda p: twin(int(p)))
-    df["is_sexy_prime"]      = df["n"].apply(lambda p: sexy(int(p)))
-    df["is_cousin_prime"]    = df["n"].apply(lambda p: cousin(int(p)))
-    df["is_sophie_germain"]  = df["n"].apply(lambda p: sophie(int(p)))
+from primality import base_primes, prime_mask, sieve_segment
+from density import build_index, count_in_disks, count_primes_streaming
+from constellations import constellation_flags, parse_pattern, segment_flags
+from compact import compact_columns
+from columnar import add_columns, part_path, read_columns, write_columns, write_parts_manifest
+from embedding import EMBEDDINGS, make_embedding
+from instrument import save_profile, stage
+from sketches import HistogramSketch
+
+def mark_specials(df: pd.DataFrame, patterns: dict | None = None) -> pd.DataFrame:
+    # operações vetorizadas sobre a máscara de primos (n contíguo: start..N)
+    n = df["n"].to_numpy()
+    start = int(n[0]) if len(n) else 2
+    if len(n) and not np.array_equal(n, np.arange(start, start + len(n))):
+        raise ValueError("mark_specials requer n contíguo e crescente")
+    flags = constellation_flags(df["is_prime"].to_numpy(), start=start, patterns=patterns)
+    for col, v in flags.items():
+        df[col] = v
     return df
 
-def compute_density(df: pd.DataFrame, mode:str, z_factor:float, fixed_R:float) -> np.ndarray:
-    # KDTree apenas com PRIMOS (densidade "entre primos")
+def compute_density(df: pd.DataFrame, mode:str, z_factor:float, fixed_R:float, workers:int=-1) -> np.ndarray:
+    # índice apenas com PRIMOS (densidade "entre primos"); contagem em lote, sem listas de vizinhos
     prime_xy = df.loc[df["is_prime"]==1, ["x","y"]].to_numpy()
-    tree = KDTree(prime_xy) if len(prime_xy) > 0 else None
-    rho = np.zeros(len(df), dtype=int)
-    for i, row in enumerate(df.itertuples(index=False)):
-        if tree is None:
-            rho[i] = 0
-            continue
-        R = (math.sqrt(row.n) * z_factor) if mode == "adaptive" else fixed_R
-        cnt = len(tree.query_ball_point([row.x, row.y], r=R))
-        rho[i] = cnt
-    return rho
+    if len(prime_xy) == 0:
+        return np.zeros(len(df), dtype=int)
+    if mode == "adaptive":
+        R = np.sqrt(df["n"].to_numpy().astype(float)) * z_factor
+    else:
+        R = np.full(len(df), fixed_R, dtype=float)
+    centers = df[["x","y"]].to_numpy()
+    return count_in_disks(build_index(prime_xy), centers, R, workers=workers).astype(int)
 
 def add_blocks(df: pd.DataFrame, block_size:int) -> pd.DataFrame:
     if block_size <= 0:
@@ -52,62 +47,232 @@ def add_blocks(df: pd.DataFrame, block_size:int) -> pd.DataFrame:
     df["block_id"] = (df["n"].astype(int) - start) // block_size
     return df
 
-def add_halos(df: pd.DataFrame, percentile:int=95, by_block:bool=False) -> pd.DataFrame:
-    col = f"halo_p{percentile}_{'block' if by_block else 'global'}"
-    df[col] = False
+HALO_TASK = 1 << 20  # primos por tarefa (blocos inteiros) no cálculo paralelo dos limiares
+
+def _sorted_percentiles(v: np.ndarray, starts: np.ndarray, counts: np.ndarray, qs) -> np.ndarray:
+    # v ordenado dentro de cada grupo [starts, starts+counts); interpolação linear
+    # idêntica à de np.percentile -> (grupos x percentis)
+    out = np.empty((len(starts), len(qs)))
+    for j, q in enumerate(qs):
+        virtual = (counts - 1) * np.true_divide(q, 100)
+        i0 = np.floor(virtual).astype(np.int64)
+        gamma = virtual - i0
+        a = v[starts + i0]
+        b = v[starts + np.minimum(i0 + 1, counts - 1)]
+        diff = b - a
+        out[:, j] = np.where(gamma >= 0.5, b - diff * (1 - gamma), a + diff * gamma)
+    return out
+
+def block_percentiles(block: np.ndarray, z: np.ndarray, qs, workers: int = -1):
+    # percentis de z por bloco numa passada agrupada: ordena por (bloco, z) e indexa
+    # as estatísticas de ordem; grupos de blocos inteiros vão para threads distintas
+    # -> (ids dos blocos, limiares (blocos x percentis))
+    if len(block) == 0:
+        return block, np.zeros((0, len(qs)))
+    order = np.argsort(block, kind="stable") if np.any(np.diff(block) < 0) else None
+    if order is not None:
+        block, z = block[order], z[order]
+    cuts = np.flatnonzero(np.diff(block)) + 1
+    starts = np.concatenate([[0], cuts]).astype(np.int64)
+    counts = np.diff(np.append(starts, len(block)))
+    tasks = np.searchsorted(starts, np.arange(0, len(block), HALO_TASK), "right") - 1
+    tasks = np.unique(np.append(tasks, len(starts)))
+    def run(t):
+        g0, g1 = int(tasks[t]), int(tasks[t + 1])
+        lo, hi = int(starts[g0]), int(starts[g1]) if g1 < len(starts) else len(block)
+        v = z[lo:hi][np.lexsort((z[lo:hi], block[lo:hi]))]
+        return _sorted_percentiles(v, starts[g0:g1] - lo, counts[g0:g1], qs)
+    workers = (os.cpu_count() or 1) if workers == -1 else max(1, workers)
+    with ThreadPoolExecutor(min(workers, max(len(tasks) - 1, 1))) as ex:
+        thr = list(ex.map(run, range(len(tasks) - 1)))
+    thr = np.vstack(thr) if thr else np.zeros((0, len(qs)))
+    return block[starts], thr
+
+def add_halos(df: pd.DataFrame, percentile=95, by_block:bool=False, workers:int=-1) -> pd.DataFrame:
+    # percentile: um inteiro ou vários (ex. [90, 95, 99]) -> uma coluna por percentil
+    qs = [int(q) for q in np.atleast_1d(percentile)]
+    kind = "block" if by_block else "global"
+    prime = np.flatnonzero(df["is_prime"].to_numpy() == 1)
+    z = df["z_refinado"].to_numpy()[prime]
     if by_block:
-        for bid, g in df.groupby("block_id"):
-            prim = g.loc[g["is_prime"]==1, "z_refinado"]
-            if len(prim) == 0:
-                continue
-            thr = np.percentile(prim, percentile)
-            idx = (df["block_id"]==bid) & (df["is_prime"]==1) & (df["z_refinado"]>=thr)
-            df.loc[idx, col] = True
+        ids, thr = block_percentiles(df["block_id"].to_numpy()[prime], z, qs, workers)
+        thr_row = thr[np.searchsorted(ids, df["block_id"].to_numpy()[prime])]
     else:
-        prim = df.loc[df["is_prime"]==1, "z_refinado"]
-        if len(prim) > 0:
-            thr = np.percentile(prim, percentile)
-            idx = (df["is_prime"]==1) & (df["z_refinado"]>=thr)
-            df.loc[idx, col] = True
+        thr_row = np.broadcast_to(np.percentile(z, qs), (len(z), len(qs))) if len(z) else None
+    for j, q in enumerate(qs):
+        halo = np.zeros(len(df), dtype=bool)
+        if len(prime):
+            halo[prime] = z >= thr_row[:, j]
+        df[f"halo_p{q}_{kind}"] = halo
     return df
 
+def radius_fn(mode:str, z_factor:float, fixed_R:float):
+    # R em função de n (float), como em compute_density
+    if mode == "adaptive":
+        return lambda n: np.sqrt(n) * z_factor
+    return lambda n: np.full(len(n), fixed_R, dtype=float)
+
+def output_columns(df: pd.DataFrame, meta: dict, args):
+    # esquema de saída: largo (uma coluna por campo) ou compacto (compact.py:
+    # flags num inteiro de bits, int32, x/y opcionalmente float32)
+    cols = {c: df[c].to_numpy() for c in df.columns}
+    if args.schema == "compact":
+        return compact_columns(cols, meta, coords=args.coords)
+    return cols, meta
+
+def embedding_of(args):
+    # imersão registrada com os parâmetros que ela declara (b, a, ...)
+    cls = EMBEDDINGS[args.embedding]
+    return make_embedding(args.embedding, args.N, 2, **{k: getattr(args, k) for k in cls.PARAMS})
+
+def generate_streaming(args, patterns: dict, meta: dict) -> None:
+    # modo out-of-core: n em segmentos de tamanho fixo, um dataset particionado
+    # (uma partição por segmento); a memória não depende de N
+    emb = embedding_of(args)
+    seg = args.segment
+    if args.block_size > 0:  # blocos inteiros em cada segmento (halos por bloco locais)
+        seg = max(args.block_size, seg // args.block_size * args.block_size)
+    os.makedirs(args.out_cols, exist_ok=True)
+
+    # 1) densidade: primos em streaming, contagens acumuladas em disco
+    rho_path = os.path.join(args.out_cols, "_prime_rho.npy")
+    rho = np.lib.format.open_memmap(rho_path, mode="w+", dtype=np.int64, shape=(emb.size,))
+    with stage("density", items=emb.size):
+        count_primes_streaming(emb, radius_fn(args.radius_mode, args.z_factor, args.fixed_R), rho,
+                               workers=args.workers)
+
+    # 2) partições (sem o halo global) + esboço mesclável de z_refinado dos primos
+    base = base_primes(math.isqrt(args.N))
+    # z_refinado = prime_rho * log n <= max(prime_rho) * log N: limite do rho já em disco, sem recrivar
+    sketch = HistogramSketch(0.0, int(rho.max(initial=0)) * math.log(args.N))
+    parts = []
+    with stage("partitions", items=emb.size):
+        for k, lo in enumerate(range(0, emb.size, seg)):
+            sl = slice(lo, min(lo + seg, emb.size))
+            n = emb.n(sl)
+            r, theta = emb.polar(sl)
+            x, y = emb.xy(sl)
+            df = pd.DataFrame({"n": n, "x": x, "y": y, "r": r, "theta": theta,
+                               "is_prime": sieve_segment(int(n[0]), int(n[-1]) + 1, base).astype(np.int8)})
+            df["is_composite"] = (df["is_prime"] == 0)
+            df["prime_rho"] = np.asarray(rho[sl])
+            df["z_refinado"] = df["prime_rho"] * np.log(df["n"].astype(float))
+            df["block_id"] = (df["n"] - 2) // args.block_size if args.block_size > 0 else -1
+            for col, v in segment_flags(int(n[0]), int(n[-1]) + 1, args.N, 2, patterns, base).items():
+                df[col] = v
+            if args.block_size > 0:
+                df = add_halos(df, percentile=args.percentile, by_block=True, workers=args.workers)
+            sketch.add(df.loc[df["is_prime"]==1, "z_refinado"])
+            parts.append(part_path(args.out_cols, k))
+            write_columns(parts[-1], *output_columns(df, meta, args))
+    columns = list(df.columns)
+    del rho
+    os.remove(rho_path)
+
+    # 3) halo global: limiar exato por percentil (esboço + segunda passada só nos bins do percentil)
+    qs = args.percentile
+    g_cols = [f"halo_p{q}_global" for q in qs]
+    with stage("global_halo", items=sketch.n):
+        thr = None
+        if sketch.n > 0:
+            sel = [[] for _ in qs]
+            for part in parts:
+                t = read_columns(part, ["is_prime", "z_refinado"])
+                z = t["z_refinado"][t["is_prime"] == 1]
+                for j, q in enumerate(qs):
+                    sel[j].append(z[sketch.selects(z, q)])
+            thr = [sketch.percentile(q, np.concatenate(s)) for q, s in zip(qs, sel)]
+        for part in parts:
+            t = read_columns(part, ["is_prime", "z_refinado"])
+            add_columns(part, {col: np.zeros(len(t["is_prime"]), dtype=bool) if thr is None else
+                               (t["is_prime"] == 1) & (t["z_refinado"] >= thr[j])
+                               for j, col in enumerate(g_cols)})
+
+    # halos globais antes dos halos por bloco, como no modo em memória
+    b_cols = [f"halo_p{q}_block" for q in qs]
+    order = [c for c in columns if c not in b_cols] + g_cols + [c for c in b_cols if c in columns]
+    write_parts_manifest(args.out_cols, parts, meta=dict(meta, segment=seg), order=order)
+    print(f"✅ salvo: {args.out_cols} ({len(parts)} partições)")
+    print("Colunas:", ",".join(order))
+    save_profile(args.out_cols)  # tempos por etapa (GNM_PROFILE=1)
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--N", type=int, default=200_000)
-    ap.add_argument("--b", type=float, default=0.1, help="theta = b*n")
+    ap.add_argument("--embedding", choices=sorted(EMBEDDINGS), default="log_spiral",
+                    help="imersão de n no plano (embedding.py)")
+    ap.add_argument("--b", type=float, default=0.1, help="theta = b*n (log_spiral, archimedean)")
+    ap.add_argument("--a", type=float, default=1 / (2 * math.pi), help="r = a*theta (archimedean)")
     ap.add_argument("--radius_mode", choices=["adaptive","fixed"], default="adaptive")
     ap.add_argument("--z_factor", type=float, default=0.1, help="R = sqrt(n)*z_factor (se adaptive)")
     ap.add_argument("--fixed_R", type=float, default=10.0, help="R fixo (se fixed)")
+    ap.add_argument("--workers", type=int, default=-1, help="núcleos para a densidade (-1 = todos)")
     ap.add_argument("--block_size", type=int, default=50_000)
-    ap.add_argument("--percentile", type=int, default=95)
-    ap.add_argument("--out_csv", type=str, default="data/E1_base_log_espiral.csv")
+    ap.add_argument("--percentile", type=int, nargs="+", default=[95],
+                    help="percentis dos halos (ex. 90 95 99: uma coluna por percentil)")
+    ap.add_argument("--ktuples", nargs="*", default=[],
+                    help="padrões k-tuplas extras: nome (ex. triplet_a) ou nome=0,2,6")
+    ap.add_argument("--out_cols", type=str, default="data/E1_base_log_espiral.cols",
+                    help="dataset colunar (.npy por coluna + manifest.json)")
+    ap.add_argument("--schema", choices=["wide","compact"], default="wide",
+                    help="compact: flags empacotados em bits, int32, sem r/theta/z_refinado redundantes")
+    ap.add_argument("--coords", choices=["float64","float32"], default="float64",
+                    help="tipo de x, y no esquema compacto")
+    ap.add_argument("--out_csv", type=str, default=None, help="CSV opcional (formato antigo)")
+    ap.add_argument("--stream", action="store_true",
+                    help="out-of-core: segmentos de n, dataset particionado (memória limitada)")
+    ap.add_argument("--segment", type=int, default=1 << 24,
+                    help="linhas por segmento/partição em --stream (múltiplo de block_size)")
     args = ap.parse_args()
 
-    n = np.arange(2, args.N+1, dtype=np.int64)
-    theta = args.b * n.astype(float)
-    r = np.log(n.astype(float))
-    x = r * np.cos(theta)
-    y = r * np.sin(theta)
+    if args.coords == "float32" and args.schema != "compact":
+        ap.error("--coords float32 requer --schema compact")
+    patterns = dict(parse_pattern(t) for t in args.ktuples)
+    emb = embedding_of(args)
+    meta = {**emb.meta(), "radius_mode": args.radius_mode,
+            "z_factor": args.z_factor, "fixed_R": args.fixed_R,
+            "block_size": args.block_size,
+            "percentile": args.percentile[0] if len(args.percentile) == 1 else args.percentile}
+    if args.stream:
+        if not args.out_cols or args.out_csv:
+            ap.error("--stream grava apenas o dataset colunar (--out_cols)")
+        generate_streaming(args, patterns, meta)
+        return
+
+    with stage("coords", items=args.N - 1):
+        n = emb.n()
+        r, theta = emb.polar()
+        x, y = emb.xy()
 
-    is_p = np.fromiter((1 if is_prime(int(k)) else 0 for k in n), count=len(n), dtype=np.int8)
+    with stage("sieve", items=args.N - 1):
+        is_p = prime_mask(args.N, start=2)  # crivo segmentado (mesmos rótulos da divisão por tentativa)
 
     df = pd.DataFrame({"n": n, "x": x, "y": y, "r": r, "theta": theta, "is_prime": is_p})
     df["is_composite"] = (df["is_prime"] == 0)
 
-    rho = compute_density(df, args.radius_mode, args.z_factor, args.fixed_R)
+    with stage("density", items=len(df)):
+        rho = compute_density(df, args.radius_mode, args.z_factor, args.fixed_R, args.workers)
     df["prime_rho"] = rho
     df["z_refinado"] = df["prime_rho"] * np.log(df["n"].astype(float))
 
-    df = add_blocks(df, args.block_size)
-    df = mark_specials(df)
-    df = add_halos(df, percentile=args.percentile, by_block=False)
-    if args.block_size > 0:
-        df = add_halos(df, percentile=args.percentile, by_block=True)
+    with stage("specials", items=len(df)):
+        df = add_blocks(df, args.block_size)
+        df = mark_specials(df, patterns)
+    with stage("halos", items=int(is_p.sum())):
+        df = add_halos(df, percentile=args.percentile, by_block=False)
+        if args.block_size > 0:
+            df = add_halos(df, percentile=args.percentile, by_block=True, workers=args.workers)
 
-    os.makedirs(os.path.dirname(args.out_csv) or ".", exist_ok=True)
-    df.to_csv(args.out_csv, index=False)
-    print(f"✅ salvo: {args.out_csv}")
+    with stage("write", items=len(df)):
+        if args.out_cols:
+            write_columns(args.out_cols, *output_columns(df, meta, args))
+            print(f"✅ salvo: {args.out_cols}")
+        if args.out_csv:
+            os.makedirs(os.path.dirname(args.out_csv) or ".", exist_ok=True)
+            df.to_csv(args.out_csv, index=False)
+            print(f"✅ salvo: {args.out_csv}")
     print("Colunas:", ",".join(df.columns))
+    save_profile(args.out_cols or args.out_csv)  # tempos por etapa (GNM_PROFILE=1)
 
 if __name__ == "__main__":
     main()
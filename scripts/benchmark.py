@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for the hot paths
+---------------------------------
+Times the stages the experiments spend their time in, on synthetic
+log-spiral embeddings (embedding.py) over a grid of N, radii R and
+numbers of centers:
+
+- prime_mask            segmented sieve up to N
+- embedding_coords      (x, y) of every row
+- e1_density            E1 compute_density (adaptive R = sqrt(n)*0.1, all rows)
+- mark_specials         E1 constellation flags
+- add_halos_block       E1 per-block p95 halos
+- columnar_write/_load  columnar dataset (x, y, is_prime), loaded into memory
+- csv_load              the same columns from CSV (N <= CSV_MAX_N)
+- build_index           kdtree and spiral index over the primes
+- count_in_disks        prime counts around sampled centers, per index, R, centers
+- count_in_disks_multi  all radii in one call
+- ks_hist / ks_2samp    real vs Cramér-null densities (histogram KS, scipy KS)
+
+Each stage is run `--repeats` times (best and median wall time, CPU time
+of the best run) and once more under tracemalloc for its peak traced
+allocation (NumPy and Python heap; native buffers of scipy's KDTree are
+not traced). Inputs are generated from fixed seeds, so runs on different
+commits measure the same work.
+
+Results go to results/benchmarks/bench_<commit>.csv, one row per
+(stage, index, N, R, centers). `--compare old.csv new.csv` prints the
+time and memory ratios and exits with status 1 if any stage got slower
+than `--threshold`.
+
+  python scripts/benchmark.py                          # N = 1e4 .. 1e6
+  python scripts/benchmark.py --N 1e4 1e5 1e6 1e7 --radii 2 10 20 --centers 10000 50000
+  python scripts/benchmark.py --compare results/benchmarks/bench_a.csv results/benchmarks/bench_b.csv
+"""
+
+import argparse
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+import scipy
+from scipy.stats import ks_2samp
+import E1_generate_log_spiral_dataset_min as E1
+from columnar import load_table, read_columns, write_columns
+from count_stats import count_histogram, ks_hist
+from density import build_index, count_in_disks, count_in_disks_multi
+from embedding import LogSpiralEmbedding
+from null_ensemble import cramer_constant, null_rows
+from primality import prime_mask
+
+N_VALUES = [10_000, 100_000, 1_000_000]
+RADII = [2.0, 10.0, 20.0]
+CENTERS = [10_000, 50_000]
+INDEXES = ["kdtree", "spiral"]
+B = 0.1
+SEED = 42
+REPEATS = 3
+CSV_MAX_N = 1_000_000   # CSV round trips above this are slow enough to dominate the suite
+WORKERS = -1
+OUT_DIR = "./results/benchmarks"
+KEY = ["stage", "index", "N", "R", "centers"]
+
+def git_commit() -> str:
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                             text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                               capture_output=True, text=True).stdout.strip()
+        return rev + ("-dirty" if dirty else "")
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def measure(fn, repeats: int, memory: bool) -> dict:
+    """fn() -> number of items processed; wall/CPU times over repeats, traced peak."""
+    walls, cpus, items = [], [], 0
+    for _ in range(max(1, repeats)):
+        t0, c0 = time.perf_counter(), time.process_time()
+        items = fn()
+        walls.append(time.perf_counter() - t0)
+        cpus.append(time.process_time() - c0)
+    out = {"best_s": min(walls), "median_s": statistics.median(walls),
+           "cpu_s": cpus[int(np.argmin(walls))], "repeats": len(walls), "items": int(items)}
+    out["items_per_s"] = out["items"] / out["best_s"] if out["best_s"] > 0 else np.nan
+    if memory:
+        tracemalloc.start()
+        try:
+            fn()
+            out["peak_mib"] = tracemalloc.get_traced_memory()[1] / 2**20
+        finally:
+            tracemalloc.stop()
+    else:
+        out["peak_mib"] = np.nan
+    return out
+
+def run_suite(n_values, radii, centers_list, repeats: int, memory: bool, workers: int = WORKERS):
+    rows = []
+
+    def bench(stage, fn, index="", N=None, R=None, centers=None):
+        res = measure(fn, repeats, memory)
+        rows.append({"stage": stage, "index": index, "N": N, "R": R, "centers": centers, **res})
+        extra = " ".join(f"{k}={v}" for k, v in (("index", index), ("R", R), ("centers", centers)) if v)
+        print(f"N={N:>10,d} {stage:<22} {extra:<32} best={res['best_s']:8.4f} s "
+              f"peak={res['peak_mib']:9.1f} MiB")
+
+    for N in n_values:
+        emb = LogSpiralEmbedding(N, B)
+        rng = np.random.default_rng(SEED)
+
+        bench("prime_mask", lambda: len(prime_mask(N)), N=N)
+        bench("embedding_coords", lambda: len(emb.coords()), N=N)
+
+        # E1 stages on the in-memory dataframe
+        df = pd.DataFrame({"n": emb.n(), "x": emb.xy()[0], "y": emb.xy()[1],
+                           "is_prime": emb.is_prime().astype(np.int8)})
+        bench("e1_density", lambda: len(E1.compute_density(df, "adaptive", 0.1, 10.0, workers)), N=N)
+        df["prime_rho"] = E1.compute_density(df, "adaptive", 0.1, 10.0, workers)
+        df["z_refinado"] = df["prime_rho"] * np.log(df["n"].astype(float))
+        df = E1.add_blocks(df, 50_000)
+        bench("mark_specials", lambda: len(E1.mark_specials(df)), N=N)
+        bench("add_halos_block", lambda: len(E1.add_halos(df, 95, by_block=True, workers=workers)), N=N)
+
+        # dataset I/O
+        with tempfile.TemporaryDirectory() as tmp:
+            cols = {"x": df["x"].to_numpy(), "y": df["y"].to_numpy(), "is_prime": df["is_prime"].to_numpy()}
+            path = os.path.join(tmp, "bench.cols")
+            bench("columnar_write", lambda: (write_columns(path, cols), N)[1], N=N)
+            bench("columnar_load", lambda: len(np.array(read_columns(path)["x"])), N=N)
+            if N <= CSV_MAX_N:
+                csv = os.path.join(tmp, "bench.csv")
+                pd.DataFrame(cols).to_csv(csv, index=False)
+                bench("csv_load", lambda: len(load_table(csv, ["x", "y", "is_prime"])["x"]), N=N)
+        del df
+
+        # density engine
+        prime_rows = emb.prime_rows()
+        events = emb.coords(prime_rows)
+        null_events = emb.coords(null_rows(emb, emb.size, cramer_constant(emb, emb.size, len(prime_rows)),
+                                           SEED))
+        indexes = {}
+        for kind in INDEXES:
+            bench("build_index", lambda: (build_index(events, kind=kind), len(events))[1], index=kind, N=N)
+            indexes[kind] = (build_index(events, kind=kind), build_index(null_events, kind=kind))
+        for M in centers_list:
+            m = min(M, emb.size)
+            centers = emb.coords(rng.choice(emb.size, size=m, replace=False))
+            for kind, (idx_real, idx_null) in indexes.items():
+                for R in radii:
+                    bench("count_in_disks", lambda: len(count_in_disks(idx_real, centers, R, workers)),
+                          index=kind, N=N, R=R, centers=m)
+                bench("count_in_disks_multi",
+                      lambda: count_in_disks_multi(idx_real, centers, radii, workers).size,
+                      index=kind, N=N, R=None, centers=m)
+            idx_real, idx_null = indexes["kdtree"]
+            for R in radii:
+                rho_real = count_in_disks(idx_real, centers, R, workers)
+                rho_null = count_in_disks(idx_null, centers, R, workers)
+                bench("ks_hist", lambda: (ks_hist(count_histogram(rho_real), count_histogram(rho_null)), m)[1],
+                      N=N, R=R, centers=m)
+                bench("ks_2samp", lambda: (ks_2samp(rho_real, rho_null), m)[1], N=N, R=R, centers=m)
+    return pd.DataFrame(rows)
+
+def compare(old_csv: str, new_csv: str, threshold: float) -> bool:
+    """Print time/memory ratios new/old per stage. Returns False if any stage regressed."""
+    old, new = pd.read_csv(old_csv), pd.read_csv(new_csv)
+    for df in (old, new):
+        df[KEY] = df[KEY].fillna("")
+    m = old.merge(new, on=KEY, suffixes=("_old", "_new"))
+    m["time_ratio"] = m["best_s_new"] / m["best_s_old"]
+    m["mem_ratio"] = m["peak_mib_new"] / m["peak_mib_old"]
+    m = m.sort_values("time_ratio", ascending=False)
+    cols = KEY + ["best_s_old", "best_s_new", "time_ratio", "mem_ratio"]
+    with pd.option_context("display.max_rows", None, "display.width", 200):
+        print(m[cols].to_string(index=False, float_format=lambda v: f"{v:.4g}"))
+    slow = m[m["time_ratio"] > threshold]
+    print(f"\n{len(m)} cases compared, {len(slow)} slower than x{threshold:g}")
+    return slow.empty
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark suite for the hot paths")
+    ap.add_argument("--N", type=float, nargs="+", default=N_VALUES)
+    ap.add_argument("--radii", type=float, nargs="+", default=RADII)
+    ap.add_argument("--centers", type=int, nargs="+", default=CENTERS)
+    ap.add_argument("--repeats", type=int, default=REPEATS)
+    ap.add_argument("--workers", type=int, default=WORKERS)
+    ap.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run")
+    ap.add_argument("--out", default=None, help="CSV path (default results/benchmarks/bench_<commit>.csv)")
+    ap.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    ap.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio flagged by --compare")
+    args = ap.parse_args()
+
+    if args.compare:
+        sys.exit(0 if compare(*args.compare, args.threshold) else 1)
+
+    commit = git_commit()
+    df = run_suite([int(n) for n in args.N], args.radii, args.centers, args.repeats,
+                   not args.no_memory, args.workers)
+    df.insert(0, "commit", commit)
+    df["host"] = platform.node()
+    df["cpus"] = os.cpu_count()
+    df["python"] = platform.python_version()
+    df["numpy"] = np.__version__
+    df["scipy"] = scipy.__version__
+    df["timestamp"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+    out = args.out or os.path.join(OUT_DIR, f"bench_{commit}.csv")
+    os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+    df.to_csv(out, index=False)
+    print("\nSaved:", out)
+
+if __name__ == "__main__":
+    main()
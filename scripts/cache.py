@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Content-addressed cache of arrays
+---------------------------------
+Results that depend only on their inputs (densities around sampled
+points, pair counts, per-center null cumulants, ...) are stored on disk
+under the hash of a parameter dict:
+
+  data/cache/
+      3f/3fa9c2....npz   {"rho_real": ..., "rho_null": ..., "_params": json}
+
+Datasets enter the key through `dataset_fingerprint`, a hash of their
+manifest and of the bytes of the columns read, so a regenerated dataset
+with different content never hits an old entry. Settings that do not
+change the result (count index, number of workers) stay out of the key.
+
+This module only stores and finds entries. The cached computations live
+next to the code they wrap and build their own keys:
+sampled.sampled_densities, grid_density.sampled_grid_densities,
+pair_stats.event_pair_counts and analytic_null.sampled_null_cdf.
+
+Entries are written atomically (temporary file + rename), so concurrent
+runs (pipeline.py) can share the cache. Each hit refreshes the entry's
+mtime, and `put` evicts the least recently used entries once the cache
+exceeds `max_bytes`.
+"""
+
+import hashlib
+import json
+import os
+import numpy as np
+from columnar import iter_parts, load_table, read_manifest
+
+CACHE_DIR = "./data/cache"
+MAX_BYTES = 2 << 30    # LRU bound on the total size of the entries
+HASH_CHUNK = 1 << 24   # bytes hashed per step (columns are memory-mapped)
+
+def _digest(obj) -> str:
+    return hashlib.sha256(json.dumps(obj, sort_keys=True, default=str).encode()).hexdigest()
+
+def dataset_fingerprint(path: str, columns=()) -> str:
+    """Hash of a columnar dataset's manifest and of the content of `columns`."""
+    man = read_manifest(path)
+    h = hashlib.blake2b(json.dumps({"rows": man["rows"], "meta": man.get("meta", {}),
+                                    "columns": list(columns)}, sort_keys=True).encode())
+    for part in iter_parts(path):
+        table = load_table(part, list(columns))
+        for name in columns:
+            raw = np.ascontiguousarray(table[name]).reshape(-1).view(np.uint8)
+            for lo in range(0, len(raw), HASH_CHUNK):
+                h.update(raw[lo:lo + HASH_CHUNK])
+    return h.hexdigest()
+
+class ArrayCache:
+    """On-disk {name: array} entries keyed by a parameter dict, LRU-bounded."""
+
+    def __init__(self, root: str = CACHE_DIR, max_bytes: int = MAX_BYTES):
+        self.root = root
+        self.max_bytes = int(max_bytes)
+
+    @staticmethod
+    def key(params: dict) -> str:
+        return _digest(params)
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key + ".npz")
+
+    def get(self, params: dict) -> dict | None:
+        path = self.path(self.key(params))
+        try:
+            with np.load(path, allow_pickle=False) as z:
+                out = {name: z[name] for name in z.files if name != "_params"}
+        except (FileNotFoundError, ValueError, OSError):
+            return None
+        try:
+            os.utime(path)  # most recently used
+        except FileNotFoundError:
+            pass
+        return out
+
+    def put(self, params: dict, arrays: dict) -> None:
+        path = self.path(self.key(params))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, _params=np.array(json.dumps(params, sort_keys=True, default=str)),
+                     **{name: np.asarray(a) for name, a in arrays.items()})
+        os.replace(tmp, path)
+        self.evict()
+
+    def get_or_compute(self, params: dict, compute) -> dict:
+        """Cached arrays for `params`, or compute() (a {name: array} dict), stored."""
+        out = self.get(params)
+        if out is None:
+            out = compute()
+            self.put(params, out)
+        return out
+
+    def entries(self) -> list:
+        """(mtime, size, path) of every entry, oldest first."""
+        out = []
+        for dirpath, _, files in os.walk(self.root):
+            for name in files:
+                if name.endswith(".npz"):
+                    p = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(p)
+                    except FileNotFoundError:  # evicted by a concurrent run
+                        continue
+                    out.append((st.st_mtime_ns, st.st_size, p))
+        return sorted(out)
+
+    def evict(self) -> None:
+        """Drop least recently used entries until the total size fits max_bytes."""
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, p in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(p)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self) -> None:
+        for _, _, p in self.entries():
+            os.remove(p)
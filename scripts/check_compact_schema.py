@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Checks of the compact schema (compact.py)
+-----------------------------------------
+Runs E1 on a small N with the wide schema and with the compact schema
+(float64 and float32 coordinates, in memory and --stream), and checks:
+
+- round trip: every column of every compact dataset, read back with
+  columnar.read_columns, has the values of the wide one (x, y within one
+  float32 rounding for coords="float32"); virtual columns (flags and
+  derived ones) have the wide dtype, stored int columns may be int32;
+- float32 drift: rounding events and centers to float32 changes the count
+  around each sampled center by at most one event (density.count_drift).
+
+Exits with status 1 and lists the failures if any check fails.
+
+  python scripts/check_compact_schema.py
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import numpy as np
+from columnar import read_columns, read_manifest
+from compact import virtual_columns
+from density import count_drift
+from embedding import LogSpiralEmbedding
+
+N = 100_000
+B = 0.1
+RADII = [2.0, 5.0, 10.0]
+CENTERS = 5_000
+SEED = 42
+MAX_DRIFT = 1   # events per center
+E1 = os.path.join(os.path.dirname(os.path.abspath(__file__)), "E1_generate_log_spiral_dataset_min.py")
+VARIANTS = {
+    "compact": ["--schema", "compact"],
+    "compact_float32": ["--schema", "compact", "--coords", "float32"],
+    "compact_stream": ["--schema", "compact", "--stream", "--segment", "50000"],
+}
+
+def run_e1(path: str, extra) -> None:
+    subprocess.run([sys.executable, E1, "--N", str(N), "--b", str(B), "--out_cols", path, *extra],
+                   check=True, stdout=subprocess.DEVNULL)
+
+def check_round_trip(wide: dict, path: str, float32: bool) -> list:
+    failures = []
+    cols = read_columns(path, mmap=False)
+    virtual = set(virtual_columns(read_manifest(path).get("meta", {})))
+    if list(cols) != list(wide):
+        return [f"{path}: columns {list(cols)} != {list(wide)}"]
+    for name, ref in wide.items():
+        v = cols[name]
+        if name in virtual and v.dtype != ref.dtype:
+            failures.append(f"{path}: virtual column {name!r} is {v.dtype}, wide {ref.dtype}")
+        if float32 and name in ("x", "y"):
+            ok = np.array_equal(v, ref.astype(np.float32))
+        else:
+            ok = np.array_equal(v, ref)
+        if not ok:
+            failures.append(f"{path}: column {name!r} differs from the wide dataset")
+    return failures
+
+def check_drift() -> list:
+    emb = LogSpiralEmbedding(N, B)
+    events = emb.coords(emb.prime_rows())
+    centers = emb.coords(np.random.RandomState(SEED).choice(emb.size, size=min(CENTERS, emb.size),
+                                                            replace=False))
+    failures = []
+    for R in RADII:
+        drift = count_drift(events, centers, R)
+        worst = int(np.abs(drift).max(initial=0))
+        print(f"float32 drift R={R:g}: {np.count_nonzero(drift)} of {len(drift)} centers, max |drift| = {worst}")
+        if worst > MAX_DRIFT:
+            failures.append(f"float32 drift at R={R:g}: {worst} events > {MAX_DRIFT}")
+    return failures
+
+def main():
+    failures = []
+    with tempfile.TemporaryDirectory() as tmp:
+        wide_path = os.path.join(tmp, "wide.cols")
+        run_e1(wide_path, [])
+        wide = read_columns(wide_path, mmap=False)
+        for name, extra in VARIANTS.items():
+            path = os.path.join(tmp, f"{name}.cols")
+            run_e1(path, extra)
+            found = check_round_trip(wide, path, "float32" in extra)
+            print(f"round trip {name}: {'ok' if not found else f'{len(found)} failure(s)'}")
+            failures += found
+    failures += check_drift()
+    if failures:
+        print("\n".join(failures))
+        raise SystemExit(1)
+    print("✔ compact schema checks passed")
+
+if __name__ == "__main__":
+    main()
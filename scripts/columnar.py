@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Columnar dataset format
+-----------------------
+A dataset is a directory (by convention `*.cols`) holding one `.npy` file
+per column plus a `manifest.json`:
+
+  data/E1_base_log_espiral_1M.cols/
+      manifest.json   {"format": "gnm-columns", "version": 1, "rows": ...,
+                       "columns": {"x": {"file": "x.npy", "dtype": "float64"}, ...},
+                       "meta": {...generation parameters...}}
+      n.npy  x.npy  y.npy  is_prime.npy  ...
+
+Readers load only the columns they ask for, memory-mapped (zero-copy).
+`load_table` also accepts legacy CSV files, so older datasets keep working.
+
+A partitioned dataset (written segment by segment, e.g. by E1 --stream)
+holds one columnar dataset per part and a top-level manifest listing them:
+
+      manifest.json   {..., "columns": {"x": {"dtype": "float64"}, ...},
+                       "parts": [{"path": "part-00000", "rows": ...}, ...]}
+      part-00000/  part-00001/  ...
+
+Parts are written independently and the top-level manifest last, so peak
+memory is one part. `iter_parts` streams them; `read_columns` concatenates.
+
+Datasets in the compact schema (compact.py: packed flag word, int32 and
+optional float32 columns, no redundant geometry) store fewer columns than
+they expose; `read_columns` rebuilds the others on read and `add_columns`
+packs new flags into the word.
+"""
+
+import json
+import os
+import numpy as np
+import pandas as pd
+from compact import FLAG_WORD, add_flags, flag_names, is_compact, read_virtual, virtual_columns
+
+FORMAT = "gnm-columns"
+VERSION = 1
+MANIFEST = "manifest.json"
+
+def is_columnar(path: str) -> bool:
+    return os.path.isfile(os.path.join(path, MANIFEST))
+
+def read_manifest(path: str) -> dict:
+    with open(os.path.join(path, MANIFEST)) as f:
+        man = json.load(f)
+    if man.get("format") != FORMAT:
+        raise ValueError(f"{path}: not a {FORMAT} dataset")
+    return man
+
+def write_columns(path: str, columns: dict, meta: dict | None = None) -> None:
+    """Write {name: 1-D array} as a columnar dataset (manifest written last)."""
+    os.makedirs(path, exist_ok=True)
+    rows = None
+    entries = {}
+    for name, values in columns.items():
+        arr = np.ascontiguousarray(np.asarray(values))
+        if arr.ndim != 1:
+            raise ValueError(f"column {name!r} must be 1-D")
+        if rows is None:
+            rows = len(arr)
+        elif len(arr) != rows:
+            raise ValueError(f"column {name!r} has {len(arr)} rows, expected {rows}")
+        fname = f"{name}.npy"
+        np.save(os.path.join(path, fname), arr, allow_pickle=False)
+        entries[name] = {"file": fname, "dtype": arr.dtype.str}
+    man = {"format": FORMAT, "version": VERSION, "rows": int(rows or 0),
+           "columns": entries, "meta": meta or {}}
+    with open(os.path.join(path, MANIFEST), "w") as f:
+        json.dump(man, f, indent=2)
+
+def add_columns(path: str, columns: dict) -> None:
+    """Add (or replace) columns of an existing, unpartitioned dataset."""
+    man = read_manifest(path)
+    meta = man.get("meta", {})
+    flags = {}
+    for name, values in columns.items():
+        arr = np.ascontiguousarray(np.asarray(values))
+        if arr.ndim != 1 or len(arr) != man["rows"]:
+            raise ValueError(f"column {name!r} must be 1-D with {man['rows']} rows")
+        if is_compact(meta) and (arr.dtype == bool or name in flag_names(meta)):
+            flags[name] = arr
+            continue
+        _save_column(path, man, name, arr)
+    if flags:
+        word = read_columns(path, [FLAG_WORD], mmap=False)[FLAG_WORD] if FLAG_WORD in man["columns"] else None
+        word, man["meta"] = add_flags(word, meta, flags)
+        _save_column(path, man, FLAG_WORD, word)
+    with open(os.path.join(path, MANIFEST), "w") as f:
+        json.dump(man, f, indent=2)
+
+def _save_column(path: str, man: dict, name: str, arr: np.ndarray) -> None:
+    fname = f"{name}.npy"
+    np.save(os.path.join(path, fname), arr, allow_pickle=False)
+    man["columns"][name] = {"file": fname, "dtype": arr.dtype.str}
+
+def part_path(path: str, k: int) -> str:
+    return os.path.join(path, f"part-{k:05d}")
+
+def write_parts_manifest(path: str, parts: list, meta: dict | None = None, order=None) -> None:
+    """Top-level manifest over the columnar datasets in `parts` (paths inside `path`)."""
+    mans = [read_manifest(p) for p in parts]
+    layout = mans[0].get("meta", {}).get("compact") if mans else None
+    if layout is not None:  # compact parts: same packed layout everywhere, wide order in the meta
+        for p, m in zip(parts, mans):
+            lm = m.get("meta", {}).get("compact", {})
+            if (lm.get("flags"), lm.get("derived")) != (layout["flags"], layout["derived"]):
+                raise ValueError(f"{p}: compact layout differs from the first part")
+        meta = dict(meta or {}, schema=mans[0]["meta"]["schema"],
+                    compact=dict(layout, order=list(order) if order is not None else layout["order"]))
+        order = None
+    names = list(order) if order is not None else list(mans[0]["columns"]) if mans else []
+    for p, m in zip(parts, mans):
+        if set(m["columns"]) != set(names):
+            raise ValueError(f"{p}: columns differ from the first part")
+    entries = {name: {"dtype": mans[0]["columns"][name]["dtype"]} for name in names}
+    man = {"format": FORMAT, "version": VERSION, "rows": int(sum(m["rows"] for m in mans)),
+           "columns": entries,
+           "parts": [{"path": os.path.relpath(p, path), "rows": m["rows"]} for p, m in zip(parts, mans)],
+           "meta": meta or {}}
+    with open(os.path.join(path, MANIFEST), "w") as f:
+        json.dump(man, f, indent=2)
+
+def iter_parts(path: str):
+    """Paths of the parts of a partitioned dataset, in row order (the dataset itself if unpartitioned)."""
+    man = read_manifest(path)
+    if "parts" not in man:
+        yield path
+        return
+    for part in man["parts"]:
+        yield os.path.join(path, part["path"])
+
+def read_columns(path: str, columns=None, mmap: bool = True) -> dict:
+    """{name: array} for the requested columns (all if None), memory-mapped by default."""
+    man = read_manifest(path)
+    meta = man.get("meta", {})
+    virtual = virtual_columns(meta)
+    if columns is None:
+        names = list(meta["compact"]["order"]) if is_compact(meta) else list(man["columns"])
+    else:
+        names = list(columns)
+    for name in names:
+        if name not in man["columns"] and name not in virtual:
+            raise KeyError(f"{path}: no column {name!r}")
+    if "parts" in man:  # concatenated in memory
+        chunks = [read_columns(p, names, mmap=mmap) for p in iter_parts(path)]
+        return {name: np.concatenate([c[name] for c in chunks]) if chunks else np.zeros(0)
+                for name in names}
+
+    def load(name):
+        return np.load(os.path.join(path, man["columns"][name]["file"]),
+                       mmap_mode="r" if mmap else None, allow_pickle=False)
+
+    out = {name: load(name) for name in names if name in man["columns"]}
+    rest = [name for name in names if name not in out]
+    if rest:  # compact schema: unpacked flags and recomputed columns
+        out.update(read_virtual(rest, lambda name: out[name] if name in out else load(name), meta))
+    return {name: out[name] for name in names}
+
+def load_table(path: str, columns=None, mmap: bool = True) -> dict:
+    """Columns of a columnar dataset or a CSV file, as {name: numpy array}."""
+    if is_columnar(path):
+        return read_columns(path, columns, mmap=mmap)
+    df = pd.read_csv(path, usecols=None if columns is None else list(columns))
+    return {name: df[name].to_numpy() for name in (columns or df.columns)}
+
+def stack_xy(table: dict, rows=None) -> np.ndarray:
+    """(k, 2) coordinates for the selected rows (index array or boolean mask)."""
+    if rows is None:
+        return np.column_stack([table["x"], table["y"]])
+    return np.column_stack([table["x"][rows], table["y"][rows]])
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Compact schema for E1 datasets
+------------------------------
+The wide E1 table spends about 72 bytes per row: n and the counts as
+int64, five float64 geometry columns and one byte per flag. Most of it is
+redundant:
+
+- r = log n and theta = b*n follow from n and the manifest's b (log
+  spiral embedding only),
+  z_refinado = prime_rho * log n, block_id = (n - start) // block_size and
+  is_composite = (is_prime == 0) are recomputed on read. A column is only
+  dropped if the recomputation reproduces it bit for bit;
+- flags (bool columns and 0/1 int8 columns such as is_prime, the
+  constellation and halo flags) are packed into one unsigned word per row,
+  `flags`, of the smallest width that holds them (8 flags: one byte);
+- int64 columns whose values fit are stored as int32;
+- x, y are kept as float64, or rounded to float32 with coords="float32".
+
+With the E1 defaults this is 25 bytes per row (17 with float32
+coordinates): 1e9 rows memory-map into 17-25 GB instead of 72 GB.
+
+The layout goes into the manifest's meta ("schema": "compact", "compact":
+{order, flags, derived, coords}). columnar.read_columns serves the dropped
+columns as virtual ones, so readers ask for "is_prime" or "r" as before and
+get the wide dtype back for those (flags are unpacked on demand, one byte
+per row per flag asked for). Stored columns are memory-mapped as stored:
+int columns narrowed to int32 (n, prime_rho) come back int32, not int64.
+
+Rounding x, y to float32 moves points by up to 2^-24 |x| (about 1e-6 at
+n = 1e6). Counts only change for points that close to a disk boundary:
+density.count_drift measures it (see the README for the E1 and E3 settings).
+check_compact_schema.py checks both the round trip and this drift on a
+small N.
+"""
+
+import numpy as np
+
+SCHEMA = "compact"
+FLAG_WORD = "flags"
+COORDS = ("x", "y")
+COORD_DTYPES = {"float64": np.float64, "float32": np.float32}
+WORD_DTYPES = (np.uint8, np.uint16, np.uint32, np.uint64)
+
+# derived column -> the stored columns it is recomputed from
+DERIVED = {
+    "r": ("n",),
+    "theta": ("n",),
+    "z_refinado": ("n", "prime_rho"),
+    "block_id": ("n",),
+    "is_composite": ("is_prime",),
+}
+
+def is_compact(meta: dict) -> bool:
+    return meta.get("schema") == SCHEMA
+
+def _derive(name: str, get, meta: dict) -> np.ndarray:
+    """The same expressions as E1."""
+    if name == "r":
+        return np.log(get("n").astype(float))
+    if name == "theta":
+        return meta["b"] * get("n").astype(float)
+    if name == "z_refinado":
+        return get("prime_rho") * np.log(get("n").astype(float))
+    if name == "block_id":
+        n, bs = get("n"), int(meta.get("block_size", 0))
+        if bs <= 0:
+            return np.full(len(n), -1, dtype=np.int64)
+        return (n.astype(np.int64) - int(meta.get("start", 2))) // bs
+    if name == "is_composite":
+        return get("is_prime") == 0
+    raise KeyError(name)
+
+def _derivable(name: str, meta: dict) -> bool:
+    """r and theta have the log-spiral expressions only."""
+    return name not in ("r", "theta") or meta.get("embedding", "log_spiral") == "log_spiral"
+
+def _is_flag(values: np.ndarray) -> bool:
+    if values.dtype == bool:
+        return True
+    return values.dtype.kind in "iu" and values.dtype.itemsize == 1 and bool(np.all((values == 0) | (values == 1)))
+
+def word_dtype(n_flags: int):
+    for dt in WORD_DTYPES:
+        if n_flags <= 8 * np.dtype(dt).itemsize:
+            return dt
+    raise ValueError(f"{n_flags} flags do not fit in a 64-bit word")
+
+def pack_flags(columns: dict, names) -> np.ndarray:
+    """Bit k of the word = flag names[k]."""
+    dt = word_dtype(len(names))
+    rows = len(next(iter(columns.values()))) if columns else 0
+    word = np.zeros(rows, dtype=dt)
+    for k, name in enumerate(names):
+        word |= np.asarray(columns[name]).astype(dt) << dt(k)
+    return word
+
+def unpack_flag(word: np.ndarray, bit: int, dtype="|b1") -> np.ndarray:
+    word = np.asarray(word)
+    return ((word >> word.dtype.type(bit)) & 1).astype(dtype)
+
+def compact_columns(columns: dict, meta: dict, coords: str = "float64") -> tuple[dict, dict]:
+    """
+    (stored columns, meta) of the compact schema for the wide {name: array}
+    table `columns`, whose generation parameters (b, start, block_size) are
+    in `meta`.
+    """
+    if coords not in COORD_DTYPES:
+        raise ValueError(f"coords must be one of {sorted(COORD_DTYPES)}")
+    columns = {name: np.asarray(v) for name, v in columns.items()}
+    order = list(columns)
+    derived = [name for name, deps in DERIVED.items()
+               if name in columns and all(d in columns for d in deps) and _derivable(name, meta)
+               and np.array_equal(_derive(name, columns.__getitem__, meta), columns[name])]
+    flags = [name for name in order if name not in derived and _is_flag(columns[name])]
+    stored = {}
+    for name in order:
+        if name in derived or name in flags:
+            continue
+        v = columns[name]
+        if name in COORDS:
+            v = v.astype(COORD_DTYPES[coords])
+        elif v.dtype == np.int64 and (len(v) == 0 or (v.min() >= np.iinfo(np.int32).min
+                                                      and v.max() <= np.iinfo(np.int32).max)):
+            v = v.astype(np.int32)
+        stored[name] = v
+    if flags:
+        stored[FLAG_WORD] = pack_flags(columns, flags)
+    layout = {"order": order, "flags": [[name, columns[name].dtype.str] for name in flags],
+              "derived": derived, "coords": coords}
+    return stored, dict(meta, schema=SCHEMA, compact=layout)
+
+def add_flags(word: np.ndarray | None, meta: dict, columns: dict) -> tuple[np.ndarray, dict]:
+    """Pack extra flag columns into an existing word (widened if needed)."""
+    layout = dict(meta["compact"])
+    flags = [list(f) for f in layout["flags"]]
+    names = [name for name, _ in flags]
+    new = [name for name in columns if name not in names]
+    dt = word_dtype(len(flags) + len(new))
+    word = np.zeros(len(next(iter(columns.values()))), dtype=dt) if word is None else np.asarray(word).astype(dt)
+    for name, values in columns.items():
+        values = np.asarray(values)
+        if name in names:
+            bit = names.index(name)
+            word &= ~dt(1 << bit)
+        else:
+            bit = len(flags)
+            flags.append([name, values.dtype.str])
+            names.append(name)
+            if name not in layout["order"]:
+                layout["order"] = layout["order"] + [name]
+        word |= values.astype(dt) << dt(bit)
+    layout["flags"] = flags
+    return word, dict(meta, compact=layout)
+
+def flag_names(meta: dict) -> list:
+    return [name for name, _ in meta["compact"]["flags"]] if is_compact(meta) else []
+
+def virtual_columns(meta: dict) -> list:
+    """Columns of a compact dataset that are not stored (flags and derived)."""
+    if not is_compact(meta):
+        return []
+    return flag_names(meta) + list(meta["compact"]["derived"])
+
+def read_virtual(names, get, meta: dict) -> dict:
+    """{name: array} for virtual columns; get(name) returns a stored column."""
+    layout = meta["compact"]
+    bits = {name: (k, dt) for k, (name, dt) in enumerate(layout["flags"])}
+
+    def resolve(name):
+        if name in bits:
+            return unpack_flag(get(FLAG_WORD), *bits[name])
+        if name in layout["derived"]:
+            return _derive(name, resolve, meta)
+        return get(name)
+
+    return {name: resolve(name) for name in names}
@@ -5,43 +5,47 @@ Compare density on sampled points (real embedding null)
 Computes prime density around randomly sampled points from the
 real embedding, comparing:
 - real primes vs null primes (same (x,y) geometry)
+
+With ANALYTIC_NULL = True the real densities are also tested against the
+exact null distribution (analytic_null.py): the mixture over the sampled
+centers of the Poisson-binomial laws of the null counts, with no sampling
+noise from a single null realization.
 """
 
-import numpy as np
-import pandas as pd
-from scipy.spatial import KDTree
-from scipy.stats import ks_2samp
+from analytic_null import sampled_null_cdf
+from config import apply_overrides
+from count_stats import ad_hist, count_histogram, cvm_hist, ks_hist, ks_hist_cdf
+from instrument import save_profile, stage
+from sampled import sampled_densities
 
-REAL_DATA = "./data/E1_base_log_espiral_1M.csv"
-REAL_LABEL = "is_prime"
-NULL_DATA = "./data/null_on_real_embedding.csv"
+REAL_DATA = "./data/E1_base_log_espiral_1M.cols"
+NULL_DATA = "./data/null_on_real_embedding.cols"
 
 SAMPLE_SIZE = 50_000
 RADIUS = 10.0
 SEED = 42
-np.random.seed(SEED)
-
-df_real = pd.read_csv(REAL_DATA, engine="python")
-df_null = pd.read_csv(NULL_DATA, engine="python")
-
-# neutral sample points from the full space
-sample_idx = np.random.choice(len(df_real), size=SAMPLE_SIZE, replace=False)
-sample_points = df_real.loc[sample_idx, ["x", "y"]].values
-
-# build event trees
-coords_real = df_real[df_real[REAL_LABEL] == 1][["x", "y"]].values
-coords_null = df_null[df_null["is_prime_null"] == 1][["x", "y"]].values
+WORKERS = -1  # density queries: -1 = all cores
+INDEX = "spiral"  # "spiral" (log-spiral band index) or "kdtree"
+ANALYTIC_NULL = False  # also KS against the exact (Monte-Carlo-free) null distribution
+apply_overrides(globals())  # CONFIG values passed by pipeline.py, if any
 
-tree_real = KDTree(coords_real)
-tree_null = KDTree(coords_null)
+# densities around the same SAMPLE_SIZE neutral points (seed SEED) for real
+# and null primes, read from the cache when these parameters were run before
+rho_real, rho_null = sampled_densities(REAL_DATA, NULL_DATA, RADIUS, SAMPLE_SIZE, SEED,
+                                       kind=INDEX, workers=WORKERS)
+rho_real, rho_null = rho_real[:, 0], rho_null[:, 0]
 
-def density(points, tree, r):
-    return np.array([len(tree.query_ball_point(pt, r=r)) for pt in points])
+# exact two-sample statistics on the count histograms
+with stage("statistics", items=len(rho_real)):
+    h_real, h_null = count_histogram(rho_real), count_histogram(rho_null)
+    ks_stat, ks_p = ks_hist(h_real, h_null)
+    cvm, ad = cvm_hist(h_real, h_null), ad_hist(h_real, h_null)
 
-rho_real = density(sample_points, tree_real, RADIUS)
-rho_null = density(sample_points, tree_null, RADIUS)
-
-ks_stat, ks_p = ks_2samp(rho_real, rho_null)
+if ANALYTIC_NULL:
+    null_cdf = sampled_null_cdf(REAL_DATA, NULL_DATA, RADIUS, SAMPLE_SIZE, SEED,
+                                kind=INDEX, workers=WORKERS)
+    with stage("statistics_exact", items=len(rho_real)):
+        ks_exact, p_exact = ks_hist_cdf(h_real, null_cdf)
 
 print("==== Density on sampled points (same geometry) ====")
 print(f"Mean density (real): {rho_real.mean():.3f}")
@@ -50,3 +54,13 @@ print("")
 print("KS test:")
 print(f"KS statistic = {ks_stat:.4f}")
 print(f"p-value      = {ks_p:.2e}")
+print("")
+print(f"Cramér-von Mises T = {cvm:.4f}")
+print(f"Anderson-Darling   = {ad:.4f}")
+if ANALYTIC_NULL:
+    print("")
+    print("KS test against the exact null distribution:")
+    print(f"KS statistic = {ks_exact:.4f}")
+    print(f"p-value      = {p_exact:.2e}")
+
+save_profile()  # per-stage timings (GNM_PROFILE=1) in results/profiles/
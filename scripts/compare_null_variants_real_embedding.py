@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Compare null-model variants (same geometry, same centers)
+---------------------------------------------------------
+Tests the real primes against several refinements of the Cramér null at
+once (null_variants.py): parity-excluded and wheel-sieved (mod 30)
+Cramér, Granville's model and the block-calibrated Cramér law.
+
+Everything is built in memory from the E1 manifest (no null dataset is
+read or written):
+- one calibration pass over n for all constants and one drawing pass
+  for all event sets, with one uniform per n shared by the variants;
+- the real events, their index and the sampled centers once;
+- per variant, one index and the counts at every radius around the same
+  centers (DENSITY = "grid": one FFT grid size and one set of kernels for
+  all event sets, grid_density.py).
+
+With SEED as in E2/E3 the "cramer" rows are those of E4.
+
+Outputs:
+- data/null_variants_real_embedding.csv: one row per (variant, radius)
+"""
+
+import numpy as np
+import pandas as pd
+from config import apply_overrides
+from count_stats import ad_hist, count_histogram, cvm_hist, ks_hist
+from density import build_index, count_in_disks_multi
+from embedding import open_embedding, sample_centers
+from grid_density import grid_counts
+from instrument import save_profile, stage
+from null_variants import VARIANTS as ALL_VARIANTS, variant_constants, variant_rows
+
+# -----------------------------
+# CONFIGURATION
+# -----------------------------
+REAL_DATA = "./data/E1_base_log_espiral_1M.cols"
+
+VARIANTS = list(ALL_VARIANTS)
+RADII = [2.0, 5.0, 10.0, 20.0]
+SAMPLE_SIZE = 50_000
+SEED = 42          # null draw (as E2) and center sample (as E3)
+WORKERS = -1       # drawing and density query threads: -1 = all cores
+INDEX = "spiral"   # "spiral" (log-spiral band index) or "kdtree"
+DENSITY = "exact"  # "exact" or "grid" (FFT approximation, for dense sweeps)
+GRID_STEP = 0.05   # grid mode: grid step (embedding units)
+OUT_CSV = "./data/null_variants_real_embedding.csv"
+apply_overrides(globals())  # CONFIG values passed by pipeline.py, if any
+
+# -----------------------------
+# EVENTS
+# -----------------------------
+emb = open_embedding(REAL_DATA)
+with stage("primes", items=emb.size):
+    prime_rows = emb.prime_rows()
+with stage("calibrate", items=emb.size):
+    constants = variant_constants(emb, emb.size, VARIANTS, len(prime_rows))
+with stage("draw", items=emb.size):
+    null_rows = variant_rows(emb, emb.size, constants, SEED, workers=WORKERS)
+with stage("sample", items=SAMPLE_SIZE):
+    centers = sample_centers(emb, SAMPLE_SIZE, SEED)
+
+# -----------------------------
+# DENSITIES AROUND THE SAME CENTERS
+# -----------------------------
+sets = {"real": emb.coords(prime_rows), **{v: emb.coords(r) for v, r in null_rows.items()}}
+if DENSITY == "grid":
+    with stage("grid", items=len(sets) * len(centers) * len(RADII)):
+        grids = grid_counts(list(sets.values()), centers, RADII, GRID_STEP, extent=emb.extent,
+                            workers=WORKERS)
+    rho = {name: np.rint(g["rho"]).clip(0).astype(np.int64) for name, g in zip(sets, grids)}
+else:
+    rho = {}
+    for name, events in sets.items():
+        with stage(f"density:{name}", items=len(centers) * len(RADII)):
+            rho[name] = count_in_disks_multi(build_index(events, kind=INDEX), centers, RADII,
+                                             workers=WORKERS)
+
+# -----------------------------
+# STATISTICS
+# -----------------------------
+results = []
+for v in VARIANTS:
+    for k, R in enumerate(RADII):
+        with stage(f"statistics:{v}:R={R:g}", items=len(centers)):
+            h_real, h_null = count_histogram(rho["real"][:, k]), count_histogram(rho[v][:, k])
+            ks_stat, ks_p = ks_hist(h_real, h_null)
+            results.append({
+                "variant": v,
+                "R": R,
+                "mean_rho_real": rho["real"][:, k].mean(),
+                "mean_rho_null": rho[v][:, k].mean(),
+                "KS_statistic": ks_stat,
+                "p_value": ks_p,
+                "CvM_statistic": cvm_hist(h_real, h_null),
+                "AD_statistic": ad_hist(h_real, h_null),
+                "n_real_primes": len(prime_rows),
+                "n_null_events": len(null_rows[v]),
+                "c": float(np.mean(constants[v])),
+            })
+        print(f"{v:>13s} R={R:>5}: mean(real)={rho['real'][:, k].mean():.2f} | "
+              f"mean(null)={rho[v][:, k].mean():.2f} | KS={ks_stat:.4f} | p={ks_p:.2e}")
+
+# -----------------------------
+# SAVE RESULTS
+# -----------------------------
+df_out = pd.DataFrame(results)
+df_out.to_csv(OUT_CSV, index=False)
+save_profile(OUT_CSV)  # per-stage timings next to the CSV (GNM_PROFILE=1)
+
+print(f"\nReal primes: {len(prime_rows)} | "
+      + " | ".join(f"{v}: {len(null_rows[v])}" for v in VARIANTS))
+print("✔ Null variants (same geometry) saved to:")
+print(f"  {OUT_CSV}")
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+CONFIG overrides passed by the pipeline runner
+----------------------------------------------
+pipeline.py passes a stage's parameters to its script as a JSON object in
+the PIPELINE_PARAMS environment variable. Each script calls
+`apply_overrides(globals())` right after its CONFIG block, so the values
+replace its constants. A name the script does not define is an error.
+
+The scripts import this module and not pipeline.py. pipeline.py hashes
+the local modules a script imports, so keeping the runner out of them
+means editing the runner does not make every stage stale.
+"""
+
+import json
+import os
+
+ENV = "PIPELINE_PARAMS"
+
+def apply_overrides(namespace: dict) -> None:
+    """Replace a script's CONFIG constants by the values passed in PIPELINE_PARAMS."""
+    raw = os.environ.get(ENV)
+    if not raw:
+        return
+    params = json.loads(raw)
+    unknown = sorted(k for k in params if k not in namespace)
+    if unknown:
+        raise KeyError(f"unknown parameter(s) {unknown}")
+    namespace.update(params)
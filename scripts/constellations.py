@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Prime constellations (vectorized)
+---------------------------------
+Flags twin, cousin, sexy and Sophie Germain primes, plus arbitrary
+admissible k-tuple patterns, using shifted boolean operations on the
+prime mask of a contiguous range n = start..N. No per-row Python calls.
+
+Only primes inside the range are visible, as in the original set-based
+marking: p+2, p-2, 2p+1, ... must themselves lie in start..N.
+segment_flags gives the same columns for one segment lo..hi-1 of the
+range, sieving only the segment's neighbourhood (and 2lo+1..2hi-1).
+"""
+
+import numpy as np
+from primality import base_primes, sieve_segment
+
+# name -> offsets; a number is flagged if it belongs to some occurrence
+# of the pattern (p + o prime for every offset o)
+PAIR_PATTERNS = {
+    "is_twin_prime":   (0, 2),
+    "is_sexy_prime":   (0, 6),
+    "is_cousin_prime": (0, 4),
+}
+
+TUPLE_PATTERNS = {
+    "triplet_a":   (0, 2, 6),
+    "triplet_b":   (0, 4, 6),
+    "quadruplet":  (0, 2, 6, 8),
+    "quintuplet_a": (0, 2, 6, 8, 12),
+    "quintuplet_b": (0, 4, 6, 10, 12),
+    "sextuplet":   (0, 4, 6, 10, 12, 16),
+}
+
+def normalize_pattern(offsets) -> tuple:
+    offs = sorted({int(o) for o in offsets})
+    if not offs:
+        raise ValueError("empty k-tuple pattern")
+    return tuple(o - offs[0] for o in offs)
+
+def is_admissible(offsets) -> bool:
+    """A pattern is admissible if it misses some residue class mod every prime q <= k."""
+    offs = normalize_pattern(offsets)
+    for q in base_primes(len(offs)):
+        if len({o % int(q) for o in offs}) == int(q):
+            return False
+    return True
+
+def parse_pattern(spec: str) -> tuple:
+    """'name=0,2,6' -> ('name', (0, 2, 6)); a bare known name is looked up in TUPLE_PATTERNS."""
+    if "=" not in spec:
+        if spec not in TUPLE_PATTERNS:
+            raise ValueError(f"unknown k-tuple pattern: {spec!r}")
+        return spec, TUPLE_PATTERNS[spec]
+    name, offs = spec.split("=", 1)
+    return name.strip(), tuple(int(o) for o in offs.split(","))
+
+def _shift(mask: np.ndarray, k: int) -> np.ndarray:
+    """out[i] = mask[i + k] (False outside the range)."""
+    out = np.zeros_like(mask)
+    if k >= 0:
+        if k < len(mask):
+            out[:len(mask) - k] = mask[k:]
+    elif -k < len(mask):
+        out[-k:] = mask[:len(mask) + k]
+    return out
+
+def tuple_members(is_p: np.ndarray, offsets) -> np.ndarray:
+    """Members of any occurrence of the pattern `offsets` in the mask."""
+    offs = normalize_pattern(offsets)
+    if not is_admissible(offs):
+        raise ValueError(f"pattern {offs} is not admissible")
+    P = np.asarray(is_p).astype(bool, copy=False)
+    starts = P.copy()
+    for o in offs[1:]:
+        starts &= _shift(P, o)
+    members = starts.copy()
+    for o in offs[1:]:
+        members |= _shift(starts, -o)
+    return members
+
+def sophie_germain(is_p: np.ndarray, start: int = 2) -> np.ndarray:
+    """p with 2p+1 also prime (2p+1 inside the range)."""
+    P = np.asarray(is_p).astype(bool, copy=False)
+    out = np.zeros_like(P)
+    # index i <-> n = start + i ; 2n+1 <-> index 2i + start + 1
+    first = start + 1
+    if first < 0:
+        raise ValueError("start must be >= -1")
+    partner = P[first::2]
+    m = min(len(P), len(partner))
+    out[:m] = P[:m] & partner[:m]
+    return out
+
+def constellation_flags(is_p: np.ndarray, start: int = 2, patterns: dict | None = None) -> dict:
+    """
+    Boolean columns for n = start..start+len(is_p)-1:
+    twin, sexy, cousin, Sophie Germain and any extra {column: offsets}.
+    """
+    cols = {name: tuple_members(is_p, offs) for name, offs in PAIR_PATTERNS.items()}
+    cols["is_sophie_germain"] = sophie_germain(is_p, start)
+    for name, offs in (patterns or {}).items():
+        cols[name if name.startswith("is_") else f"is_{name}"] = tuple_members(is_p, offs)
+    return cols
+
+def segment_flags(lo: int, hi: int, N: int, start: int = 2, patterns: dict | None = None,
+                  base: np.ndarray | None = None) -> dict:
+    """
+    constellation_flags restricted to n = lo..hi-1 of the range start..N,
+    identical to slicing the full-range columns. `base` as in sieve_segment.
+    """
+    pad = max(max(o) for o in list(PAIR_PATTERNS.values()) + list((patterns or {}).values()))
+    a, b = max(lo - pad, start), min(hi + pad, N + 1)
+    P = sieve_segment(a, b, base)
+    cols = {name: tuple_members(P, offs)[lo - a:hi - a] for name, offs in PAIR_PATTERNS.items()}
+    # 2n+1 for n = lo..hi-1, inside the range
+    sg = np.zeros(hi - lo, dtype=bool)
+    top = min(2 * hi - 1, N)
+    if top >= 2 * lo + 1:
+        partner = sieve_segment(2 * lo + 1, top + 1, base)[::2]
+        sg[:len(partner)] = P[lo - a:lo - a + len(partner)] & partner
+    cols["is_sophie_germain"] = sg
+    for name, offs in (patterns or {}).items():
+        cols[name if name.startswith("is_") else f"is_{name}"] = tuple_members(P, offs)[lo - a:hi - a]
+    return cols
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Two-sample statistics on count histograms
+-----------------------------------------
+Local densities are non-negative integers, so a sample of rho values is
+summarized exactly by its histogram h[k] = #{rho == k} (np.bincount).
+Histograms of chunks, workers or jobs merge by addition, and every
+statistic below needs O(max rho) memory whatever the number of centers:
+
+- ks_hist:   two-sample Kolmogorov-Smirnov D and p-value (same values
+             as scipy.stats.ks_2samp, two-sided, method="auto"),
+- ks_location: where D is attained, with both CDFs there,
+- ks_hist_cdf: one-sample KS D and p-value against a known CDF on the
+             integers (e.g. the exact null mixture of analytic_null.py),
+- cvm_hist:  two-sample Cramér-von Mises T (scipy.stats.cramervonmises_2samp),
+- ad_hist:   k-sample Anderson-Darling, midrank version, normalized as
+             scipy.stats.anderson_ksamp's `statistic`.
+
+CvM and AD are returned without p-values; calibrate them with the null
+ensemble (null_ensemble.py) when needed.
+"""
+
+import math
+import numpy as np
+from scipy.stats import distributions, ks_2samp
+
+MAX_EXACT_N = 10_000  # as ks_2samp: exact p-value up to this sample size, asymptotic above
+HARMONIC_CHUNK = 1 << 20
+
+def count_histogram(values, minlength: int = 0) -> np.ndarray:
+    """h[k] = number of values equal to k (values: non-negative integers)."""
+    values = np.asarray(values)
+    if len(values) and values.min() < 0:
+        raise ValueError("counts must be non-negative")
+    return np.bincount(values.astype(np.int64, copy=False), minlength=minlength).astype(np.int64)
+
+def merge_histograms(*hists) -> np.ndarray:
+    """Sum of histograms of different lengths."""
+    out = np.zeros(max((len(h) for h in hists), default=0), dtype=np.int64)
+    for h in hists:
+        out[:len(h)] += h
+    return out
+
+def _aligned(*hists):
+    m = max(len(h) for h in hists)
+    return [np.pad(np.asarray(h, dtype=np.int64), (0, m - len(h))) for h in hists]
+
+def _cdf_diff(h1, h2):
+    h1, h2 = _aligned(h1, h2)
+    n1, n2 = int(h1.sum()), int(h2.sum())
+    if min(n1, n2) == 0:
+        raise ValueError("empty histogram")
+    support = np.flatnonzero(h1 + h2)  # the data values, where ks_2samp evaluates the CDFs
+    F1 = np.cumsum(h1)[support] / n1
+    F2 = np.cumsum(h2)[support] / n2
+    return support, F1, F2, n1, n2
+
+def _ks_from_diff(support, F1, F2):
+    diff = F1 - F2
+    i_max, i_min = int(np.argmax(diff)), int(np.argmin(diff))
+    max_s, min_s = diff[i_max], float(np.clip(-diff[i_min], 0, 1))
+    i = i_min if min_s > max_s else i_max
+    return float(max(max_s, min_s)), i
+
+def ks_hist(h1, h2) -> tuple[float, float]:
+    """(D, p-value) of the two-sample KS test between two count histograms."""
+    support, F1, F2, n1, n2 = _cdf_diff(h1, h2)
+    d, _ = _ks_from_diff(support, F1, F2)
+    if max(n1, n2) <= MAX_EXACT_N:  # small samples: scipy's exact distribution
+        return d, float(ks_2samp(np.repeat(np.arange(len(h1)), h1),
+                                 np.repeat(np.arange(len(h2)), h2)).pvalue)
+    m, n = sorted([float(n1), float(n2)], reverse=True)
+    return d, float(np.clip(distributions.kstwo.sf(d, np.round(m * n / (m + n))), 0, 1))
+
+def ks_location(h1, h2) -> tuple[int, float, float]:
+    """(rho, F1(rho), F2(rho)) at the value where the KS distance is attained."""
+    support, F1, F2, _, _ = _cdf_diff(h1, h2)
+    _, i = _ks_from_diff(support, F1, F2)
+    return int(support[i]), float(F1[i]), float(F2[i])
+
+def ks_hist_cdf(h, cdf) -> tuple[float, float]:
+    """
+    (D, p-value) of the one-sample KS test of a count histogram against
+    cdf[k] = P(X <= k), k = 0..len(cdf)-1 (1 beyond). Both CDFs are steps at
+    the integers, so D is a maximum over k. The p-value is the continuous
+    one (kstwo), conservative for a discrete distribution.
+    """
+    h = np.asarray(h, dtype=np.int64)
+    n = int(h.sum())
+    if n == 0:
+        raise ValueError("empty histogram")
+    m = max(len(h), len(cdf))
+    F1 = np.cumsum(np.pad(h, (0, m - len(h)))) / n
+    F2 = np.pad(np.asarray(cdf, dtype=float), (0, m - len(cdf)), constant_values=1.0)
+    d = float(np.abs(F1 - F2).max())
+    return d, float(np.clip(distributions.kstwo.sf(d, n), 0, 1))
+
+def ecdf_hist(h) -> tuple[np.ndarray, np.ndarray]:
+    """(values, CDF at each value) over the support of the histogram."""
+    h = np.asarray(h, dtype=np.int64)
+    support = np.flatnonzero(h)
+    return support, np.cumsum(h)[support] / h.sum()
+
+def _sq_dev(r, first, count):
+    """sum over i = first..first+count-1 of (r - i)^2 (per value, vectorized)."""
+    u = r - first
+    a = count.astype(float)
+    return a * u * u - u * a * (a - 1) + (a - 1) * a * (2 * a - 1) / 6
+
+def cvm_hist(h1, h2) -> float:
+    """Two-sample Cramér-von Mises T (midranks for ties)."""
+    h1, h2 = _aligned(h1, h2)
+    nx, ny = int(h1.sum()), int(h2.sum())
+    if nx <= 1 or ny <= 1:
+        raise ValueError("each histogram needs at least two observations")
+    c = np.cumsum(h1 + h2)
+    r = (c - (h1 + h2)) + ((h1 + h2) + 1) / 2.0  # midrank of each value in the pooled sample
+    a1, a2 = np.cumsum(h1) - h1 + 1, np.cumsum(h2) - h2 + 1  # within-sample index of the first tie
+    u = nx * _sq_dev(r, a1, h1).sum() + ny * _sq_dev(r, a2, h2).sum()
+    k, N = nx * ny, nx + ny
+    return float(u / (k * N) - (4 * k - 1) / (6 * N))
+
+def _harmonic_terms(N: int) -> tuple[float, float]:
+    """h = sum_{i<N} 1/i and g = sum_{i=2}^{N-1} (sum_{j=N-i+1}^{N-1} 1/j) / i, chunked."""
+    h, g, tail = 1.0, 0.0, 0.0  # tail: running sum of 1/j for j = N-1 down to N-i+1
+    for lo in range(2, N, HARMONIC_CHUNK):
+        i = np.arange(lo, min(lo + HARMONIC_CHUNK, N), dtype=float)
+        cs = tail + np.cumsum(1.0 / (N - i + 1))
+        g += float((cs / i).sum())
+        tail = float(cs[-1])
+    if N > 2:
+        h = tail + 1.0
+    return h, g
+
+def ad_hist(*hists) -> float:
+    """Normalized k-sample Anderson-Darling statistic (midrank version)."""
+    hists = _aligned(*hists)
+    k = len(hists)
+    if k < 2:
+        raise ValueError("need at least two histograms")
+    n = np.array([int(h.sum()) for h in hists], dtype=float)
+    if np.any(n == 0):
+        raise ValueError("empty histogram")
+    pooled = np.sum(hists, axis=0)
+    support = np.flatnonzero(pooled)
+    if len(support) < 2:
+        raise ValueError("need more than one distinct value")
+    N = float(n.sum())
+    lj = pooled[support].astype(float)
+    Bj = (np.cumsum(pooled) - pooled)[support] + lj / 2.0
+    A2kN = 0.0
+    for h, ni in zip(hists, n):
+        Mij = (np.cumsum(h) - h / 2.0)[support]
+        inner = lj / N * (N * Mij - Bj * ni) ** 2 / (Bj * (N - Bj) - N * lj / 4.0)
+        A2kN += inner.sum() / ni
+    A2kN *= (N - 1.0) / N
+
+    H = (1.0 / n).sum()
+    h, g = _harmonic_terms(int(N))
+    a = (4 * g - 6) * (k - 1) + (10 - 6 * g) * H
+    b = (2 * g - 4) * k ** 2 + 8 * h * k + (2 * g - 14 * h - 4) * H - 8 * h + 4 * g - 6
+    c = (6 * h + 2 * g - 2) * k ** 2 + (4 * h - 4 * g + 6) * k + (2 * h - 6) * H + 4 * h
+    d = (2 * h + 6) * k ** 2 - 4 * h * k
+    sigmasq = (a * N ** 3 + b * N ** 2 + c * N + d) / ((N - 1.0) * (N - 2.0) * (N - 3.0))
+    return float((A2kN - (k - 1)) / math.sqrt(sigmasq))
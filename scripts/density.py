@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Local density engine (count-only)
+---------------------------------
+Counts events inside disks |e - c| <= R for many centers at once,
+without building neighbor lists.
+
+The event set is summarized by its radial extent E = max |e|:
+- if R >= |c| + E the disk covers every event  -> count in O(1),
+- if R <  |c| - E the disk misses every event  -> 0,
+- otherwise one batched, count-only KDTree query (all cores).
+Covering disks are the common case of E1's adaptive radius
+R = sqrt(n)*z_factor, which outgrows the spiral (|e| <= log N) quickly.
+
+count_in_disks_multi returns a (centers x radii) matrix. For a handful of
+radii it runs one count per radius; for dense sweeps it visits each
+neighbor within max(radii) once and bins it by distance, in batches of
+centers spread over `workers` threads, sized from the count within
+max(radii) so that all batches in flight hold at most PAIR_MEMORY bytes
+of (center, event) pairs.
+
+count_in_disks_groups splits each count by an integer event label (e.g.
+the cutoff an event first belongs to), so nested event sets are counted
+in one pass; a cumulative sum over the labels gives the nested counts.
+
+sum_in_disks adds up per-event weights (one or more columns) instead of
+counting, for indexes built with build_index(..., weights=w).
+
+count_primes_streaming counts the primes of an embedding around all of
+its own points with bounded memory: prime segments are sieved one at a
+time, and each segment is skipped, added in O(1) or indexed depending on
+the radial extent of the segment against each chunk of centers.
+
+Counts are identical to len(KDTree(events).query_ball_point(c, R)).
+For log-spiral event sets, build_index(..., kind="spiral") returns the
+polar band index of spiral_index.py instead (same counts, same API).
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from scipy.spatial import KDTree
+from embedding import CHUNK
+from primality import SEGMENT_SIZE, iter_prime_segments
+from spiral_index import SpiralIndex
+
+WORKERS = -1   # all cores
+_TOL = 1e-12   # keeps the O(1) shortcuts away from floating-point ties
+LOOP_MAX_RADII = 8       # up to this many radii: one count-only pass per radius
+PAIR_MEMORY = 1 << 27    # bytes of (center, event) pairs held at once by the batches of all threads
+PAIR_BYTES = 40          # per pair: center, event and distance (24 B) plus its bin and key
+
+def _threads(workers: int) -> int:
+    return (os.cpu_count() or 1) if workers == -1 else max(1, workers)
+
+def pair_batches(pairs: np.ndarray, workers: int = 1) -> np.ndarray:
+    """
+    Bounds 0 = b_0 < b_1 < ... = len(pairs) of consecutive center batches
+    whose (center, event) pairs (pairs[i] per center) fit in PAIR_MEMORY
+    bytes when `workers` batches are held at once (one center at least).
+    """
+    budget = max(1, PAIR_MEMORY // (PAIR_BYTES * max(1, workers)))
+    total = np.cumsum(np.maximum(np.asarray(pairs, dtype=np.int64), 1))
+    bounds, lo = [0], 0
+    while lo < len(total):
+        base = total[lo - 1] if lo else 0
+        lo = max(lo + 1, int(np.searchsorted(total, base + budget, "right")))
+        bounds.append(min(lo, len(total)))
+    return np.asarray(bounds)
+
+class EventIndex:
+    """KDTree over a 2D event set plus its radial extent."""
+
+    def __init__(self, events: np.ndarray, leafsize: int = 16,
+                 groups: np.ndarray | None = None, n_groups: int | None = None,
+                 weights: np.ndarray | None = None):
+        events = np.asarray(events, dtype=float).reshape(-1, 2)
+        self.events = events
+        self.weights = None if weights is None else np.asarray(weights, dtype=float).reshape(len(events), -1)
+        self.groups = None if groups is None else np.asarray(groups, dtype=np.int64).ravel()
+        self.n_groups = 1 if groups is None else int(
+            n_groups if n_groups is not None else self.groups.max(initial=-1) + 1)
+        self._group_index = None
+        self.n = len(events)
+        self.extent = float(np.hypot(events[:, 0], events[:, 1]).max()) if self.n else 0.0
+        self.tree = KDTree(events, leafsize=leafsize) if self.n else None
+
+    def count(self, centers: np.ndarray, r, workers: int = WORKERS) -> np.ndarray:
+        centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+        r = np.broadcast_to(np.asarray(r, dtype=float), (len(centers),))
+        out = np.zeros(len(centers), dtype=np.int64)
+        if self.n == 0 or len(centers) == 0:
+            return out
+        rho = np.hypot(centers[:, 0], centers[:, 1])
+        full = rho + self.extent <= r * (1 - _TOL) - _TOL
+        empty = rho - self.extent > r * (1 + _TOL) + _TOL
+        out[full] = self.n
+        part = ~(full | empty)
+        if part.any():
+            out[part] = self.tree.query_ball_point(
+                centers[part], r[part], return_length=True, workers=workers
+            )
+        return out
+
+    def count_multi(self, centers: np.ndarray, radii, workers: int = WORKERS) -> np.ndarray:
+        """(centers x radii) counts from one traversal up to max(radii), binned by distance."""
+        centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+        radii = np.asarray(radii, dtype=float).ravel()
+        order = np.argsort(radii, kind="stable")
+        rs = radii[order]
+        k = len(rs)
+        hist = np.zeros((len(centers), k + 1), dtype=np.int64)
+        if self.n == 0 or len(centers) == 0 or k == 0:
+            return hist[:, :k]
+        workers = _threads(workers)
+        bounds = pair_batches(self.count(centers, rs[-1], workers=workers), workers)
+
+        def run(b):
+            lo, hi = bounds[b], bounds[b + 1]
+            pairs = KDTree(centers[lo:hi]).sparse_distance_matrix(self.tree, rs[-1], output_type="ndarray")
+            j = np.searchsorted(rs, pairs["v"], "left")
+            hist[lo:hi] = np.bincount(pairs["i"] * (k + 1) + j,
+                                      minlength=(hi - lo) * (k + 1)).reshape(-1, k + 1)
+
+        # sparse_distance_matrix is single-threaded: the batches run on a pool
+        batches = range(len(bounds) - 1)
+        if workers == 1 or len(batches) <= 1:
+            for b in batches:
+                run(b)
+        else:
+            with ThreadPoolExecutor(min(workers, len(batches))) as ex:
+                list(ex.map(run, batches))
+        out = np.empty((len(centers), k), dtype=np.int64)
+        out[:, order] = np.cumsum(hist, axis=1)[:, :k]
+        return out
+
+    def sum(self, centers: np.ndarray, r, workers: int = WORKERS) -> np.ndarray:
+        """(centers x weight columns) total event weight within r, from neighbor lists in batches."""
+        if self.weights is None:
+            raise ValueError("index was built without weights")
+        centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+        r = np.broadcast_to(np.asarray(r, dtype=float), (len(centers),))
+        out = np.zeros((len(centers), self.weights.shape[1]))
+        if self.n == 0 or len(centers) == 0:
+            return out
+        bounds = pair_batches(self.count(centers, r, workers=workers))
+        for s, e in zip(bounds[:-1], bounds[1:]):
+            step = e - s
+            lists = self.tree.query_ball_point(centers[s:s + step], r[s:s + step], workers=workers)
+            rows = np.repeat(np.arange(len(lists)), [len(l) for l in lists])
+            ev = np.concatenate([np.asarray(l, dtype=np.int64) for l in lists])
+            for j in range(self.weights.shape[1]):
+                out[s:s + step, j] = np.bincount(rows, weights=self.weights[ev, j], minlength=len(lists))
+        return out
+
+    def count_groups(self, centers: np.ndarray, r, workers: int = WORKERS) -> np.ndarray:
+        """(centers x n_groups) counts: one count-only pass per group's own tree."""
+        centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+        if self.groups is None:
+            return self.count(centers, r, workers=workers)[:, None]
+        if self._group_index is None:
+            self._group_index = [EventIndex(self.events[self.groups == g]) for g in range(self.n_groups)]
+        out = np.zeros((len(centers), self.n_groups), dtype=np.int64)
+        for g, idx in enumerate(self._group_index):
+            out[:, g] = idx.count(centers, r, workers=workers)
+        return out
+
+def build_index(events: np.ndarray, kind: str = "kdtree", groups: np.ndarray | None = None,
+                n_groups: int | None = None, weights: np.ndarray | None = None):
+    """
+    kind: "kdtree" (any geometry) or "spiral" (points on nested rings, as
+    the spiral embeddings: see Embedding.index).
+    groups: optional integer label per event, for count_in_disks_groups.
+    weights: optional (events,) or (events, k) weights, for sum_in_disks.
+    """
+    if kind == "kdtree":
+        return EventIndex(events, groups=groups, n_groups=n_groups, weights=weights)
+    if kind == "spiral":
+        return SpiralIndex(events, groups=groups, n_groups=n_groups, weights=weights)
+    raise ValueError(f"unknown index kind: {kind!r}")
+
+def count_in_disks(index, centers: np.ndarray, r, workers: int = WORKERS) -> np.ndarray:
+    """Number of events within distance r (scalar or per-center) of each center."""
+    return index.count(centers, r, workers=workers)
+
+def count_in_disks_groups(index, centers: np.ndarray, r, workers: int = WORKERS) -> np.ndarray:
+    """(centers x groups) matrix of event counts within r, split by event group."""
+    return index.count_groups(centers, r, workers=workers)
+
+def sum_in_disks(index, centers: np.ndarray, r, workers: int = WORKERS) -> np.ndarray:
+    """(centers x weight columns) total weight of the events within r of each center."""
+    return index.sum(centers, r, workers=workers)
+
+def count_in_disks_multi(index, centers: np.ndarray, radii, workers: int = WORKERS) -> np.ndarray:
+    """(centers x radii) matrix of event counts, one column per radius."""
+    centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+    radii = np.asarray(radii, dtype=float).ravel()
+    if len(radii) > LOOP_MAX_RADII:
+        return index.count_multi(centers, radii, workers=workers)
+    out = np.zeros((len(centers), len(radii)), dtype=np.int64)
+    for k, R in enumerate(radii):
+        out[:, k] = index.count(centers, R, workers=workers)
+    return out
+
+def count_drift(events: np.ndarray, centers: np.ndarray, r, dtype=np.float32, kind: str = "spiral",
+                workers: int = WORKERS) -> np.ndarray:
+    """
+    Per-center change of the counts when events and centers are rounded to
+    `dtype` (e.g. the float32 coordinates of the compact schema).
+    """
+    def counts(ev, c):
+        return count_in_disks(build_index(ev, kind=kind), c, r, workers=workers)
+    ev, c = np.asarray(events, dtype=float), np.asarray(centers, dtype=float)
+    rounded = counts(ev.astype(dtype).astype(float), c.astype(dtype).astype(float))
+    return rounded - counts(ev, c)
+
+def count_primes_streaming(emb, radius, out: np.ndarray, segment: int = SEGMENT_SIZE,
+                           kind: str | None = None, workers: int = WORKERS) -> np.ndarray:
+    """
+    out[i] += number of primes of `emb` within radius(n_i) of row i, for every
+    row. `radius` maps n (float array) to R. Memory: one sieve segment of
+    events plus one chunk of centers; `out` may be a disk-backed memmap.
+    kind: count index, by default the one the embedding declares (emb.index).
+    """
+    kind = emb.index if kind is None else kind
+    chunks = []  # (rows, min |c|, max |c|, min R, max R) per chunk of centers
+    for lo in range(0, emb.size, CHUNK):
+        sl = slice(lo, min(lo + CHUNK, emb.size))
+        nf = emb.n(sl).astype(float)
+        R = np.asarray(radius(nf), dtype=float)
+        rho = emb.radius(sl)
+        chunks.append((sl, rho.min() * (1 - _TOL), rho.max() * (1 + _TOL), R.min(), R.max()))
+    full = np.zeros(len(chunks), dtype=np.int64)
+    for lo_n, flags in iter_prime_segments(emb.start, emb.N, segment):
+        rows = np.flatnonzero(flags) + (lo_n - emb.start)
+        if len(rows) == 0:
+            continue
+        events = emb.coords(rows)
+        t = np.hypot(events[:, 0], events[:, 1])
+        t0, t1 = t.min(), t.max()
+        index = None
+        for k, (sl, r0, r1, R0, R1) in enumerate(chunks):
+            if r1 + t1 <= R0 * (1 - _TOL) - _TOL:        # every disk covers the segment
+                full[k] += len(rows)
+                continue
+            if min(t0 - r1, r0 - t1) > R1 * (1 + _TOL) + _TOL:  # every disk misses it
+                continue
+            if index is None:
+                index = build_index(events, kind=kind)
+            R = np.asarray(radius(emb.n(sl).astype(float)), dtype=float)
+            out[sl] += count_in_disks(index, emb.coords(sl), R, workers=workers)
+    for k, (sl, *_) in enumerate(chunks):
+        out[sl] += full[k]
+    return out
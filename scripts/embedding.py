@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+Embeddings of n = start..N in the plane (computed on the fly)
+-------------------------------------------------------------
+Every embedding is fully determined by its name, N and a few parameters,
+stored in the manifest meta ({"embedding": name, "N", "start", ...}).
+The default, and the only one of datasets written before the registry,
+is the log spiral:
+
+  n = start..N,   theta = b*n,   r = log n,   x = r cos(theta),   y = r sin(theta)
+
+Registered embeddings (EMBEDDINGS, make_embedding):
+- "log_spiral"   theta = b n, r = log n                  (b)
+- "archimedean"  theta = b n, r = a theta                (a, b)
+- "sacks"        theta = 2 pi sqrt(n), r = sqrt(n)       (Sacks spiral)
+- "ulam"         the square spiral on the integer lattice, n = 1 at the origin
+
+Each class computes coordinates lazily, for a row slice, an index array
+or chunk by chunk, with vectorized numpy kernels (`polar` for the
+PolarEmbedding spirals, `xy` otherwise), and declares what the density
+engine and the null generator need without looking at the points: `extent` (radius of a disk holding every point),
+`radius(rows)` (|e| per row, for the O(1) coverage shortcuts of streaming
+counts) and `index`, the count index suited to its layout ("spiral" for
+points on nested rings, "kdtree" for the lattice). `meta()` is what E1
+and E2 write, and open_embedding rebuilds the embedding from it.
+`extent` and the coordinate kernel are abstract (Embedding is an ABC), so
+an incomplete embedding fails when instantiated.
+sample_centers draws the sampled centers of the density comparisons.
+
+The log spiral uses exactly the same floating-point operations as E1 (so
+the values are bit-identical to the stored columns). Every embedding is
+paired with a bit-packed prime mask (N/8 bytes) from the segmented sieve.
+
+Rows are 0-based: row i <-> n = start + i.
+"""
+
+from abc import ABC, abstractmethod
+import math
+import numpy as np
+from columnar import read_manifest
+from primality import iter_prime_segments
+
+CHUNK = 1 << 22
+
+EMBEDDINGS = {}   # name -> class
+
+def register(name: str):
+    """Class decorator adding an embedding to EMBEDDINGS under `name`."""
+    def deco(cls):
+        cls.name = name
+        EMBEDDINGS[name] = cls
+        return cls
+    return deco
+
+class Embedding(ABC):
+    """Lazy (x, y) coordinates of n = start..N; subclasses define extent and xy()."""
+
+    name = None
+    PARAMS = ()        # geometry parameters besides N and start (attributes, keys of meta)
+    index = "spiral"   # count index suited to the point layout (density.build_index kind)
+
+    def __init__(self, N: int, start: int = 2):
+        if N < start:
+            raise ValueError("N must be >= start")
+        self.N, self.start = int(N), int(start)
+        self.size = self.N - self.start + 1
+        self._prime_bits = None
+
+    def params(self) -> dict:
+        return {k: getattr(self, k) for k in self.PARAMS}
+
+    def meta(self) -> dict:
+        return {"embedding": self.name, "N": self.N, "start": self.start, **self.params()}
+
+    def __repr__(self):
+        args = ", ".join(f"{k}={v}" for k, v in {"N": self.N, **self.params(), "start": self.start}.items())
+        return f"{type(self).__name__}({args})"
+
+    @property
+    @abstractmethod
+    def extent(self) -> float:
+        """Radius of the disk containing every point."""
+
+    # ---------------- coordinates ----------------
+    def n(self, rows=None) -> np.ndarray:
+        """n values for a slice, index array or boolean mask of rows (all if None)."""
+        if rows is None:
+            rows = slice(None)
+        if isinstance(rows, slice):
+            lo, hi, step = rows.indices(self.size)
+            return np.arange(self.start + lo, self.start + hi, step, dtype=np.int64)
+        rows = np.asarray(rows)
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+        return rows.astype(np.int64) + self.start
+
+    @abstractmethod
+    def xy(self, rows=None):
+        """(x, y) arrays of the selected rows."""
+
+    def polar(self, rows=None):
+        x, y = self.xy(rows)
+        return np.hypot(x, y), np.arctan2(y, x)
+
+    def radius(self, rows=None) -> np.ndarray:
+        """|e| of the selected rows."""
+        return self.polar(rows)[0]
+
+    def coords(self, rows=None) -> np.ndarray:
+        """(k, 2) array of coordinates for the selected rows."""
+        return np.column_stack(self.xy(rows))
+
+    def iter_chunks(self, chunk: int = CHUNK):
+        """Yield (row_lo, n, x, y) for consecutive row chunks."""
+        for lo in range(0, self.size, chunk):
+            sl = slice(lo, min(lo + chunk, self.size))
+            n = self.n(sl)
+            x, y = self.xy(sl)
+            yield lo, n, x, y
+
+    # ---------------- primes ----------------
+    @property
+    def prime_bits(self) -> np.ndarray:
+        """Bit-packed prime mask over rows (np.packbits order)."""
+        if self._prime_bits is None:
+            parts, carry = [], np.zeros(0, dtype=bool)
+            for _, flags in iter_prime_segments(self.start, self.N):
+                flags = np.concatenate([carry, flags])
+                cut = len(flags) - len(flags) % 8
+                parts.append(np.packbits(flags[:cut]))
+                carry = flags[cut:]
+            parts.append(np.packbits(carry))
+            self._prime_bits = np.concatenate(parts)
+        return self._prime_bits
+
+    def is_prime(self, rows=None) -> np.ndarray:
+        """Boolean prime flags for the selected rows."""
+        if rows is None or isinstance(rows, slice):
+            lo, hi, step = (rows or slice(None)).indices(self.size)
+            b0 = lo // 8
+            bits = np.unpackbits(self.prime_bits[b0:(hi + 7) // 8]).astype(bool)
+            return bits[lo - 8 * b0:hi - 8 * b0:step]
+        rows = np.asarray(rows)
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+        return ((self.prime_bits[rows >> 3] >> (7 - (rows & 7))) & 1).astype(bool)
+
+    def prime_count(self) -> int:
+        """pi(N) - pi(start - 1), counted on the packed mask."""
+        return int(np.bitwise_count(self.prime_bits).sum(dtype=np.int64))
+
+    def prime_rows(self) -> np.ndarray:
+        """Row indices of the primes (chunked, so no N-byte mask is materialized)."""
+        out = []
+        for lo in range(0, self.size, CHUNK):
+            out.append(np.flatnonzero(self.is_prime(slice(lo, min(lo + CHUNK, self.size)))) + lo)
+        return np.concatenate(out) if out else np.zeros(0, dtype=np.int64)
+
+class PolarEmbedding(Embedding):
+    """Embedding defined in polar coordinates: subclasses define extent and polar()."""
+
+    @abstractmethod
+    def polar(self, rows=None):
+        """(r, theta) arrays of the selected rows."""
+
+    def xy(self, rows=None):
+        r, theta = self.polar(rows)
+        return r * np.cos(theta), r * np.sin(theta)
+
+@register("log_spiral")
+class LogSpiralEmbedding(PolarEmbedding):
+    """theta = b*n, r = log n."""
+
+    PARAMS = ("b",)
+
+    def __init__(self, N: int, b: float = 0.1, start: int = 2):
+        super().__init__(N, start)
+        self.b = float(b)
+
+    @property
+    def extent(self) -> float:
+        """Radius of the disk containing every point (r = log N)."""
+        return float(np.log(float(self.N)))
+
+    def polar(self, rows=None):
+        nf = self.n(rows).astype(float)
+        return np.log(nf), self.b * nf
+
+    def radius(self, rows=None) -> np.ndarray:
+        return np.log(self.n(rows).astype(float))
+
+@register("archimedean")
+class ArchimedeanEmbedding(PolarEmbedding):
+    """theta = b*n, r = a*theta (turns 2 pi a apart)."""
+
+    PARAMS = ("b", "a")
+
+    def __init__(self, N: int, b: float = 0.1, a: float = 1.0 / (2.0 * np.pi), start: int = 2):
+        super().__init__(N, start)
+        self.b, self.a = float(b), float(a)
+
+    @property
+    def extent(self) -> float:
+        return abs(self.a * self.b) * float(self.N)
+
+    def polar(self, rows=None):
+        theta = self.b * self.n(rows).astype(float)
+        return self.a * theta, theta
+
+    def radius(self, rows=None) -> np.ndarray:
+        return np.abs(self.polar(rows)[0])
+
+@register("sacks")
+class SacksEmbedding(PolarEmbedding):
+    """Sacks spiral: r = sqrt(n), theta = 2 pi sqrt(n) (perfect squares on one ray)."""
+
+    @property
+    def extent(self) -> float:
+        return float(np.sqrt(float(self.N)))
+
+    def polar(self, rows=None):
+        r = np.sqrt(self.n(rows).astype(float))
+        return r, 2.0 * np.pi * r
+
+    def radius(self, rows=None) -> np.ndarray:
+        return np.sqrt(self.n(rows).astype(float))
+
+@register("ulam")
+class UlamEmbedding(Embedding):
+    """Ulam square spiral: n = 1 at (0, 0), 2 at (1, 0), counter-clockwise rings."""
+
+    index = "kdtree"  # lattice points, not rings
+
+    @property
+    def extent(self) -> float:
+        """Corner of the outermost ring k: sqrt(2) k."""
+        return float(np.sqrt(2.0) * ((math.isqrt(self.N - 1) + 1) // 2))
+
+    def xy(self, rows=None):
+        n = self.n(rows)
+        m1 = n - 1
+        s = np.floor(np.sqrt(m1.astype(float))).astype(np.int64)   # isqrt(n - 1)
+        s -= s * s > m1
+        s += (s + 1) * (s + 1) <= m1
+        k = (s + 1) // 2                # ring: (2k-1)^2 < n <= (2k+1)^2
+        t = 2 * k                       # side length of the ring
+        d = (2 * k + 1) ** 2 - n        # steps back from the ring's last number
+        side = np.minimum(d // np.maximum(t, 1), 3)
+        e = d - side * t
+        x = np.select([side == 0, side == 1, side == 2], [k - e, -k, -k + e], k)
+        y = np.select([side == 0, side == 1, side == 2], [-k, -k + e, k], k - e)
+        return x.astype(float), y.astype(float)
+
+def make_embedding(name: str, N: int, start: int = 2, **params) -> Embedding:
+    """Registered embedding `name` with its geometry parameters."""
+    if name not in EMBEDDINGS:
+        raise ValueError(f"unknown embedding {name!r}; registered: {sorted(EMBEDDINGS)}")
+    return EMBEDDINGS[name](N, start=start, **params)
+
+def embedding_from_meta(meta: dict) -> Embedding:
+    """Embedding of a manifest meta (the log spiral when it has no "embedding" key)."""
+    name = meta.get("embedding", "log_spiral")
+    cls = EMBEDDINGS.get(name)
+    if cls is None or "N" not in meta or not set(cls.PARAMS) <= set(meta):
+        need = ["N"] + list(cls.PARAMS if cls else [])
+        raise ValueError(f"manifest has no embedding parameters ({name}: {', '.join(need)})")
+    return cls(meta["N"], start=meta.get("start", 2), **{k: meta[k] for k in cls.PARAMS})
+
+def open_embedding(path: str) -> Embedding:
+    """Embedding described by the `meta` of a columnar dataset written by E1."""
+    try:
+        return embedding_from_meta(read_manifest(path).get("meta", {}))
+    except ValueError as e:
+        raise ValueError(f"{path}: {e}") from None
+
+def sample_centers(emb, sample_size: int, seed: int) -> np.ndarray:
+    """Coordinates of min(sample_size, rows) rows drawn without replacement with np.random.seed(seed)."""
+    return emb.coords(np.random.RandomState(seed).choice(emb.size, size=min(int(sample_size), emb.size),
+                                                         replace=False))
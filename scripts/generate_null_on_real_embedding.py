@@ -2,57 +2,70 @@
 """
 Null model on REAL embedding (recommended)
 ------------------------------------------
-Uses the exact (x,y) positions from the real dataset and
-samples pseudo-primes with Cramér-like probability, optionally
+Uses the exact (x,y) positions of the real embedding (regenerated
+from its (N, b) parameters, see embedding.py) and samples
+pseudo-primes with Cramér-like probability, optionally
 calibrated to match the total number of real primes.
 
+VARIANT picks the law (null_variants.py): "cramer" (p = c/log n, the
+default), "cramer_odd" / "cramer_wheel" (parity or mod-30 residues
+excluded), "granville" (Granville's sieved model) or "cramer_local"
+(c calibrated per block of rows). It is recorded in the meta as "variant".
+
+The embedding is processed in chunks of n: c comes from a chunked sum of
+1/log n, and chunk k is drawn from the k-th child of SeedSequence(SEED)
+(null_ensemble.null_rows), in parallel over WORKERS threads. The events
+are the same for any number of workers, and memory is one chunk plus the
+event list.
+
 Outputs:
-- data/null_on_real_embedding.csv
+- data/null_on_real_embedding.cols (columnar dataset, see columnar.py):
+  the sorted rows of the is_prime_null events (int32) plus the embedding
+  parameters and c
 """
 
-import math
 import numpy as np
-import pandas as pd
+from config import apply_overrides
+from embedding import open_embedding
+from instrument import save_profile, stage
+from null_variants import LOCAL_BLOCK, variant_constants, variant_rows
+from sampled import write_event_rows
 
-REAL_DATA = "./data/E1_base_log_espiral_1M.csv"
+REAL_DATA = "./data/E1_base_log_espiral_1M.cols"
 REAL_LABEL = "is_prime"
-OUT_PATH = "./data/null_on_real_embedding.csv"
+OUT_PATH = "./data/null_on_real_embedding.cols"
+NULL_LABEL = "is_prime_null"
 
 SEED = 42
+VARIANT = "cramer"  # null law, see null_variants.VARIANTS
 CALIBRATE_TO_MATCH_COUNT = True  # match #events exactly
-np.random.seed(SEED)
-
-df = pd.read_csv(REAL_DATA)
+WORKERS = -1  # threads drawing chunks: -1 = all cores (same events for any value)
+apply_overrides(globals())  # CONFIG values passed by pipeline.py, if any
 
-# Ensure n exists
-if "n" not in df.columns:
-    raise ValueError("REAL_DATA must contain column 'n'.")
-
-N = int(df["n"].max())
+# geometry and prime mask from the (N, b) of the E1 manifest: no coordinate column is read
+emb = open_embedding(REAL_DATA)
+N = emb.N
 
 # Real prime count
-pi_N = int(df[df[REAL_LABEL] == 1].shape[0])
-
-# Base weights w(n)=1/log(n)
-w = 1.0 / np.log(df["n"].values)
-
-if CALIBRATE_TO_MATCH_COUNT:
-    # Choose c so that sum(c*w) = pi(N)  =>  c = pi/sum(w)
-    c = pi_N / w.sum()
-else:
-    c = 1.0
+with stage("primes", items=emb.size):
+    pi_N = emb.prime_count()
 
-p = np.clip(c * w, 0.0, 1.0)
-is_null = (np.random.rand(len(df)) < p).astype(int)
+# Choose c so that sum(c*w) = pi(N), w(n) = m(n)/log(n) summed chunk by chunk  =>  c = pi/sum(w)
+with stage("calibrate", items=emb.size):
+    c = variant_constants(emb, emb.size, [VARIANT], pi_N)[VARIANT] if CALIBRATE_TO_MATCH_COUNT else 1.0
 
-df_out = df[["n", "x", "y"]].copy()
-# keep geometry columns if you have them
-for col in ["r", "theta", "z"]:
-    if col in df.columns:
-        df_out[col] = df[col]
+# one SeedSequence child per chunk of n ("cramer": the same events as null_ensemble.null_rows)
+with stage("draw", items=emb.size):
+    rows = variant_rows(emb, emb.size, {VARIANT: c}, SEED, workers=WORKERS)[VARIANT]
 
-df_out["is_prime_null"] = is_null
-df_out.to_csv(OUT_PATH, index=False)
+# coordinates are regenerated from the embedding parameters by embedding.open_embedding
+with stage("write", items=len(rows)):
+    write_event_rows(OUT_PATH, rows, NULL_LABEL,
+                     meta={**emb.meta(), "source": REAL_DATA,
+                           "label": REAL_LABEL, "seed": SEED, "variant": VARIANT,
+                           **({"c_block": np.asarray(c).tolist(), "block": LOCAL_BLOCK}
+                              if np.ndim(c) else {"c": float(c)})})
+save_profile(OUT_PATH)  # per-stage timings next to the dataset (GNM_PROFILE=1)
 
 print(f"✔ Null model saved to {OUT_PATH}")
-print(f"Real primes: {pi_N} | Null events: {int(is_null.sum())} | c={c:.6g}")
+print(f"Real primes: {pi_N} | Null events: {len(rows)} | {VARIANT}: c={np.mean(c):.6g}")
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Per-stage timing and memory instrumentation
+-------------------------------------------
+Scripts wrap their phases in named stages,
+
+  with stage("build_index", items=len(events)):
+      index = build_index(events)
+
+and call `save_profile(output_path)` at the end. For each stage this
+records wall time, CPU time (process, all threads), the process peak RSS
+at the end of the stage (high-water mark so far) and the growth of that
+peak during the stage, plus an optional item count. `save_profile` writes
+them to a JSON sidecar next to the output, `<output>.profile.json`, or to
+results/profiles/<script>.profile.json for scripts without an output file.
+
+Set GNM_PROFILE=1 to turn it on. Otherwise `stage` returns a shared no-op
+context and `save_profile` does nothing, so instrumented code runs as
+before.
+"""
+
+import json
+import os
+import sys
+import time
+
+try:
+    import resource
+except ImportError:  # not on Windows: peak RSS is not recorded
+    resource = None
+
+ENV = "GNM_PROFILE"
+ENABLED = os.environ.get(ENV, "") not in ("", "0")
+PROFILE_DIR = "./results/profiles"
+
+_records = []
+_t_start = time.perf_counter()
+
+def _peak_rss_mib() -> float | None:
+    if resource is None:
+        return None
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return kb / 1024 / (1024 if sys.platform == "darwin" else 1)  # bytes on macOS, KiB elsewhere
+
+class _Stage:
+    def __init__(self, name: str, items=None):
+        self.name, self.items = name, items
+
+    def __enter__(self):
+        self._rss0 = _peak_rss_mib()
+        self._c0 = time.process_time()
+        self._t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        wall = time.perf_counter() - self._t0
+        cpu = time.process_time() - self._c0
+        rss = _peak_rss_mib()
+        _records.append({
+            "stage": self.name, "wall_s": round(wall, 6), "cpu_s": round(cpu, 6),
+            "peak_rss_mib": None if rss is None else round(rss, 1),
+            "peak_rss_growth_mib": None if rss is None else round(rss - self._rss0, 1),
+            "items": None if self.items is None else int(self.items),
+            "failed": exc[0] is not None,
+        })
+        return False
+
+class _NoStage:
+    """Shared context used when instrumentation is off."""
+    items = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NO_STAGE = _NoStage()
+
+def stage(name: str, items=None):
+    """Context manager timing one named stage (set `.items` inside if known later)."""
+    return _Stage(name, items) if ENABLED else _NO_STAGE
+
+def records() -> list:
+    return list(_records)
+
+def merge(recs) -> None:
+    """Add stages recorded in another process (e.g. a pool worker)."""
+    _records.extend(recs)
+
+def sidecar_path(output: str | None = None) -> str:
+    if output is None:
+        script = os.path.splitext(os.path.basename(sys.argv[0] or "python"))[0]
+        return os.path.join(PROFILE_DIR, f"{script}.profile.json")
+    return os.path.normpath(output).rstrip(os.sep) + ".profile.json"
+
+def save_profile(output: str | None = None) -> str | None:
+    """Write the stages recorded so far next to `output`. Returns the sidecar path."""
+    if not ENABLED:
+        return None
+    path = sidecar_path(output)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    doc = {"script": os.path.basename(sys.argv[0]), "argv": sys.argv[1:],
+           "finished": time.strftime("%Y-%m-%dT%H:%M:%S"),
+           "total_wall_s": round(time.perf_counter() - _t_start, 6),
+           "total_cpu_s": round(time.process_time(), 6),
+           "peak_rss_mib": _peak_rss_mib(), "stages": _records}
+    with open(path, "w") as f:
+        json.dump(doc, f, indent=2)
+    return path
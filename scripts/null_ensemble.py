@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Monte Carlo ensemble of same-geometry null realizations
+-------------------------------------------------------
+Draws many independent Cramér-type null configurations on the same
+embedding rows,
+
+  X_n ~ Bernoulli(c / log n),   c = (#real primes) / sum(1/log n),
+
+and measures the local density of each one around the same centers. Each
+realization has its own SeedSequence child stream, so the ensemble does not
+depend on the number of processes or on the order in which they finish.
+
+Workers get the embedding parameters (Embedding.meta()), not its
+coordinates: null event coordinates are regenerated from them
+(embedding.py). The
+centers and the (realizations x centers) density matrix live in shared
+memory, so neither is pickled.
+
+Every realization is drawn chunk by chunk over n (null_rows): chunk k of
+CHUNK rows uses the k-th child of the realization's SeedSequence, so the
+event set does not depend on how many threads draw the chunks either.
+Stored null datasets (E2) and the densities around sampled centers that
+E3 and E4 compute from them are in sampled.py.
+
+The summary compares the observed KS(real, null_i) values with the
+null-to-null reference KS(null_i, null_j) over disjoint pairs
+(0, 1), (2, 3), ..., which are independent draws of the statistic
+under the null hypothesis.
+"""
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+import os
+import numpy as np
+from count_stats import count_histogram, ks_hist
+from density import build_index, count_in_disks
+from embedding import CHUNK, Embedding, embedding_from_meta
+
+QUANTILES = (0.025, 0.5, 0.975)
+
+_shared = {}   # per-worker views of the shared arrays
+
+def cramer_constants(emb: Embedding, rows, n_events) -> np.ndarray:
+    """
+    c_k such that sum(c_k / log n) over the first rows[k] rows equals
+    n_events[k], for every cutoff k in one chunked pass.
+    """
+    rows = np.asarray(rows, dtype=np.int64).ravel()
+    cuts = np.sort(np.unique(rows))
+    seg = np.zeros(len(cuts))   # sum of 1/log n over rows [cuts[k-1], cuts[k])
+    for lo in range(0, int(cuts[-1]) if len(cuts) else 0, CHUNK):
+        hi = min(lo + CHUNK, int(cuts[-1]))
+        w = 1.0 / np.log(emb.n(slice(lo, hi)).astype(float))
+        edges = np.clip(np.concatenate([[0], cuts]) - lo, 0, hi - lo)
+        seg += np.add.reduceat(np.append(w, 0.0), edges[:-1])[:len(cuts)] * (edges[1:] > edges[:-1])
+    w_sum = np.cumsum(seg)[np.searchsorted(cuts, rows)]
+    return np.asarray(n_events, dtype=float) / w_sum
+
+def cramer_constant(emb: Embedding, rows: int, n_events: int) -> float:
+    """c such that sum(c / log n) over the first `rows` rows equals n_events."""
+    return float(cramer_constants(emb, [rows], [n_events])[0])
+
+def null_rows(emb: Embedding, rows: int, c: float, seed, workers: int = 1) -> np.ndarray:
+    """
+    Sorted row indices (< rows) of one null realization. seed: an int or a
+    SeedSequence; chunk k of CHUNK rows draws from its k-th spawned child,
+    so the result is the same for any number of worker threads.
+    """
+    seq = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    starts = range(0, rows, CHUNK)
+    children = seq.spawn(len(starts))
+
+    def draw(k):
+        lo = starts[k]
+        n = emb.n(slice(lo, min(lo + CHUNK, rows))).astype(float)
+        p = np.clip(c / np.log(n), 0.0, 1.0)
+        return np.flatnonzero(np.random.default_rng(children[k]).random(len(p)) < p) + lo
+
+    workers = (os.cpu_count() or 1) if workers == -1 else max(1, workers)
+    if workers == 1 or len(starts) <= 1:
+        out = [draw(k) for k in range(len(starts))]
+    else:
+        with ThreadPoolExecutor(min(workers, len(starts))) as ex:
+            out = list(ex.map(draw, range(len(starts))))
+    return np.concatenate(out) if out else np.zeros(0, dtype=np.int64)
+
+def _attach(params, centers_spec, rho_spec):
+    for key, (name, shape, dtype) in (("centers", centers_spec), ("rho", rho_spec)):
+        shm = shared_memory.SharedMemory(name=name)
+        _shared[key + "_shm"] = shm
+        _shared[key] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    _shared["params"] = params
+
+def _realization(task):
+    i, seed = task
+    meta, rows, c, radius, kind = _shared["params"]
+    emb = embedding_from_meta(meta)
+    events = emb.coords(null_rows(emb, rows, c, seed))
+    _shared["rho"][i] = count_in_disks(build_index(events, kind=kind), _shared["centers"],
+                                       radius, workers=1)
+    return i, len(events)
+
+def _shared_array(shape, dtype):
+    dtype = np.dtype(dtype)
+    shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+    return shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf), (shm.name, shape, dtype.str)
+
+def run_ensemble(emb: Embedding, rows: int, centers: np.ndarray, radius: float,
+                 n_events: int, n_realizations: int, seed: int, processes: int = -1,
+                 kind: str = "kdtree") -> tuple[np.ndarray, np.ndarray]:
+    """
+    Densities of `n_realizations` null configurations on the first `rows`
+    rows of the embedding, calibrated to `n_events` expected events.
+    Returns ((realizations x centers) int64 counts, events per realization).
+    """
+    centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+    c = cramer_constant(emb, rows, n_events)
+    seeds = np.random.SeedSequence(seed).spawn(n_realizations)
+    params = (emb.meta(), int(rows), c, float(radius), kind)
+
+    c_shm, c_arr, c_spec = _shared_array(centers.shape, np.float64)
+    r_shm, r_arr, r_spec = _shared_array((n_realizations, len(centers)), np.int64)
+    n_null = np.zeros(n_realizations, dtype=np.int64)
+    try:
+        c_arr[:] = centers
+        processes = (os.cpu_count() or 1) if processes == -1 else max(1, processes)
+        with ProcessPoolExecutor(min(processes, max(n_realizations, 1)), initializer=_attach,
+                                 initargs=(params, c_spec, r_spec)) as ex:
+            for i, k in ex.map(_realization, enumerate(seeds)):
+                n_null[i] = k
+        return r_arr.copy(), n_null
+    finally:
+        for shm in (c_shm, r_shm):
+            shm.close()
+            shm.unlink()
+
+def ks_envelopes(rho_real: np.ndarray, rho_null: np.ndarray,
+                 quantiles=QUANTILES) -> dict:
+    """
+    Quantiles of KS(real, null_i) over the realizations and of the
+    null-to-null reference KS(null_2k, null_2k+1), plus the fraction of
+    reference values >= the median observed KS (empirical p-value).
+    """
+    h_real = count_histogram(rho_real)
+    h_null = [count_histogram(r) for r in rho_null]
+    ks_rn = np.array([ks_hist(h_real, h)[0] for h in h_null])
+    ks_nn = np.array([ks_hist(h_null[j], h_null[j + 1])[0] for j in range(0, len(h_null) - 1, 2)])
+    out = {"n_realizations": len(rho_null), "n_null_pairs": len(ks_nn)}
+    for name, v in (("KS_real_null", ks_rn), ("KS_null_null", ks_nn)):
+        for q in quantiles:
+            out[f"{name}_q{q * 100:g}"] = float(np.quantile(v, q)) if len(v) else np.nan
+    med = float(np.median(ks_rn)) if len(ks_rn) else np.nan
+    out["p_empirical"] = float((np.count_nonzero(ks_nn >= med) + 1) / (len(ks_nn) + 1))
+    return out
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Null-model variants drawn together in one pass over n
+-----------------------------------------------------
+Refinements of the Cramér null on the same embedding rows, each a law
+
+  X_n ~ Bernoulli(p_v(n)),   p_v(n) = min(1, c_v * m_v(n) / log n),
+
+with a multiplier m_v(n) that encodes what the variant keeps of the
+arithmetic of n:
+- "cramer"        m = 1 (the E2 null);
+- "cramer_odd"    parity excluded: m = 2 for odd n, 0 for even n;
+- "cramer_wheel"  wheel mod 2*3*5: m = 30/8 for n coprime to 30, else 0;
+- "granville"     Granville's model: n coprime to every prime q <= A(n),
+                  A(n) = (log n)^GRANVILLE_EXPONENT, with
+                  m = prod_{q <= A(n)} (1 - 1/q)^-1, else 0;
+- "cramer_local"  m = 1, with c calibrated per block of LOCAL_BLOCK rows
+                  (expected events = real primes in every block).
+The primes of the fixed wheels (2; 2, 3, 5) are events with probability
+1, so the variants do not lose them; c_v of the global variants matches
+the expected number of events to the real prime count.
+
+variant_constants gets every c_v (and the local block constants) from
+one chunked pass over n; variant_rows draws all variants from a second
+one, where chunk k takes one uniform stream U_n from the k-th child of
+SeedSequence(seed) and n is an event of variant v iff U_n < p_v(n). The
+variants are therefore coupled (common random numbers: differences
+between them are not blurred by independent draws), and "cramer" is the
+same realization as null_ensemble.null_rows with the same seed (E2).
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from embedding import CHUNK, Embedding
+from primality import base_primes
+
+VARIANTS = ("cramer", "cramer_odd", "cramer_wheel", "granville", "cramer_local")
+LOCAL_BLOCK = 50_000        # rows per calibration block of "cramer_local" (E1 block size)
+GRANVILLE_EXPONENT = 1.0    # A(n) = (log n)^e; Granville takes A up to (log n)^(1 - eps)
+WHEELS = {"cramer_odd": (2,), "cramer_wheel": (2, 3, 5)}
+
+def _check(variants) -> list:
+    variants = list(variants)
+    unknown = [v for v in variants if v not in VARIANTS]
+    if unknown:
+        raise ValueError(f"unknown null variants {unknown}; known: {list(VARIANTS)}")
+    return variants
+
+def multiplier(variant: str, n: np.ndarray, logn: np.ndarray) -> np.ndarray | float:
+    """m_v(n) (a scalar 1.0 for the plain Cramér law)."""
+    if variant in ("cramer", "cramer_local"):
+        return 1.0
+    if variant in WHEELS:
+        primes = WHEELS[variant]
+        coprime = np.ones(len(n), dtype=bool)
+        for q in primes:
+            coprime &= n % q != 0
+        return coprime / np.prod([1.0 - 1.0 / q for q in primes])
+    if variant == "granville":
+        A = logn ** GRANVILLE_EXPONENT
+        m = np.ones(len(n))
+        for q in base_primes(int(A.max(initial=0.0))):
+            sieved = q <= A
+            m[sieved] *= np.where(n[sieved] % q == 0, 0.0, 1.0 / (1.0 - 1.0 / q))
+        return m
+    raise ValueError(f"unknown null variant {variant!r}")
+
+def certain(variant: str, n: np.ndarray) -> np.ndarray | None:
+    """Rows of the chunk that are events with probability 1 (the wheel primes), or None."""
+    if variant not in WHEELS:
+        return None
+    return np.flatnonzero(np.isin(n, WHEELS[variant]))
+
+def variant_constants(emb: Embedding, rows: int, variants=VARIANTS, n_events: int | None = None,
+                      block: int = LOCAL_BLOCK) -> dict:
+    """
+    {variant: c} over the first `rows` rows, from one chunked pass: c_v
+    such that the expected number of events is n_events (default: the
+    real primes among those rows); for "cramer_local" an array with one c
+    per block of `block` rows, matching the real primes of each block.
+    """
+    variants = _check(variants)
+    rows = int(rows)
+    w_sum = dict.fromkeys(variants, 0.0)
+    n_certain = dict.fromkeys(variants, 0)
+    n_blocks = -(-rows // block)
+    local_w, local_p = np.zeros(n_blocks), np.zeros(n_blocks)
+    n_primes = 0
+    for lo in range(0, rows, CHUNK):
+        sl = slice(lo, min(lo + CHUNK, rows))
+        n = emb.n(sl)
+        logn = np.log(n.astype(float))
+        primes = emb.is_prime(sl)
+        n_primes += int(np.count_nonzero(primes))
+        for v in variants:
+            w = multiplier(v, n, logn) / logn
+            sure = certain(v, n)
+            if sure is not None and len(sure):
+                w[sure] = 0.0
+                n_certain[v] += len(sure)
+            w_sum[v] += w.sum()
+        if "cramer_local" in variants:
+            blocks = (np.arange(sl.start, sl.stop) // block).astype(np.int64)
+            local_w += np.bincount(blocks, weights=1.0 / logn, minlength=n_blocks)
+            local_p += np.bincount(blocks, weights=primes, minlength=n_blocks)
+    n_events = n_primes if n_events is None else int(n_events)
+    out = {v: (n_events - n_certain[v]) / w_sum[v] for v in variants if v != "cramer_local"}
+    if "cramer_local" in variants:
+        out["cramer_local"] = local_p / np.where(local_w > 0, local_w, 1.0)
+    return out
+
+def variant_rows(emb: Embedding, rows: int, constants: dict, seed, workers: int = 1,
+                 block: int = LOCAL_BLOCK) -> dict:
+    """
+    {variant: sorted event rows (< rows)} for every variant of `constants`
+    (variant_constants), all drawn from one uniform per row: chunk k of
+    CHUNK rows uses the k-th spawned child of `seed` (an int or a
+    SeedSequence), so the result does not depend on `workers` threads.
+    """
+    variants = _check(constants)
+    seq = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    starts = range(0, int(rows), CHUNK)
+    children = seq.spawn(len(starts))
+
+    def draw(k):
+        lo = starts[k]
+        sl = slice(lo, min(lo + CHUNK, int(rows)))
+        n = emb.n(sl)
+        logn = np.log(n.astype(float))
+        u = np.random.default_rng(children[k]).random(len(n))
+        out = {}
+        for v in variants:
+            c = constants[v]
+            if np.ndim(c):
+                c = c[np.arange(sl.start, sl.stop) // block]
+            p = np.clip(c * multiplier(v, n, logn) / logn, 0.0, 1.0)
+            sure = certain(v, n)
+            if sure is not None:
+                p[sure] = 1.0
+            out[v] = np.flatnonzero(u < p) + lo
+        return out
+
+    workers = (os.cpu_count() or 1) if workers == -1 else max(1, workers)
+    if workers == 1 or len(starts) <= 1:
+        parts = [draw(k) for k in range(len(starts))]
+    else:
+        with ThreadPoolExecutor(min(workers, len(starts))) as ex:
+            parts = list(ex.map(draw, range(len(starts))))
+    return {v: np.concatenate([part[v] for part in parts]) if parts else np.zeros(0, dtype=np.int64)
+            for v in variants}
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+"""
+Ripley's K / L and pair correlation g(r) of an event set (dual tree)
+--------------------------------------------------------------------
+All-pairs statistics at many distances from one dual-tree pass:
+KDTree.count_neighbors with the array of bin edges 0 < r_1 < ... < r_K
+and cumulative=False returns the number of ordered pairs whose distance
+falls in each annulus (r_{k-1}, r_k], without visiting the pairs one by
+one (node pairs entirely inside or outside a bin are counted at once).
+The events are split into blocks, each block's tree counted against the
+full tree, so the pass runs on several threads. The cost grows with the
+number of radii and faster than n: about 50 s per 1e5 events and core
+for 100 radii up to 20.
+
+For millions of events pair_counts_grid is the approximate path: the
+events are put on the nearest node of a grid of step h, and the FFT
+autocorrelation of the grid gives the number of pairs at every node
+offset, binned by the length of the offset. Each pair's distance moves
+by at most 2 delta = h sqrt(2), so only pairs that close to an annulus
+edge can change annulus. The cost is two FFTs of a (4 log N / h)^2 grid,
+whatever n and the number of radii.
+
+Estimators, for n events in the disk window of radius W (|e| <= log N),
+area A = pi W^2:
+
+  K(r) = A / (n (n-1)) * sum_{i != j, d_ij <= r} A / gamma(d_ij),
+  L(r) = sqrt(K(r) / pi),
+  g    = (K(r_k) - K(r_{k-1})) / (pi (r_k^2 - r_{k-1}^2))  on each annulus,
+
+with the translation edge correction of the disk: gamma(d), the area of
+the window intersected with its translate by d, depends only on d,
+
+  gamma(d) = 2 W^2 acos(d / 2W) - (d / 2) sqrt(4 W^2 - d^2),
+
+so it is applied per annulus (at its mid distance) to the binned counts.
+Radii must stay below 2W.
+
+Embedded points are far from uniform in the window (they follow r = log n),
+so K and g are not compared with the CSR values pi r^2 and 1 but between
+the real events and a null on the same points: the window, the correction
+and the point layout are the same for both.
+
+event_pair_counts counts both datasets' events, cached (cache.py) by
+their content, the labels, the radii and the method.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from scipy import fft
+from scipy.spatial import KDTree
+from cache import ArrayCache
+from embedding import open_embedding
+from instrument import stage
+from sampled import dataset_events, events_fingerprint
+
+WORKERS = -1           # threads: -1 = all cores
+BLOCK = 1 << 16        # events per query tree of the parallel pass
+PAIR_GRID_STEP = 0.02  # grid step h of pair_counts_grid, in embedding units
+
+def disk_overlap(d, W: float) -> np.ndarray:
+    """Area of the disk of radius W intersected with its translate by d (0 beyond 2W)."""
+    d = np.clip(np.asarray(d, dtype=float), 0.0, 2.0 * W)
+    return 2.0 * W * W * np.arccos(d / (2.0 * W)) - 0.5 * d * np.sqrt(4.0 * W * W - d * d)
+
+def _check_radii(radii) -> np.ndarray:
+    radii = np.asarray(radii, dtype=float).ravel()
+    if len(radii) and (radii[0] <= 0 or np.any(np.diff(radii) <= 0)):
+        raise ValueError("radii must be positive and increasing")
+    return radii
+
+def pair_counts(events: np.ndarray, radii, workers: int = WORKERS, leafsize: int = 16) -> np.ndarray:
+    """
+    Ordered pairs (i != j) of events per annulus (r_{k-1}, r_k], r_0 = 0,
+    for increasing radii r_1..r_K (int64, one value per radius).
+    """
+    events = np.asarray(events, dtype=float).reshape(-1, 2)
+    radii = _check_radii(radii)
+    edges = np.concatenate([[0.0], radii])
+    tree = KDTree(events, leafsize=leafsize)
+
+    def count(lo):
+        block = KDTree(events[lo:lo + BLOCK], leafsize=leafsize)
+        return np.asarray(block.count_neighbors(tree, edges, cumulative=False), dtype=np.int64)
+
+    starts = range(0, len(events), BLOCK)
+    workers = (os.cpu_count() or 1) if workers == -1 else max(1, workers)
+    if workers == 1 or len(starts) <= 1:
+        bins = sum((count(lo) for lo in starts), np.zeros(len(edges), dtype=np.int64))
+    else:
+        with ThreadPoolExecutor(min(workers, len(starts))) as ex:
+            bins = sum(ex.map(count, starts), np.zeros(len(edges), dtype=np.int64))
+    out = bins[1:].copy()
+    if len(out):
+        out[0] += bins[0] - len(events)  # coincident events (d = 0) minus the self-pairs
+    return out
+
+def pair_counts_grid(events: np.ndarray, radii, step: float = PAIR_GRID_STEP,
+                     workers: int = WORKERS) -> np.ndarray:
+    """
+    Approximation of pair_counts from the FFT autocorrelation of the events
+    on a grid of step `step` (pair distances off by at most step*sqrt(2)).
+    """
+    events = np.asarray(events, dtype=float).reshape(-1, 2)
+    radii = _check_radii(radii)
+    if len(events) == 0:
+        return np.zeros(len(radii), dtype=np.int64)
+    lo = events.min(axis=0)
+    ij = np.rint((events - lo) / step).astype(np.int64)
+    span = int(ij.max(initial=0)) + 1
+    size = fft.next_fast_len(2 * span, real=True)  # no wrap-around of any offset
+    grid = np.zeros((size, size))
+    np.add.at(grid, (ij[:, 0], ij[:, 1]), 1.0)
+    spec = fft.rfft2(grid, workers=workers)
+    ac = fft.irfft2(spec * spec.conj(), s=(size, size), workers=workers)
+    off = (np.arange(size) + size // 2) % size - size // 2
+    keep = np.flatnonzero(np.abs(off) * step <= (radii[-1] if len(radii) else 0.0))
+    ac = ac[np.ix_(keep, keep)]
+    dist = np.hypot(off[keep, None], off[None, keep]) * step
+    near = dist <= (radii[-1] if len(radii) else 0.0)
+    # annulus k for r_{k-1} < d <= r_k; offset 0 (same node) goes to the first
+    which = np.searchsorted(radii, dist[near], side="left")
+    out = np.rint(np.bincount(which, weights=ac[near], minlength=len(radii))).astype(np.int64)
+    out[0] -= len(events)  # self-pairs
+    return out
+
+def ripley(pairs, radii, n: int, window_radius: float) -> dict:
+    """
+    {"K", "L", "g"} per radius from pair_counts output, with the
+    translation edge correction of a disk window of radius window_radius.
+    """
+    radii = np.asarray(radii, dtype=float).ravel()
+    W = float(window_radius)
+    if len(radii) and radii[-1] >= 2 * W:
+        raise ValueError(f"radii must stay below the window diameter {2 * W:g}")
+    area = np.pi * W * W
+    lo = np.concatenate([[0.0], radii[:-1]])
+    weight = area / disk_overlap(0.5 * (lo + radii), W)
+    scale = area / (n * (n - 1)) if n > 1 else np.nan
+    K = np.cumsum(np.asarray(pairs, dtype=float) * weight) * scale
+    g = np.diff(np.concatenate([[0.0], K])) / (np.pi * (radii ** 2 - lo ** 2))
+    return {"K": K, "L": np.sqrt(K / np.pi), "g": g}
+
+def event_pair_counts(real_path: str, null_path: str, radii, real_label: str = "is_prime",
+                      null_label: str = "is_prime_null", method: str = "exact",
+                      step: float = PAIR_GRID_STEP, workers: int = -1,
+                      cache: ArrayCache | None = None) -> dict:
+    """
+    Ordered pairs of real and null events per annulus of the increasing
+    `radii`: {"pairs_real", "pairs_null", "n_real", "n_null"}, cached by
+    dataset content, labels, radii and method ("exact": dual-tree
+    pair_counts; "grid": FFT pair_counts_grid with grid step `step`).
+    """
+    if method not in ("exact", "grid"):
+        raise ValueError(f"method must be 'exact' or 'grid', got {method!r}")
+    radii = [float(r) for r in np.atleast_1d(radii)]
+    cache = ArrayCache() if cache is None else cache
+    emb = open_embedding(real_path)
+    params = {"kind": "pair_counts", "real": events_fingerprint(emb, real_path, real_label),
+              "real_label": real_label, "null": events_fingerprint(emb, null_path, null_label),
+              "null_label": null_label, "radii": radii, "method": method}
+    if method == "grid":
+        params["step"] = float(step)
+
+    def compute():
+        out = {}
+        for which, path, label in (("real", real_path, real_label), ("null", null_path, null_label)):
+            with stage(f"load_events:{which}") as st:
+                events = dataset_events(emb, path, label)
+                st.items = len(events)
+            with stage(f"pairs:{which}", items=len(events) * len(radii)):
+                out[f"pairs_{which}"] = (pair_counts(events, radii, workers=workers) if method == "exact"
+                                         else pair_counts_grid(events, radii, step, workers=workers))
+            out[f"n_{which}"] = np.int64(len(events))
+        return out
+
+    return cache.get_or_compute(params, compute)
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+"""
+Pipeline runner (E1 -> E2 -> E3 -> E4)
+--------------------------------------
+Runs the experiment scripts as a DAG of stages. Each stage declares the
+parameters it overrides and the paths it reads and writes; a stage
+depends on every stage that writes one of its inputs.
+
+A stage is up to date when its key, a hash of
+- the source of its script and of the local modules it imports,
+- its parameters,
+- the size and mtime of its input files,
+equals the key recorded after its last successful run and its outputs
+are still the files that run wrote. Up-to-date stages are skipped, so
+changing R reruns E3/E4 but not E1 or E2. Stages whose dependencies are
+done run concurrently (e.g. the R sweep and the N sweep).
+
+Parameters reach the scripts as overrides of their CONFIG constants
+(PIPELINE_PARAMS, read by `config.apply_overrides`); E1 gets command-line options.
+
+  python scripts/pipeline.py                          # every stale stage
+  python scripts/pipeline.py E4_radius_plot           # a target and its inputs
+  python scripts/pipeline.py --set RADIUS=5           # every stage with RADIUS
+  python scripts/pipeline.py --set E1.N=2000000 --dry-run
+  python scripts/pipeline.py --force E3 --list
+
+State and per-stage logs live in data/.pipeline/.
+"""
+
+import argparse
+import ast
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from config import ENV
+
+SCRIPTS = os.path.dirname(os.path.abspath(__file__))
+STATE_DIR = "./data/.pipeline"
+JOBS = 2  # stages run at once (each stage already uses all cores for its density counts)
+
+REAL_DATA = "./data/E1_base_log_espiral_1M.cols"
+NULL_DATA = "./data/null_on_real_embedding.cols"
+RADIUS_CSV = "./data/radius_sweep_real_embedding.csv"
+N_CSV = "./results/ks_vs_N_same_geometry.csv"
+
+# ---------------- stages ----------------
+class Stage:
+    """
+    One script run. `inputs` / `outputs` name parameters holding paths;
+    `cli` stages get their parameters as --name value options.
+    """
+
+    def __init__(self, name: str, script: str, params: dict | None = None,
+                 inputs=(), outputs=(), cli: bool = False):
+        self.name, self.script, self.cli = name, script, cli
+        self.params = dict(params or {})
+        self.inputs, self.outputs = tuple(inputs), tuple(outputs)
+
+    @property
+    def path(self) -> str:
+        return os.path.join(SCRIPTS, self.script)
+
+    def settable(self) -> set:
+        """Names a stage accepts: top-level UPPERCASE constants, or --options for cli stages."""
+        tree = ast.parse(open(self.path).read())
+        if self.cli:
+            return {a.value.lstrip("-") for node in ast.walk(tree) if isinstance(node, ast.Call)
+                    and getattr(node.func, "attr", None) == "add_argument"
+                    for a in node.args[:1] if isinstance(a, ast.Constant)}
+        return {t.id for node in tree.body if isinstance(node, ast.Assign)
+                for t in node.targets if isinstance(t, ast.Name) and t.id.isupper()}
+
+    def paths(self, names) -> list:
+        return [os.path.normpath(self.params[k]) for k in names]
+
+    def command(self) -> tuple[list, dict]:
+        env = dict(os.environ, MPLBACKEND="Agg")
+        env.pop(ENV, None)
+        cmd = [sys.executable, self.path]
+        if self.cli:
+            for k, v in self.params.items():
+                if v is True:
+                    cmd.append(f"--{k}")
+                elif isinstance(v, list):
+                    cmd += [f"--{k}", *map(str, v)]
+                elif v is not False and v is not None:
+                    cmd += [f"--{k}", str(v)]
+        else:
+            env[ENV] = json.dumps(self.params)
+        return cmd, env
+
+STAGES = [
+    Stage("E1", "E1_generate_log_spiral_dataset_min.py", cli=True, outputs=["out_cols"],
+          params={"N": 1_000_000, "b": 0.1, "radius_mode": "adaptive", "z_factor": 0.1,
+                  "block_size": 50_000, "percentile": 95, "out_cols": REAL_DATA}),
+    Stage("E2", "generate_null_on_real_embedding.py", inputs=["REAL_DATA"], outputs=["OUT_PATH"],
+          params={"REAL_DATA": REAL_DATA, "OUT_PATH": NULL_DATA}),
+    Stage("E3", "compare_density_on_sampled_points_realembed.py", inputs=["REAL_DATA", "NULL_DATA"],
+          params={"REAL_DATA": REAL_DATA, "NULL_DATA": NULL_DATA}),
+    Stage("E3_cdf", "plot_cdf_real_vs_null.py", inputs=["REAL_DATA", "NULL_DATA"], outputs=["OUT_FIG"],
+          params={"REAL_DATA": REAL_DATA, "NULL_DATA": NULL_DATA,
+                  "OUT_FIG": "./figures/fig_cdf_real_vs_null_R10.png"}),
+    Stage("E3_cdf_zoom", "plot_cdf_real_vs_null_with_KS_and_zoom.py", inputs=["REAL_DATA", "NULL_DATA"],
+          outputs=["OUT_FIG"],
+          params={"REAL_DATA": REAL_DATA, "NULL_DATA": NULL_DATA,
+                  "OUT_FIG": "./figures/fig_cdf_real_vs_null_R10_KS_zoom.png"}),
+    Stage("E4_radius", "sweep_radius_density_real_embedding.py", inputs=["REAL_DATA", "NULL_DATA"],
+          outputs=["OUT_CSV"], params={"REAL_DATA": REAL_DATA, "NULL_DATA": NULL_DATA, "OUT_CSV": RADIUS_CSV}),
+    Stage("E4_radius_plot", "plot_ks_vs_radius_real_embedding.py", inputs=["INPUT_CSV"], outputs=["OUT_FIG"],
+          params={"INPUT_CSV": RADIUS_CSV, "OUT_FIG": "./figures/fig_ks_vs_radius_real_embedding.png"}),
+    Stage("pairs", "pair_correlation_real_embedding.py", inputs=["REAL_DATA", "NULL_DATA"],
+          outputs=["OUT_CSV"], params={"REAL_DATA": REAL_DATA, "NULL_DATA": NULL_DATA,
+                                       "OUT_CSV": "./data/pair_correlation_real_embedding.csv"}),
+    Stage("null_variants", "compare_null_variants_real_embedding.py", inputs=["REAL_DATA"],
+          outputs=["OUT_CSV"], params={"REAL_DATA": REAL_DATA,
+                                       "OUT_CSV": "./data/null_variants_real_embedding.csv"}),
+    Stage("E4_N", "sweep_ks_vs_N_same_geometry.py", outputs=["OUTCSV"], params={"OUTCSV": N_CSV}),
+    Stage("E4_N_plot", "plot_ks_vs_N_same_geometry.py", inputs=["INCSV"], outputs=["OUTFIG"],
+          params={"INCSV": N_CSV, "OUTFIG": "./figures/fig_ks_vs_N_same_geometry.png"}),
+]
+
+def dependencies(stages) -> dict:
+    """{stage name: names of the stages writing its inputs}."""
+    writer = {p: s.name for s in stages for p in s.paths(s.outputs)}
+    return {s.name: sorted({writer[p] for p in s.paths(s.inputs) if p in writer} - {s.name})
+            for s in stages}
+
+# ---------------- fingerprints ----------------
+def _local_modules(path: str, seen: set) -> None:
+    if path in seen or not os.path.isfile(path):
+        return
+    seen.add(path)
+    for node in ast.walk(ast.parse(open(path).read())):
+        names = ([a.name for a in node.names] if isinstance(node, ast.Import)
+                 else [node.module] if isinstance(node, ast.ImportFrom) and node.module else [])
+        for name in names:
+            _local_modules(os.path.join(SCRIPTS, name.split(".")[0] + ".py"), seen)
+
+def code_hash(script_path: str) -> str:
+    """Hash of a script and of the modules of this directory it imports (transitively)."""
+    seen = set()
+    _local_modules(script_path, seen)
+    h = hashlib.sha256()
+    for p in sorted(seen):
+        h.update(os.path.basename(p).encode())
+        with open(p, "rb") as f:
+            h.update(f.read())
+    return h.hexdigest()
+
+def file_fingerprint(path: str):
+    """[(relative path, size, mtime_ns)] of a file or of every file under a directory."""
+    if os.path.isfile(path):
+        st = os.stat(path)
+        return [[".", st.st_size, st.st_mtime_ns]]
+    out = []
+    for dirpath, _, files in os.walk(path):
+        for name in files:
+            p = os.path.join(dirpath, name)
+            st = os.stat(p)
+            out.append([os.path.relpath(p, path), st.st_size, st.st_mtime_ns])
+    return sorted(out) if out else None
+
+def stage_key(stage: Stage) -> str:
+    inputs = {p: file_fingerprint(p) for p in stage.paths(stage.inputs)}
+    blob = json.dumps({"code": code_hash(stage.path), "params": stage.params, "inputs": inputs},
+                      sort_keys=True)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+def outputs_fingerprint(stage: Stage) -> dict:
+    return {p: file_fingerprint(p) for p in stage.paths(stage.outputs)}
+
+def load_state() -> dict:
+    try:
+        with open(os.path.join(STATE_DIR, "state.json")) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_state(state: dict) -> None:
+    os.makedirs(STATE_DIR, exist_ok=True)
+    path = os.path.join(STATE_DIR, "state.json")
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+def up_to_date(stage: Stage, state: dict) -> bool:
+    rec = state.get(stage.name)
+    return (rec is not None and rec["key"] == stage_key(stage)
+            and rec["outputs"] == outputs_fingerprint(stage)
+            and all(v is not None for v in rec["outputs"].values()))
+
+# ---------------- runner ----------------
+def _run(stage: Stage) -> tuple[int, float]:
+    os.makedirs(os.path.join(STATE_DIR, "logs"), exist_ok=True)
+    cmd, env = stage.command()
+    t0 = time.perf_counter()
+    with open(os.path.join(STATE_DIR, "logs", f"{stage.name}.log"), "w") as log:
+        rc = subprocess.run(cmd, env=env, stdout=log, stderr=subprocess.STDOUT).returncode
+    return rc, time.perf_counter() - t0
+
+def run(stages, targets=None, force=(), jobs: int = JOBS, dry_run: bool = False) -> bool:
+    """Run the stale stages needed for `targets` (all if None). Returns True on success."""
+    by_name = {s.name: s for s in stages}
+    deps = dependencies(stages)
+    wanted, todo = set(), list(targets or by_name)
+    while todo:  # targets and everything upstream of them
+        name = todo.pop()
+        if name not in by_name:
+            raise KeyError(f"unknown stage {name!r}")
+        if name not in wanted:
+            wanted.add(name)
+            todo += deps[name]
+    order = [s.name for s in stages if s.name in wanted]
+    state = load_state()
+    done, ran, failed, running = set(), set(), set(), {}
+    with ThreadPoolExecutor(max(1, jobs)) as ex:
+        while len(done) + len(failed) + len(running) < len(order) or running:
+            for name in order:
+                if name in done or name in failed or name in running.values():
+                    continue
+                if any(d in failed for d in deps[name]):
+                    failed.add(name)
+                    print(f"[skip] {name}: upstream failed")
+                    continue
+                if not all(d in done for d in deps[name]):
+                    continue
+                stage = by_name[name]
+                stale_up = any(d in ran for d in deps[name])
+                if name not in force and not (dry_run and stale_up) and up_to_date(stage, state):
+                    done.add(name)
+                    print(f"[ok]   {name}: up to date")
+                    continue
+                if dry_run:
+                    done.add(name)
+                    ran.add(name)
+                    print(f"[run]  {name}: {' '.join(stage.command()[0][1:])}")
+                    continue
+                print(f"[run]  {name}")
+                running[ex.submit(_run, stage)] = name
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                name = running.pop(fut)
+                rc, seconds = fut.result()
+                if rc != 0:
+                    failed.add(name)
+                    print(f"[fail] {name} (exit {rc}), see {STATE_DIR}/logs/{name}.log")
+                    continue
+                stage = by_name[name]
+                state[name] = {"key": stage_key(stage), "outputs": outputs_fingerprint(stage),
+                               "params": stage.params, "seconds": round(seconds, 3),
+                               "finished": time.strftime("%Y-%m-%d %H:%M:%S")}
+                save_state(state)
+                done.add(name)
+                ran.add(name)
+                print(f"[done] {name} ({seconds:.1f} s)")
+    return not failed
+
+def _value(text: str):
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        return text
+
+def apply_settings(stages, settings) -> None:
+    """--set NAME=value (every stage accepting NAME) or STAGE.NAME=value."""
+    by_name = {s.name: s for s in stages}
+    for item in settings:
+        key, _, value = item.partition("=")
+        if not _:
+            raise SystemExit(f"--set expects NAME=value, got {item!r}")
+        stage_name, _, param = key.rpartition(".")
+        targets = [by_name[stage_name]] if stage_name else stages
+        hit = [s for s in targets if param in s.settable()]
+        if not hit:
+            raise SystemExit(f"no stage accepts parameter {key!r}")
+        for s in hit:
+            s.params[param] = _value(value)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    ap.add_argument("targets", nargs="*", help="stages to bring up to date (default: all)")
+    ap.add_argument("--set", action="append", default=[], metavar="[STAGE.]NAME=VALUE",
+                    help="parameter override (JSON value, or a plain string)")
+    ap.add_argument("--force", action="append", default=[], metavar="STAGE",
+                    help="rerun a stage even if up to date")
+    ap.add_argument("--jobs", type=int, default=JOBS, help="stages run concurrently")
+    ap.add_argument("--dry-run", action="store_true", help="show what would run")
+    ap.add_argument("--list", action="store_true", help="list stages and dependencies")
+    args = ap.parse_args()
+
+    apply_settings(STAGES, args.set)
+    if args.list:
+        deps = dependencies(STAGES)
+        for s in STAGES:
+            print(f"{s.name:<15} {s.script:<50} <- {', '.join(deps[s.name]) or '-'}")
+        return
+    ok = run(STAGES, args.targets or None, set(args.force), args.jobs, args.dry_run)
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
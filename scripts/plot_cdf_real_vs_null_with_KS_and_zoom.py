@@ -9,71 +9,51 @@ Plots:
 """
 
 import os
-import numpy as np
-import pandas as pd
 import matplotlib.pyplot as plt
-from scipy.spatial import KDTree
-from scipy.stats import ks_2samp
+from config import apply_overrides
+from count_stats import count_histogram, ecdf_hist, ks_hist, ks_location
+from instrument import save_profile, stage
+from sampled import sampled_densities
 from mpl_toolkits.axes_grid1.inset_locator import inset_axes
 
 # -----------------------------
 # CONFIG
 # -----------------------------
-REAL_DATA = "./data/E1_base_log_espiral_1M.csv"
-REAL_LABEL = "is_prime"
-NULL_DATA = "./data/null_on_real_embedding.csv"
+REAL_DATA = "./data/E1_base_log_espiral_1M.cols"
+NULL_DATA = "./data/null_on_real_embedding.cols"
 
 SAMPLE_SIZE = 50_000
 RADIUS = 10.0
 SEED = 42
+WORKERS = -1  # density queries: -1 = all cores
+INDEX = "spiral"  # "spiral" (log-spiral band index) or "kdtree"
 OUT_FIG = "./figures/fig_cdf_real_vs_null_R10_KS_zoom.png"
+apply_overrides(globals())  # CONFIG values passed by pipeline.py, if any
 os.makedirs(os.path.dirname(OUT_FIG), exist_ok=True)
 
-np.random.seed(SEED)
-
 # -----------------------------
-# LOAD DATA
+# LOCAL DENSITIES
 # -----------------------------
-df_real = pd.read_csv(REAL_DATA)
-df_null = pd.read_csv(NULL_DATA)
-
-idx = np.random.choice(len(df_real), size=SAMPLE_SIZE, replace=False)
-sample_points = df_real.loc[idx, ["x", "y"]].values
-
-coords_real = df_real[df_real[REAL_LABEL] == 1][["x", "y"]].values
-coords_null = df_null[df_null["is_prime_null"] == 1][["x", "y"]].values
-
-tree_real = KDTree(coords_real)
-tree_null = KDTree(coords_null)
-
-def density(points, tree, r):
-    return np.array([len(tree.query_ball_point(pt, r=r)) for pt in points])
-
-rho_real = density(sample_points, tree_real, RADIUS)
-rho_null = density(sample_points, tree_null, RADIUS)
+# same sampled points and counts as E3 (cached: a replot skips the counting)
+rho_real, rho_null = sampled_densities(REAL_DATA, NULL_DATA, RADIUS, SAMPLE_SIZE, SEED,
+                                       kind=INDEX, workers=WORKERS)
+rho_real, rho_null = rho_real[:, 0], rho_null[:, 0]
 
 # -----------------------------
 # ECDF
 # -----------------------------
-def ecdf(x):
-    xs = np.sort(x)
-    ys = np.arange(1, len(xs) + 1) / len(xs)
-    return xs, ys
-
-x_r, y_r = ecdf(rho_real)
-x_n, y_n = ecdf(rho_null)
+with stage("ecdf", items=len(rho_real)):
+    h_real, h_null = count_histogram(rho_real), count_histogram(rho_null)
+    x_r, y_r = ecdf_hist(h_real)
+    x_n, y_n = ecdf_hist(h_null)
 
 # -----------------------------
 # KS LOCATION
 # -----------------------------
-cdf_r_interp = np.interp(x_r, x_n, y_n)
-diff = np.abs(y_r - cdf_r_interp)
-ks_idx = np.argmax(diff)
-
-x_ks = x_r[ks_idx]
-y_r_ks = y_r[ks_idx]
-y_n_ks = cdf_r_interp[ks_idx]
-ks_value = diff[ks_idx]
+# exact: both CDFs at the value where the KS distance is attained
+with stage("ks"):
+    x_ks, y_r_ks, y_n_ks = ks_location(h_real, h_null)
+    ks_value, _ = ks_hist(h_real, h_null)
 
 # -----------------------------
 # MAIN PLOT
@@ -98,7 +78,7 @@ ax.text(
 
 ax.set_xlabel("Local density ρ")
 ax.set_ylabel("CDF")
-ax.set_title("CDF of local prime density (R = 10)")
+ax.set_title(f"CDF of local prime density (R = {RADIUS:g})")
 ax.legend()
 ax.grid(alpha=0.3)
 
@@ -128,8 +108,10 @@ axins.grid(alpha=0.2)
 # -----------------------------
 # SAVE
 # -----------------------------
-plt.tight_layout()
-plt.savefig(OUT_FIG, dpi=300)
+with stage("savefig"):
+    plt.tight_layout()
+    plt.savefig(OUT_FIG, dpi=300)
 plt.show()
+save_profile(OUT_FIG)  # per-stage timings next to the figure (GNM_PROFILE=1)
 
 print(f"✔ Figure with KS and zoom saved to {OUT_FIG}")
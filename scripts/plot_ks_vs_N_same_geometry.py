@@ -8,9 +8,12 @@ Reads results/ks_vs_N_same_geometry.csv and saves a figure.
 import os
 import pandas as pd
 import matplotlib.pyplot as plt
+from config import apply_overrides
+from instrument import save_profile, stage
 
 INCSV = "./results/ks_vs_N_same_geometry.csv"
 OUTFIG = "./figures/fig_ks_vs_N_same_geometry.png"
+apply_overrides(globals())  # CONFIG values passed by pipeline.py, if any
 
 os.makedirs(os.path.dirname(OUTFIG), exist_ok=True)
 
@@ -24,7 +27,9 @@ plt.ylabel("KS statistic")
 plt.title("KS divergence vs N (same-geometry Cramér null)")
 plt.grid(alpha=0.3)
 plt.tight_layout()
-plt.savefig(OUTFIG, dpi=300)
+with stage("savefig"):
+    plt.savefig(OUTFIG, dpi=300)
+save_profile(OUTFIG)  # per-stage timings next to the figure (GNM_PROFILE=1)
 plt.show()
 
 print("Saved figure:", OUTFIG)
@@ -8,6 +8,8 @@ import os
 import pandas as pd
 import matplotlib.pyplot as plt
 from pathlib import Path
+from config import apply_overrides
+from instrument import save_profile, stage
 
 # ===============================
 # Configurações
@@ -15,6 +17,7 @@ from pathlib import Path
 INPUT_CSV = "data/radius_sweep_real_embedding.csv"
 
 OUT_FIG = "./figures/fig_ks_vs_radius_real_embedding.png"
+apply_overrides(globals())  # CONFIG values passed by pipeline.py, if any
 os.makedirs(os.path.dirname(OUT_FIG), exist_ok=True)
 
 plt.rcParams.update({
@@ -46,7 +49,9 @@ plt.ylabel("Estatística KS")
 plt.title("KS em função da escala espacial")
 
 plt.tight_layout()
-plt.savefig(OUT_FIG, dpi=300)
+with stage("savefig"):
+    plt.savefig(OUT_FIG, dpi=300)
+save_profile(OUT_FIG)  # per-stage timings next to the figure (GNM_PROFILE=1)
 plt.close()
 
 print(f"✔ Figura salva em: {OUT_FIG}")
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Primality engine (segmented sieve)
+----------------------------------
+Vectorized, segmented sieve of Eratosthenes producing the `is_prime`
+column for a contiguous range of integers n = start..N.
+
+Only odd numbers are sieved, one segment at a time, so the working
+memory is bounded by `segment_size` (plus the base primes up to sqrt(N)).
+The labels are identical to per-integer trial division (`is_prime`).
+"""
+
+import math
+import numpy as np
+
+SEGMENT_SIZE = 1 << 24  # integers per segment (16.7M -> ~8 MB of odd flags)
+
+def is_prime(n: int) -> bool:
+    """Scalar trial division (reference implementation)."""
+    if n < 2: return False
+    if n % 2 == 0: return n == 2
+    r = int(math.isqrt(n))
+    f = 3
+    while f <= r:
+        if n % f == 0: return False
+        f += 2
+    return True
+
+def base_primes(limit: int) -> np.ndarray:
+    """All primes <= limit (plain sieve; limit is ~sqrt(N), so this is small)."""
+    if limit < 2:
+        return np.zeros(0, dtype=np.int64)
+    sieve = np.ones(limit + 1, dtype=bool)
+    sieve[:2] = False
+    sieve[4::2] = False
+    for p in range(3, math.isqrt(limit) + 1, 2):
+        if sieve[p]:
+            sieve[p * p::2 * p] = False
+    return np.flatnonzero(sieve).astype(np.int64)
+
+def sieve_segment(lo: int, hi: int, base: np.ndarray | None = None) -> np.ndarray:
+    """
+    Boolean primality flags for the integers lo..hi-1.
+    `base` must contain every prime <= sqrt(hi - 1); it is computed if omitted.
+    """
+    lo = max(int(lo), 0)
+    hi = int(hi)
+    out = np.zeros(max(hi - lo, 0), dtype=bool)
+    if hi <= 2 or hi <= lo:
+        return out
+    if base is None:
+        base = base_primes(math.isqrt(hi - 1))
+
+    # odd candidates m = o_lo + 2k, k = 0..len-1
+    o_lo = lo | 1
+    n_odd = (hi - o_lo + 1) // 2
+    odd = np.ones(max(n_odd, 0), dtype=bool)
+    if n_odd > 0:
+        if o_lo == 1:
+            odd[0] = False  # 1 is not prime
+        for p in base[base <= math.isqrt(hi - 1)]:
+            p = int(p)
+            if p == 2:
+                continue
+            first = max(p * p, -(-o_lo // p) * p)
+            if first % 2 == 0:
+                first += p
+            if first >= hi:
+                continue
+            odd[(first - o_lo) // 2::p] = False
+        out[o_lo - lo::2] = odd
+    if lo <= 2 < hi:
+        out[2 - lo] = True
+    return out
+
+def iter_prime_segments(start: int, stop: int, segment_size: int = SEGMENT_SIZE):
+    """
+    Yield (lo, flags) for consecutive segments covering start..stop (inclusive),
+    where flags[i] tells whether lo + i is prime. Memory stays O(segment_size).
+    """
+    base = base_primes(math.isqrt(max(int(stop), 0)))
+    lo = int(start)
+    while lo <= stop:
+        hi = min(lo + segment_size, int(stop) + 1)
+        yield lo, sieve_segment(lo, hi, base)
+        lo = hi
+
+def prime_mask(N: int, start: int = 2, segment_size: int = SEGMENT_SIZE) -> np.ndarray:
+    """`is_prime` column (int8, 0/1) for n = start..N, filled segment by segment."""
+    out = np.zeros(max(int(N) - int(start) + 1, 0), dtype=np.int8)
+    for lo, flags in iter_prime_segments(start, N, segment_size):
+        out[lo - start:lo - start + len(flags)] = flags
+    return out
+
+def prime_count(N: int, segment_size: int = SEGMENT_SIZE) -> int:
+    """pi(N), without materializing the full mask."""
+    return int(sum(int(flags.sum()) for _, flags in iter_prime_segments(2, N, segment_size)))
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Events of stored datasets and their densities around sampled centers
+--------------------------------------------------------------------
+E2 (generate_null_on_real_embedding.py) writes a null realization as the
+list of its event rows (write_event_rows); event_rows reads it back, or
+the 0/1 label column of older null datasets and of E1. dataset_events
+turns either into coordinates on the embedding, regenerating the E1
+primes from (N, b, start) instead of reading a column.
+
+sampled_densities counts the real primes and one stored null around the
+same sampled centers (embedding.sample_centers) for E3, E4 and the
+plots, cached (cache.py) by the datasets' event fingerprints
+(events_fingerprint), the labels, the radius and the sample. The other
+cached computations on stored datasets (grid_density, pair_stats,
+analytic_null) key their entries with the same helpers.
+
+This module does not depend on the Monte Carlo ensemble (null_ensemble.py),
+so the stages that only read stored datasets do not hash its code.
+"""
+
+import numpy as np
+from cache import ArrayCache, dataset_fingerprint
+from columnar import is_columnar, load_table, read_manifest, write_columns
+from density import build_index, count_in_disks_multi
+from embedding import CHUNK, open_embedding, sample_centers
+from instrument import stage
+from null_variants import variant_constants
+
+EVENT_ROWS = "rows"   # column of a null dataset written as an event list
+
+def write_event_rows(path: str, rows: np.ndarray, label: str, meta: dict) -> None:
+    """Null dataset as the list of its event rows (int32 when they fit)."""
+    rows = np.asarray(rows)
+    dtype = np.int32 if len(rows) == 0 or rows.max() <= np.iinfo(np.int32).max else np.int64
+    write_columns(path, {EVENT_ROWS: rows.astype(dtype)}, meta=dict(meta, events=label, chunk=CHUNK))
+
+def event_columns(path: str, label: str) -> list:
+    """Columns holding the `label` events of a dataset (event list or 0/1 column)."""
+    if not is_columnar(path):
+        return [label]
+    return [EVENT_ROWS] if read_manifest(path).get("meta", {}).get("events") == label else [label]
+
+def event_rows(path: str, label: str) -> np.ndarray:
+    """Row indices of the `label` events of a columnar dataset or CSV."""
+    col = event_columns(path, label)[0]
+    values = np.asarray(load_table(path, [col])[col])
+    return values.astype(np.int64) if col == EVENT_ROWS else np.flatnonzero(values == 1)
+
+def _regenerated(path: str, label: str, emb) -> bool:
+    """The embedding's own primes: rebuilt from (N, b, start), no column read."""
+    return label == "is_prime" and read_manifest(path).get("meta", {}).get("N") == emb.N
+
+def dataset_events(emb, path: str, label: str) -> np.ndarray:
+    """Coordinates of the `label` events of a dataset on the embedding `emb`."""
+    if _regenerated(path, label, emb):
+        return emb.coords(emb.prime_rows())
+    return emb.coords(event_rows(path, label))
+
+def events_fingerprint(emb, path: str, label: str) -> str:
+    """Cache fingerprint of the `label` events of a dataset (the manifest alone for regenerated primes)."""
+    return dataset_fingerprint(path, [] if _regenerated(path, label, emb) else event_columns(path, label))
+
+def null_constant(emb, null_path: str) -> float:
+    """c of the Cramér null p(n) = c/log n: from the null manifest, else calibrated to the primes (as E2)."""
+    meta = read_manifest(null_path).get("meta", {})
+    if meta.get("variant", "cramer") != "cramer":
+        raise ValueError(f"{null_path}: the exact null is for the Cramér law, not {meta['variant']!r}")
+    c = meta.get("c")
+    if c is None:
+        c = variant_constants(emb, emb.size, ["cramer"], emb.prime_count())["cramer"]
+    return float(c)
+
+def sampled_densities(real_path: str, null_path: str, radii, sample_size: int, seed: int,
+                      real_label: str = "is_prime", null_label: str = "is_prime_null",
+                      kind: str = "spiral", workers: int = -1,
+                      cache: ArrayCache | None = None) -> tuple[np.ndarray, np.ndarray]:
+    """
+    (centers x radii) counts of real and null events around `sample_size`
+    rows drawn without replacement with np.random.seed(seed) (the legacy
+    stream of the analysis scripts). One cache entry per radius, so a
+    sweep fills the entries a later single-radius run reads; only the
+    missing radii are computed.
+    """
+    radii = [float(r) for r in np.atleast_1d(radii)]
+    cache = ArrayCache() if cache is None else cache
+    emb = open_embedding(real_path)
+    with stage("cache_lookup", items=len(radii)):
+        base = {"kind": "sampled_density", "real": events_fingerprint(emb, real_path, real_label),
+                "real_label": real_label, "null": events_fingerprint(emb, null_path, null_label),
+                "null_label": null_label, "sample_seed": int(seed), "sample_size": int(sample_size)}
+        found = {r: cache.get({**base, "radius": r}) for r in radii}
+    missing = [r for r in radii if found[r] is None]
+    if missing:
+        with stage("sample", items=sample_size):
+            centers = sample_centers(emb, sample_size, seed)
+        rho = {}
+        for name, path, label in (("rho_real", real_path, real_label),
+                                  ("rho_null", null_path, null_label)):
+            which = name[4:]
+            with stage(f"load_events:{which}") as st:
+                events = dataset_events(emb, path, label)
+                st.items = len(events)
+            with stage(f"build_index:{which}", items=len(events)):
+                index = build_index(events, kind=kind)
+            with stage(f"query:{which}", items=len(centers) * len(missing)):
+                rho[name] = count_in_disks_multi(index, centers, missing, workers=workers)
+        for k, r in enumerate(missing):
+            found[r] = {name: m[:, k] for name, m in rho.items()}
+            cache.put({**base, "radius": r}, found[r])
+    if not radii:
+        return np.zeros((sample_size, 0), dtype=np.int64), np.zeros((sample_size, 0), dtype=np.int64)
+    return (np.column_stack([found[r]["rho_real"] for r in radii]),
+            np.column_stack([found[r]["rho_null"] for r in radii]))
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Mergeable quantile sketch
+-------------------------
+Fixed-bin histogram over a known value range [lo, hi]. Sketches filled on
+different segments (or workers) merge by adding their counts, so a global
+percentile needs O(bins) memory instead of the full column.
+
+The histogram alone locates the bin(s) holding the order statistics that
+np.percentile(..., q) interpolates between; a second pass collects only
+the values falling in those bins (`selects`) and `percentile` then returns
+exactly the value np.percentile would give on the full column.
+"""
+
+import numpy as np
+
+BINS = 1 << 16
+
+class HistogramSketch:
+    """Counts of values per bin of [lo, hi] (values outside are clamped to the end bins)."""
+
+    def __init__(self, lo: float, hi: float, bins: int = BINS):
+        self.lo, self.hi = float(lo), float(hi)
+        if not self.hi > self.lo:
+            self.hi = self.lo + 1.0
+        self.bins = int(bins)
+        self.counts = np.zeros(self.bins, dtype=np.int64)
+
+    @property
+    def n(self) -> int:
+        return int(self.counts.sum())
+
+    def bin_of(self, values) -> np.ndarray:
+        v = np.asarray(values, dtype=float)
+        j = np.floor((v - self.lo) * (self.bins / (self.hi - self.lo)))
+        return np.clip(j, 0, self.bins - 1).astype(np.int64)
+
+    def add(self, values) -> None:
+        self.counts += np.bincount(self.bin_of(values), minlength=self.bins)
+
+    def merge(self, other: "HistogramSketch") -> "HistogramSketch":
+        if (other.lo, other.hi, other.bins) != (self.lo, self.hi, self.bins):
+            raise ValueError("sketches have different bins")
+        self.counts += other.counts
+        return self
+
+    # ---------------- exact percentile (second pass) ----------------
+    def _ranks(self, q: float):
+        """Order statistics (0-based ranks) and weight used by np.percentile's linear method."""
+        n = self.n
+        virtual = (n - 1) * np.true_divide(q, 100)
+        i0 = int(np.floor(virtual))
+        return i0, min(i0 + 1, n - 1), virtual - i0
+
+    def target_bins(self, q: float) -> tuple[int, int]:
+        i0, i1, _ = self._ranks(q)
+        cum = np.cumsum(self.counts)
+        return int(np.searchsorted(cum, i0, "right")), int(np.searchsorted(cum, i1, "right"))
+
+    def selects(self, values, q: float) -> np.ndarray:
+        """Mask of the values a second pass must keep to compute percentile(q)."""
+        b0, b1 = self.target_bins(q)
+        j = self.bin_of(values)
+        return (j >= b0) & (j <= b1)
+
+    def percentile(self, q: float, selected) -> float:
+        """np.percentile(all values, q), from the values kept by `selects`."""
+        if self.n == 0:
+            raise ValueError("empty sketch")
+        i0, i1, gamma = self._ranks(q)
+        b0, _ = self.target_bins(q)
+        below = int(self.counts[:b0].sum())
+        v = np.sort(np.asarray(selected, dtype=float))
+        a, b = v[i0 - below], v[i1 - below]
+        diff = b - a
+        return float(b - diff * (1 - gamma)) if gamma >= 0.5 else float(a + diff * gamma)
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+"""
+Spiral-aware spatial index
+--------------------------
+Specialized disk-count index for events of the log-spiral embedding
+(r = log n, theta = b*n), which lie on dense, nested near-circular rings.
+
+Events are split into radial bands (equal event counts); inside each band
+they are sorted by angle and an angular prefix-count table (about one event
+per angular bin) gives the number of events in any run of whole bins with
+two lookups. For a disk of
+radius R around c = (rho, alpha) and a band with radii in [t0, t1]:
+- the band is fully inside, fully outside, or
+- whole bins with |phi - alpha| <= h_in are guaranteed inside -> O(1) count,
+  events with |phi - alpha| >  h_out are guaranteed outside -> skipped,
+  only the thin arcs h_in < |phi - alpha| <= h_out (rounded out to whole
+  bins) are checked exactly.
+h_in / h_out come from the law of cosines:
+  |e - c| <= R  <=>  cos(phi - alpha) >= (t^2 + rho^2 - R^2) / (2 t rho).
+
+With per-event group labels, bands are built inside each group and
+count_groups returns counts split by group from the same pass.
+
+With per-event weights (one or more columns), `sum` returns the total
+weight inside each disk: the prefix-count table then indexes a cumulative
+weight table in the same angular order, so guaranteed-inside arcs cost two
+lookups per weight column as well.
+
+Counts are identical to len(KDTree(events).query_ball_point(c, R));
+`verify` re-checks a sample of centers against scipy.spatial.KDTree.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import os
+import numpy as np
+from scipy.spatial import KDTree
+
+CHUNK = 1 << 18       # (center, band) pairs per vectorized batch
+CAND_CHUNK = 1 << 22  # boundary events checked per batch
+_TOL = 1e-9           # relative radius margin for the guaranteed in/out regions
+TWO_PI = 2.0 * np.pi
+
+class SpiralIndex:
+    """Polar band index over a 2D event set (count-only disk queries)."""
+
+    def __init__(self, events: np.ndarray, n_bands: int | None = None,
+                 groups: np.ndarray | None = None, n_groups: int | None = None,
+                 weights: np.ndarray | None = None):
+        """
+        groups: optional integer label (0..n_groups-1) per event. Bands are
+        then built inside each group, so count_groups can split every count
+        by label at no extra cost.
+        weights: optional (events,) or (events, k) weights, for `sum`.
+        """
+        events = np.asarray(events, dtype=float).reshape(-1, 2)
+        self.events = events
+        self.n = len(events)
+        rad = np.hypot(events[:, 0], events[:, 1])
+        ang = np.mod(np.arctan2(events[:, 1], events[:, 0]), TWO_PI)
+        self.extent = float(rad.max()) if self.n else 0.0
+        self._tree = None
+
+        if n_bands is None:  # balances per-band work against boundary-arc checks
+            n_bands = int(np.clip(np.sqrt(self.n) / 6, 16, 1024))
+        n_bands = max(1, min(int(n_bands), self.n))
+        by_rad = np.argsort(rad, kind="stable")
+        if groups is None:
+            self.n_groups = 1
+            parts = np.array_split(by_rad, n_bands) if self.n else []
+            self.band_group = np.zeros(len(parts), dtype=np.int64)
+        else:
+            groups = np.asarray(groups, dtype=np.int64).ravel()
+            self.n_groups = int(n_groups if n_groups is not None else groups.max(initial=-1) + 1)
+            g_sorted = groups[by_rad]
+            cuts = np.searchsorted(np.sort(g_sorted, kind="stable"), np.arange(self.n_groups + 1))
+            members = by_rad[np.argsort(g_sorted, kind="stable")]  # by group, then radius
+            parts, band_group = [], []
+            for g in range(self.n_groups):
+                p = members[cuts[g]:cuts[g + 1]]
+                if len(p) == 0:
+                    continue
+                k = max(1, round(n_bands * len(p) / self.n))
+                parts += np.array_split(p, min(k, len(p)))
+                band_group += [g] * min(k, len(p))
+            self.band_group = np.array(band_group, dtype=np.int64)
+        # one-hot (bands x groups): sums band counts into group counts
+        self._onehot = np.zeros((len(parts), self.n_groups), dtype=np.int64)
+        self._onehot[np.arange(len(parts)), self.band_group] = 1
+        parts = [p[np.argsort(ang[p], kind="stable")] for p in parts]
+        self.size = np.array([len(p) for p in parts], dtype=np.int64)
+        # band b occupies [offset[b], offset[b] + 3*size[b]) of bx/by: its events
+        # repeated over three turns, so every arc is one contiguous slice
+        self.offset = np.concatenate([[0], np.cumsum(3 * self.size)[:-1]]).astype(np.int64) + self.size
+        self.t0 = np.array([rad[p].min() for p in parts])
+        self.t1 = np.array([rad[p].max() for p in parts])
+        # about one event per angular bin
+        self.n_bins = max(16, 1 << int(np.ceil(np.log2(max(int(self.size.max(initial=1)), 1)))))
+        # prefix[b, j] = events of band b with angle < (j - n_bins) * 2pi/n_bins,
+        # j = 0..3*n_bins (three turns, so intervals around any alpha never wrap)
+        edges = np.arange(self.n_bins) * (TWO_PI / self.n_bins)
+        self.prefix = np.zeros((len(parts), 3 * self.n_bins + 1), dtype=np.int64)
+        for b, p in enumerate(parts):
+            first = np.searchsorted(ang[p], edges, "left")
+            self.prefix[b] = np.concatenate([first - len(p), first, first + len(p), [2 * len(p)]])
+        order = np.concatenate([np.tile(p, 3) for p in parts]) if parts else np.zeros(0, dtype=np.int64)
+        self.bx, self.by = events[order, 0], events[order, 1]
+        self.weights = None
+        if weights is not None:
+            w = np.asarray(weights, dtype=float).reshape(self.n, -1)
+            # bw[k] = weights of event bx[k]; wcum[k] = sum of bw[:k] (per column)
+            self.bw = w[order]
+            self.wcum = np.vstack([np.zeros((1, w.shape[1])), np.cumsum(self.bw, axis=0)])
+            self.band_weight = np.array([w[p].sum(axis=0) for p in parts]).reshape(len(parts), w.shape[1])
+            self.weights = w
+
+    # ------------------------------------------------------------------
+    def count(self, centers: np.ndarray, r, workers: int = 1) -> np.ndarray:
+        """Events within distance r (scalar or per-center) of each center."""
+        centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+        r = np.broadcast_to(np.asarray(r, dtype=float), (len(centers),))
+        return self._run(centers, lambda c, s: self._count_chunk(c, r[s], r[s]), (), workers)
+
+    def count_groups(self, centers: np.ndarray, r, workers: int = 1) -> np.ndarray:
+        """(centers x n_groups) counts within distance r, split by event group."""
+        centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+        r = np.broadcast_to(np.asarray(r, dtype=float), (len(centers),))
+        return self._run(centers, lambda c, s: self._count_chunk(c, r[s], r[s], by_group=True),
+                         (self.n_groups,), workers)
+
+    def count_multi(self, centers: np.ndarray, radii, workers: int = 1) -> np.ndarray:
+        """
+        (centers x radii) counts in one pass: events between the guaranteed
+        inner region of min(radii) and the outer arc of max(radii) are visited
+        once and binned by distance.
+        """
+        centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+        radii = np.asarray(radii, dtype=float).ravel()
+        order = np.argsort(radii, kind="stable")
+        rs = radii[order]
+        lo, hi = np.full(len(centers), rs[0]), np.full(len(centers), rs[-1])
+        out = self._run(centers, lambda c, s: self._count_chunk(c, lo[s], hi[s], rs), (len(rs),), workers)
+        res = np.empty_like(out)
+        res[:, order] = out
+        return res
+
+    def sum(self, centers: np.ndarray, r, workers: int = 1) -> np.ndarray:
+        """(centers x weight columns) total event weight within distance r."""
+        if self.weights is None:
+            raise ValueError("index was built without weights")
+        centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+        r = np.broadcast_to(np.asarray(r, dtype=float), (len(centers),))
+        return self._run(centers, lambda c, s: self._sum_chunk(c, r[s]),
+                         (self.weights.shape[1],), workers, dtype=float)
+
+    def _run(self, centers, fn, tail, workers, dtype=np.int64):
+        out = np.zeros((len(centers),) + tail, dtype=dtype)
+        if self.n == 0 or len(centers) == 0:
+            return out
+        step = max(1, CHUNK // len(self.size))
+        starts = range(0, len(centers), step)
+        def run(s):
+            sl = slice(s, s + step)
+            out[sl] = fn(centers[sl], sl)
+        workers = (os.cpu_count() or 1) if workers == -1 else max(1, workers)
+        if workers == 1 or len(starts) == 1:
+            for s in starts:
+                run(s)
+        else:
+            with ThreadPoolExecutor(workers) as ex:
+                list(ex.map(run, starts))
+        return out
+
+    def _arcs(self, c: np.ndarray, r_lo: np.ndarray, r_hi: np.ndarray):
+        """
+        Bands fully inside r_lo (m x bands mask), and for every partially
+        covered (center ci, band bi) pair the positions i0 <= i1 <= i2 <= i3
+        in the band's angular order: [i1, i2) is inside r_lo, [i0, i1) and
+        [i2, i3) must be checked against r_hi, the rest is outside.
+        """
+        rho = np.hypot(c[:, 0], c[:, 1])[:, None]
+        alpha = np.mod(np.arctan2(c[:, 1], c[:, 0]), TWO_PI)[:, None]
+        r_in = (r_lo * (1 - _TOL) - _TOL)[:, None]
+        r_out = (r_hi * (1 + _TOL) + _TOL)[:, None]
+        t0, t1 = self.t0[None, :], self.t1[None, :]
+
+        full = t1 + rho <= r_in                                        # (m, bands)
+        part = ~full & (t0 - rho <= r_out) & (rho - t1 <= r_out)
+        ci, bi = np.nonzero(part)
+        if len(ci) == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return full, ci, bi, empty, empty, empty, empty
+        rp, ap = rho[ci, 0], alpha[ci, 0]
+        t0p, t1p, sp = self.t0[bi], self.t1[bi], self.size[bi]
+        h_in = _half_angle_in(t0p, t1p, rp, r_in[ci, 0])
+        h_out = np.minimum(_half_angle_out(t0p, t1p, rp, r_out[ci, 0]), np.pi)
+
+        # angles in bin units, shifted by one turn (prefix covers [-2pi, 4pi))
+        scale = self.n_bins / TWO_PI
+        u = ap * scale + self.n_bins
+        row = bi * self.prefix.shape[1]
+        pref = self.prefix.ravel()
+        i0 = pref[row + np.floor(u - h_out * scale).astype(np.int64)]
+        i3 = np.minimum(pref[row + np.ceil(u + h_out * scale).astype(np.int64)], i0 + sp)
+        has_in = h_in >= 0
+        h_in = np.maximum(h_in, 0.0) * scale
+        i1 = np.clip(pref[row + np.ceil(u - h_in).astype(np.int64)], i0, i3)
+        i2 = pref[row + np.floor(u + h_in).astype(np.int64)]
+        i2 = np.where(has_in, np.clip(i2, i1, i3), i1)
+        return full, ci, bi, i0, i1, i2, i3
+
+    def _sum_chunk(self, c: np.ndarray, r: np.ndarray) -> np.ndarray:
+        """Weights within r: band totals, cumulative-weight lookups, exact boundary arcs."""
+        m, k_w = len(c), self.bw.shape[1]
+        full, ci, bi, i0, i1, i2, i3 = self._arcs(c, r, r)
+        out = full @ self.band_weight
+        if len(ci) == 0:
+            return out
+        first = self.offset[bi]
+        inner = self.wcum[first + i2] - self.wcum[first + i1]
+        for j in range(k_w):
+            out[:, j] += np.bincount(ci, weights=inner[:, j], minlength=m)
+
+        lo = np.concatenate([i0, i2])
+        n_cand = np.concatenate([i1 - i0, i3 - i2])
+        keep = n_cand > 0
+        if not keep.any():
+            return out
+        lo, n_cand = lo[keep], n_cand[keep]
+        ci2 = np.tile(ci, 2)[keep]
+        first = np.tile(first, 2)[keep] + lo
+        cum = np.cumsum(n_cand)
+        cuts = np.searchsorted(cum, np.arange(CAND_CHUNK, int(cum[-1]), CAND_CHUNK), "right")
+        for sl in np.split(np.arange(len(n_cand)), cuts):
+            if len(sl) == 0:
+                continue
+            nc, cc = n_cand[sl], ci2[sl]
+            start = np.cumsum(nc) - nc
+            k = np.arange(int(nc.sum())) + np.repeat(first[sl] - start, nc)
+            cr = np.repeat(cc, nc)
+            dx = self.bx[k] - c[cr, 0]
+            dy = self.by[k] - c[cr, 1]
+            hit = dx * dx + dy * dy <= r[cr] * r[cr]
+            for j in range(k_w):
+                out[:, j] += np.bincount(cr[hit], weights=self.bw[k[hit], j], minlength=m)
+        return out
+
+    def _count_chunk(self, c: np.ndarray, r_lo: np.ndarray, r_hi: np.ndarray,
+                     radii: np.ndarray | None = None, by_group: bool = False) -> np.ndarray:
+        """
+        Counts within r_hi (radii is None), or per sorted radius with
+        r_lo = min(radii), r_hi = max(radii). Events inside the guaranteed
+        region of r_lo are counted from the tables; those outside the outer
+        arc of r_hi are skipped; the rest are checked exactly.
+        With by_group, every count is split by event group (extra axis 1).
+        """
+        # counts are accumulated per key = center * G + group (G = 1: per center)
+        G = self.n_groups if by_group else 1
+        m = len(c)
+        shape = (m, G) if by_group else (m,)
+        full, ci, bi, i0, i1, i2, i3 = self._arcs(c, r_lo, r_hi)
+        base = ((full * self.size) @ self._onehot).ravel() if by_group else (full * self.size).sum(axis=1)
+        key = ci * G + self.band_group[bi] if by_group else ci
+        mk = m * G
+        k_out = 1 if radii is None else len(radii)
+        if len(ci) == 0:
+            return self._shape_out(base, None, shape, radii)
+        base += np.bincount(key, weights=i2 - i1, minlength=mk).astype(np.int64)
+
+        # exact check on the two boundary arcs [i0, i1) and [i2, i3)
+        lo = np.concatenate([i0, i2])
+        n_cand = np.concatenate([i1 - i0, i3 - i2])
+        keep = n_cand > 0
+        if not keep.any():
+            return self._shape_out(base, None, shape, radii)
+        lo, n_cand = lo[keep], n_cand[keep]
+        ci2 = np.tile(ci, 2)[keep]
+        key2 = np.tile(key, 2)[keep]
+        first = self.offset[np.tile(bi, 2)[keep]] + lo
+        if radii is None:
+            hits = np.zeros(mk, dtype=np.int64)
+        else:
+            hist = np.zeros(mk * (k_out + 1), dtype=np.int64)
+            r2 = radii * radii
+        # boundary candidates in batches of ~CAND_CHUNK events
+        cum = np.cumsum(n_cand)
+        cuts = np.searchsorted(cum, np.arange(CAND_CHUNK, int(cum[-1]), CAND_CHUNK), "right")
+        for sl in np.split(np.arange(len(n_cand)), cuts):
+            if len(sl) == 0:
+                continue
+            nc, cc, kc = n_cand[sl], ci2[sl], key2[sl]
+            start = np.cumsum(nc) - nc
+            k = np.arange(int(nc.sum())) + np.repeat(first[sl] - start, nc)
+            dx = self.bx[k] - np.repeat(c[cc, 0], nc)
+            dy = self.by[k] - np.repeat(c[cc, 1], nc)
+            d2 = dx * dx + dy * dy
+            if radii is None:
+                hit = d2 <= np.repeat(r_hi[cc] * r_hi[cc], nc)
+                hits += np.bincount(kc, weights=np.add.reduceat(hit, start), minlength=mk).astype(np.int64)
+            else:
+                # bin j: radii[j-1] < d <= radii[j]  ->  counted for every radius >= radii[j]
+                j = np.searchsorted(r2, d2, "left")
+                hist += np.bincount(np.repeat(kc, nc) * (k_out + 1) + j, minlength=mk * (k_out + 1))
+        if radii is None:
+            return (base + hits).reshape(shape)
+        return self._shape_out(base, np.cumsum(hist.reshape(mk, k_out + 1), axis=1)[:, :k_out], shape, radii)
+
+    @staticmethod
+    def _shape_out(base, extra, shape, radii):
+        """Per-key counts (plus per-radius cumulative extras) in the output shape."""
+        if radii is None:
+            return base.reshape(shape)
+        out = np.repeat(base[:, None], len(radii), axis=1)
+        if extra is not None:
+            out += extra
+        return out.reshape(shape + (len(radii),))
+
+    # ------------------------------------------------------------------
+    def verify(self, centers: np.ndarray, r, n_check: int = 256, seed: int = 0,
+               workers: int = -1) -> int:
+        """Number of mismatches against scipy's KDTree on a random subset of centers."""
+        centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+        r = np.broadcast_to(np.asarray(r, dtype=float), (len(centers),))
+        if self.n == 0 or len(centers) == 0:
+            return 0
+        pick = np.random.default_rng(seed).choice(len(centers), size=min(n_check, len(centers)), replace=False)
+        if self._tree is None:
+            self._tree = KDTree(self.events)
+        ref = self._tree.query_ball_point(centers[pick], r[pick], return_length=True, workers=workers)
+        return int(np.count_nonzero(ref != self.count(centers[pick], r[pick])))
+
+def _f(t, rho, R):
+    """cos of the half-angle subtended by the disk at radius t."""
+    return (t * t + rho * rho - R * R) / (2.0 * t * rho)
+
+def _half_angle_in(t0, t1, rho, R):
+    """Largest h with every band point at |phi - alpha| <= h inside the disk (-1 if none)."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fmax = np.maximum(_f(t0, rho, R), _f(t1, rho, R))  # f is convex or increasing in t
+    ok = (rho > 0) & (t0 > 0) & (fmax <= 1.0)
+    return np.where(ok, np.arccos(np.clip(fmax, -1.0, 1.0)), -1.0)
+
+def _half_angle_out(t0, t1, rho, R):
+    """Smallest h with every band point at |phi - alpha| > h outside the disk."""
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t_star = np.sqrt(np.maximum(rho * rho - R * R, 0.0))
+        fmin = _f(np.clip(t_star, t0, t1), rho, R)
+    ok = (rho > 0) & (t0 > 0) & np.isfinite(fmin)
+    return np.where(ok, np.arccos(np.clip(fmin, -1.0, 1.0)), np.pi)
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Job-grid sweep over (embedding, N, R, seed, sample size) with checkpoint / resume
+----------------------------------------------------------------------------------
+Expands the grid EMBEDDINGS x N_VALUES x RADII x SEEDS x SAMPLE_SIZES into
+jobs, one result row each: KS (and CvM, AD) between the densities of the
+real primes and of a same-geometry Cramér null around sampled centers, on
+the embedding of n = 2..N (embedding.py registry: log, Archimedean and
+Sacks spirals, Ulam square spiral). Several EMBEDDINGS compare the KS of
+the same integers under different geometries in one run; radii are in
+each embedding's own units, so their scales differ (log N against
+sqrt N).
+
+Jobs are grouped by what they share, and each group runs in one process
+of a local pool (PROCESSES):
+- a group is one (embedding, N): the points, the prime events and their
+  count index (the kind the embedding declares, unless INDEX is set) are
+  built once;
+- within it, one seed: the null realization (null_ensemble.null_rows, the
+  stream of E2 with SEED = seed) and its index;
+- within that, one sample size: the centers (embedding.sample_centers, the
+  stream of E3/E4), counted for every radius in one pass.
+For the log spiral (b = 0.1) at N = 1e6 and seed 42 the rows are those
+of E3/E4.
+
+Each finished (N, seed, sample size) batch is appended to OUT_CSV at once
+(one write, flushed), so an interrupted sweep keeps its rows. A rerun
+reads OUT_CSV, skips the jobs already there and appends the rest; growing
+the grid only runs the new jobs. The settings that change every row (the
+stored columns) are recorded next to the CSV (OUT_CSV + ".json"), and a
+rerun with different ones stops instead of mixing rows: delete OUT_CSV to
+start over.
+
+  PIPELINE_PARAMS='{"N_VALUES": [250000, 500000, 1000000], "SEEDS": [1, 2, 3]}' \\
+      python scripts/sweep_jobs.py
+  PIPELINE_PARAMS='{"EMBEDDINGS": [{"embedding": "log_spiral", "b": 0.1}, {"embedding": "sacks"},
+                    {"embedding": "ulam"}], "RADII": [2.0, 5.0, 10.0]}' python scripts/sweep_jobs.py
+"""
+
+import csv
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import Manager
+from queue import Empty
+from config import apply_overrides
+from count_stats import ad_hist, count_histogram, cvm_hist, ks_hist
+from density import build_index, count_in_disks_multi
+from embedding import EMBEDDINGS as REGISTRY, make_embedding, sample_centers
+from instrument import merge, records, save_profile, stage
+from null_ensemble import cramer_constant, null_rows
+
+# ------------------------
+# CONFIG
+# ------------------------
+# embeddings: registered name and its parameters (embedding.py)
+EMBEDDINGS = [{"embedding": "log_spiral", "b": 0.1}]
+
+N_VALUES = [200_000, 600_000, 1_000_000]
+RADII = [2.0, 5.0, 10.0, 20.0]
+SEEDS = [42, 43, 44]       # null realization and center sample
+SAMPLE_SIZES = [50_000]
+
+PROCESSES = -1    # groups (values of N) run at once: -1 = all cores
+WORKERS = 1       # density query threads per process
+INDEX = None      # None: the index each embedding declares; or "spiral" / "kdtree"
+
+OUT_CSV = "./results/sweep_jobs.csv"
+apply_overrides(globals())  # CONFIG values passed by pipeline.py, if any
+
+KEY = ["embedding", "N", "R", "seed", "sample_size"]
+COLUMNS = KEY + ["mean_rho_real", "mean_rho_null", "KS_statistic", "p_value", "CvM_statistic",
+                 "AD_statistic", "n_real_primes", "n_null_events", "c"]
+POLL_SECONDS = 0.5
+
+# ------------------------
+# JOBS
+# ------------------------
+def job_key(embedding, N, R, seed, sample_size) -> tuple:
+    return str(embedding), int(N), float(R), int(seed), int(sample_size)
+
+def embedding_label(spec: dict) -> str:
+    """Row label of an EMBEDDINGS entry, e.g. "log_spiral(b=0.1)" or "sacks"."""
+    spec = dict(spec)
+    name = spec.pop("embedding")
+    if name not in REGISTRY:
+        raise SystemExit(f"unknown embedding {name!r}; registered: {sorted(REGISTRY)}")
+    return f"{name}({', '.join(f'{k}={v!r}' for k, v in sorted(spec.items()))})" if spec else name
+
+def expand_grid() -> dict:
+    """
+    {(label, N): {(seed, sample size): [radii]}} of every job of the grid.
+    Sample sizes above the N - 1 rows of n = 2..N are clamped to N - 1 (the
+    size recorded in the rows).
+    """
+    groups = {}
+    for spec in EMBEDDINGS:
+        for N in sorted({int(n) for n in N_VALUES}):
+            for seed in SEEDS:
+                for size in SAMPLE_SIZES:
+                    groups.setdefault((embedding_label(spec), N), {})[(int(seed), min(int(size), N - 1))] = \
+                        sorted({float(r) for r in RADII})
+    return groups
+
+def pending_jobs(groups: dict, done: set) -> dict:
+    """The grid minus the jobs already in the checkpoint (emptied batches and groups dropped)."""
+    out = {}
+    for (label, N), batches in groups.items():
+        for (seed, size), radii in batches.items():
+            todo = [r for r in radii if job_key(label, N, r, seed, size) not in done]
+            if todo:
+                out.setdefault((label, N), {})[(seed, size)] = todo
+    return out
+
+# ------------------------
+# CHECKPOINT
+# ------------------------
+def settings() -> dict:
+    return {"start": 2, "columns": COLUMNS}
+
+def open_checkpoint(path: str) -> set:
+    """
+    Keys of the rows already in `path` (created with a header if missing).
+    A last line cut by a crash is dropped.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    side = path + ".json"
+    if os.path.exists(side):
+        with open(side) as f:
+            if json.load(f) != settings():
+                raise SystemExit(f"{path} was written with other settings ({side}); delete it to start over")
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        with open(side, "w") as f:
+            json.dump(settings(), f, indent=2)
+        with open(path, "w", newline="") as f:
+            csv.writer(f).writerow(COLUMNS)
+        return set()
+    with open(path, "rb+") as f:
+        data = f.read()
+        if not data.endswith(b"\n"):
+            f.truncate(data.rfind(b"\n") + 1)
+    with open(path, newline="") as f:
+        reader = csv.reader(f)
+        if next(reader, None) != COLUMNS:
+            raise SystemExit(f"{path} has other columns; delete it to start over")
+        return {job_key(*row[:len(KEY)]) for row in reader if len(row) == len(COLUMNS)}
+
+def append_rows(path: str, rows) -> None:
+    with open(path, "a", newline="") as f:
+        csv.writer(f).writerows([[row[c] for c in COLUMNS] for row in rows])
+        f.flush()
+        os.fsync(f.fileno())
+
+# ------------------------
+# WORKER
+# ------------------------
+def run_group(spec: dict, N: int, batches: dict, kind: str | None, workers: int, queue) -> list:
+    """
+    All batches of one (embedding, N); puts each batch's rows on `queue` as
+    it finishes. Returns the stages this call recorded (GNM_PROFILE=1).
+    """
+    first = len(records())
+    label = embedding_label(spec)
+    params = {k: v for k, v in spec.items() if k != "embedding"}
+    emb = make_embedding(spec["embedding"], N, **params)
+    kind = emb.index if kind is None else kind
+    with stage(f"real:{label}:N={N}", items=emb.size):
+        prime_rows = emb.prime_rows()
+        real_index = build_index(emb.coords(prime_rows), kind=kind)
+        c = cramer_constant(emb, emb.size, len(prime_rows))
+    for seed in sorted({s for s, _ in batches}):
+        with stage(f"null:{label}:N={N}:seed={seed}", items=emb.size):
+            rows = null_rows(emb, emb.size, c, seed, workers=workers)
+            null_index = build_index(emb.coords(rows), kind=kind)
+        for (s, size), radii in sorted(batches.items()):
+            if s != seed:
+                continue
+            with stage(f"density:{label}:N={N}:seed={seed}:M={size}", items=size * len(radii)):
+                centers = sample_centers(emb, size, seed)
+                rho_real = count_in_disks_multi(real_index, centers, radii, workers=workers)
+                rho_null = count_in_disks_multi(null_index, centers, radii, workers=workers)
+            out = []
+            for k, R in enumerate(radii):
+                h_real, h_null = count_histogram(rho_real[:, k]), count_histogram(rho_null[:, k])
+                ks_stat, ks_p = ks_hist(h_real, h_null)
+                out.append({"embedding": label, "N": N, "R": R, "seed": seed, "sample_size": size,
+                            "mean_rho_real": float(rho_real[:, k].mean()),
+                            "mean_rho_null": float(rho_null[:, k].mean()),
+                            "KS_statistic": ks_stat, "p_value": ks_p,
+                            "CvM_statistic": cvm_hist(h_real, h_null), "AD_statistic": ad_hist(h_real, h_null),
+                            "n_real_primes": len(prime_rows), "n_null_events": len(rows), "c": c})
+            queue.put(out)
+    return records()[first:]
+
+# ------------------------
+# MAIN
+# ------------------------
+def main():
+    done = open_checkpoint(OUT_CSV)
+    groups = expand_grid()
+    total = sum(len(r) for batches in groups.values() for r in batches.values())
+    todo = pending_jobs(groups, done)
+    left = sum(len(r) for batches in todo.values() for r in batches.values())
+    print(f"{total} jobs, {total - left} already in {OUT_CSV}, {left} to run in {len(todo)} group(s)")
+    if not todo:
+        return
+
+    processes = (os.cpu_count() or 1) if PROCESSES == -1 else max(1, PROCESSES)
+    failed, t0 = [], time.perf_counter()
+    with Manager() as manager, ProcessPoolExecutor(min(processes, len(todo))) as ex:
+        queue = manager.Queue()
+        specs = {embedding_label(spec): spec for spec in EMBEDDINGS}
+        # largest N first: the longest groups start early
+        running = {ex.submit(run_group, specs[label], N, todo[label, N], INDEX, WORKERS, queue): (label, N)
+                   for label, N in sorted(todo, key=lambda g: -g[1])}
+
+        def drain():
+            while True:
+                try:
+                    rows = queue.get_nowait()
+                except Empty:
+                    return
+                append_rows(OUT_CSV, rows)
+                for row in rows:
+                    print(f"{row['embedding']} N={row['N']:>8d} R={row['R']:>5g} seed={row['seed']} "
+                          f"M={row['sample_size']}: "
+                          f"KS={row['KS_statistic']:.4f} | p={row['p_value']:.2e}")
+
+        while running:
+            finished, _ = wait(running, timeout=POLL_SECONDS, return_when=FIRST_COMPLETED)
+            drain()
+            for fut in finished:
+                label, N = running.pop(fut)
+                try:
+                    merge(fut.result())
+                except Exception as e:  # the other groups keep running; their rows are kept
+                    failed.append(f"{label} N={N}")
+                    print(f"[fail] {label} N={N}: {e!r}")
+        drain()
+    save_profile(OUT_CSV)  # per-stage timings next to the CSV (GNM_PROFILE=1)
+    print(f"\nSaved: {OUT_CSV} ({time.perf_counter() - t0:.1f} s)")
+    if failed:
+        raise SystemExit(f"groups failed: {sorted(failed)}; rerun to resume")
+
+if __name__ == "__main__":
+    main()
@@ -3,41 +3,69 @@
 Sweep KS vs N (same-geometry null)
 ----------------------------------
 For each cutoff N, this script:
-1) Loads the base embedding up to N (first N rows of the E1 dataset).
+1) Generates the log-spiral embedding n = 2..N on the fly from (N, b)
+   (embedding.py: no dataset is read, rows are n = 2, 3, ... by construction).
 2) Generates a same-geometry Cramér null model on those points.
 3) Samples M centers from the full embedding.
-4) Computes local densities rho_R(x) for real and null events using KDTree radius counts.
+4) Computes local densities rho_R(x) for real and null events.
 5) Computes KS statistic and p-value for rho distributions.
-6) Saves results to results/ks_vs_N_same_geometry.csv
-
-Assumptions:
-- E1_base_log_espiral_1M.csv contains columns: x, y, is_prime
-- Rows are ordered by n (so taking first k rows corresponds to n up to N)
+6) Optionally (N_REALIZATIONS > 0) repeats 2)-5) for an ensemble of independent
+   null realizations (null_ensemble.py) and adds quantile envelopes of
+   KS(real, null_i) and of the null-to-null reference KS(null_i, null_j).
+7) Saves results to results/ks_vs_N_same_geometry.csv
+
+All cutoffs are computed incrementally, in one density pass over max(N):
+- every event is labelled with the first cutoff that contains it, and
+  count_in_disks_groups splits each center's count by that label, so the
+  count at cutoff k is a cumulative sum over labels <= k;
+- the center samples are nested (the sample for N_k reuses a uniformly
+  chosen part of the sample for N_{k-1}), so the union of all samples is
+  about M * (1 + ln(max N / min N)) centers, whatever the number of cutoffs;
+- the nulls share one uniform U_n per n: n is a null event at cutoff N iff
+  U_n < c_N / log n, i.e. each cutoff gets an exact Bernoulli(c_N / log n)
+  draw (the same one as a separate run at that N). Events below min(c_N)
+  are labelled like the real primes; the few between min(c_N) and max(c_N)
+  are labelled by the set of cutoffs they belong to.
+
+The null realization and the (centers x cutoffs) counts are cached on disk
+(cache.py), keyed by the embedding, the cutoffs, the seed, R and the sample
+size, so re-running with unchanged parameters skips both.
 """
 
-import math
 import os
 import numpy as np
 import pandas as pd
-from scipy.spatial import KDTree
-from scipy.stats import ks_2samp
+from cache import ArrayCache
+from config import apply_overrides
+from embedding import LogSpiralEmbedding
+from density import build_index, count_in_disks_groups
+from null_ensemble import CHUNK, cramer_constants, ks_envelopes, run_ensemble
+from count_stats import count_histogram, ks_hist
+from instrument import save_profile, stage
 
 # ------------------------
 # CONFIG
 # ------------------------
-BASE_DATA = "./data/E1_base_log_espiral_1M.csv"
-REAL_LABEL = "is_prime"
+B = 0.1  # theta = b*n (same as E1)
 
-# Choose N values (must be <= dataset size)
+# Choose N values (no upper limit: the embedding is never stored; the cost is
+# that of max(N_VALUES), so dense grids of cutoffs are cheap)
 N_VALUES = [200_000, 400_000, 600_000, 800_000, 1_000_000]
 
 # Density parameters
 RADIUS = 10.0
 SAMPLE_SIZE = 50_000
 SEED = 42
+WORKERS = -1  # density queries: -1 = all cores
+INDEX = "spiral"  # "spiral" (log-spiral band index) or "kdtree"
+
+# Null ensemble: independent realizations per N for KS envelopes (0 = off, e.g. 200)
+N_REALIZATIONS = 0
+PROCESSES = -1  # ensemble worker processes: -1 = all cores
 
 # Output
 OUTCSV = "./results/ks_vs_N_same_geometry.csv"
+apply_overrides(globals())  # CONFIG values passed by pipeline.py, if any
 os.makedirs(os.path.dirname(OUTCSV), exist_ok=True)
 
 # ------------------------
@@ -46,46 +74,65 @@ os.makedirs(os.path.dirname(OUTCSV), exist_ok=True)
 def ensure_dirs():
     os.makedirs(os.path.dirname(OUTCSV), exist_ok=True)
 
-def make_null_same_geometry(df_real: pd.DataFrame, seed: int) -> pd.DataFrame:
+def nested_samples(rows_list, size: int, rng) -> list:
+    """
+    Uniform samples of min(size, rows) rows out of the first `rows` rows,
+    for increasing rows_list, each reusing part of the previous one: the
+    number kept from the old prefix is hypergeometric, the rest is new.
     """
-    Same-geometry Cramér-type null:
-    X_n ~ Bernoulli(p(n)), p(n)=c/log(n), with c calibrated to match total prime count.
-    We assume df_real rows correspond to n increasing from 2 upward.
+    samples, prev, prev_rows = [], np.zeros(0, dtype=np.int64), 0
+    for rows in rows_list:
+        m = min(size, rows)
+        h = rng.hypergeometric(prev_rows, rows - prev_rows, m) if prev_rows else 0
+        keep = rng.choice(prev, size=h, replace=False)
+        new = prev_rows + rng.choice(rows - prev_rows, size=m - h, replace=False)
+        prev, prev_rows = np.concatenate([keep, new]).astype(np.int64), rows
+        samples.append(prev)
+    return samples
+
+def make_null_same_geometry(emb: LogSpiralEmbedding, rows_list, c_values, seed: int):
+    """
+    Same-geometry Cramér-type null for every cutoff from one stream:
+    X_n ~ Bernoulli(p(n)), p(n)=c_N/log(n), with c_N calibrated to match the
+    prime count up to N, realized as U_n < c_N/log(n) with shared U_n.
+    Returns (event rows, group per event, (groups x cutoffs) membership):
+    events below min(c_N) get the group of their first cutoff, the others
+    one group per distinct set of cutoffs they belong to.
     """
     rng = np.random.default_rng(seed)
-
-    # infer n from row index if n column absent
-    if "n" in df_real.columns:
-        n_vals = df_real["n"].to_numpy()
-    else:
-        # if dataset starts at n=2 and is ordered, approximate:
-        # row 0 -> n=2
-        n_vals = np.arange(2, 2 + len(df_real), dtype=np.int64)
-
-    # real prime count
-    real_prime_count = int(df_real[REAL_LABEL].sum())
-
-    # avoid log(0) etc
-    logn = np.log(n_vals.astype(float))
-    logn[logn == 0] = 1.0
-
-    # p(n) = c/log(n). Choose c so that sum p(n) ≈ real_prime_count
-    # c = real_prime_count / sum(1/log(n))
-    denom = np.sum(1.0 / logn)
-    c = real_prime_count / denom
-
-    p = c / logn
-    p = np.clip(p, 0.0, 1.0)
-
-    is_null = (rng.random(len(df_real)) < p).astype(int)
-
-    df_null = df_real[["x", "y"]].copy()
-    df_null["is_prime_null"] = is_null
-    return df_null, c, real_prime_count, int(is_null.sum())
-
-def density(points: np.ndarray, tree: KDTree, r: float) -> np.ndarray:
-    # KDTree query_ball_point is stable; list comprehension is okay for 50k
-    return np.array([len(tree.query_ball_point(pt, r=r)) for pt in points], dtype=np.int64)
+    K = len(rows_list)
+    c_values = np.asarray(c_values, dtype=float)
+    c_lo, c_hi = float(c_values.min()), float(c_values.max())
+    base, marg = [], []
+    top = int(max(rows_list))
+    for lo in range(0, top, CHUNK):
+        logn = np.log(emb.n(slice(lo, min(lo + CHUNK, top))).astype(float))
+        u = rng.random(len(logn))
+        base.append(np.flatnonzero(u < c_lo / logn) + lo)
+        m = np.flatnonzero((u >= c_lo / logn) & (u < c_hi / logn))
+        marg.append((m + lo, u[m] < c_values[:, None] / logn[m]))
+    base = np.concatenate(base)
+    marg_rows = np.concatenate([m for m, _ in marg])
+    inside = np.concatenate([i for _, i in marg], axis=1).T & (marg_rows[:, None] < np.asarray(rows_list))
+    patterns, marg_group = np.unique(inside, axis=0, return_inverse=True)
+    keep = inside.any(axis=1)
+    member = np.vstack([cumulative_membership(K), patterns]).astype(np.int64)
+    rows = np.concatenate([base, marg_rows[keep]])
+    groups = np.concatenate([first_cutoff(rows_list, base), K + marg_group.ravel()[keep]])
+    return rows, groups, member
+
+def first_cutoff(rows_list, event_rows) -> np.ndarray:
+    """Index of the first cutoff whose row prefix contains each event."""
+    return np.searchsorted(rows_list, event_rows, "right")
+
+def cumulative_membership(K: int) -> np.ndarray:
+    """(groups x cutoffs) membership when group g belongs to every cutoff k >= g."""
+    return np.tri(K, dtype=np.int64).T
+
+def nested_counts(emb: LogSpiralEmbedding, event_rows, groups, member, center_xy) -> np.ndarray:
+    """(centers x cutoffs) event counts from one grouped density pass."""
+    index = build_index(emb.coords(event_rows), kind=INDEX, groups=groups, n_groups=len(member))
+    return count_in_disks_groups(index, center_xy, RADIUS, workers=WORKERS) @ member
 
 # ------------------------
 # MAIN
@@ -93,49 +140,68 @@ def density(points: np.ndarray, tree: KDTree, r: float) -> np.ndarray:
 def main():
     ensure_dirs()
 
-    np.random.seed(SEED)
-
-    # Load once, then slice
-    df_base = pd.read_csv(BASE_DATA, engine="python")
+    rng = np.random.default_rng(SEED)
+
+    # Embedding and prime mask up to max(N); each cutoff is a row prefix
+    n_values = sorted(N_VALUES)
+    emb = LogSpiralEmbedding(n_values[-1], B)
+    rows_list = [N - emb.start + 1 for N in n_values]
+    with stage("primes", items=emb.size):
+        prime_rows = emb.prime_rows()
+    n_real = np.searchsorted(prime_rows, rows_list)
+
+    # Null: c calibrated per cutoff, one shared uniform stream
+    with stage("calibrate", items=emb.size):
+        c_values = cramer_constants(emb, rows_list, n_real)
+    cache = ArrayCache()
+    null_key = {"kind": "nested_cramer_null", "N": emb.N, "b": emb.b, "start": emb.start,
+                "rows": rows_list, "c": c_values.tolist(), "seed": SEED}
+    with stage("null", items=emb.size):
+        null = cache.get_or_compute(null_key, lambda: dict(zip(
+            ("rows", "groups", "member"), make_null_same_geometry(emb, rows_list, c_values, SEED))))
+    null_rows, null_groups, null_member = null["rows"], null["groups"], null["member"]
+
+    # Nested center samples and their union
+    with stage("sample") as st:
+        samples = nested_samples(rows_list, SAMPLE_SIZE, rng)
+        centers = np.unique(np.concatenate(samples))
+        center_xy = emb.coords(centers)
+        st.items = len(centers)
+
+    # One grouped density pass per event set gives every cutoff's counts
+    K = len(rows_list)
+    with stage("density", items=len(centers) * K):
+        rho = cache.get_or_compute(
+            {**null_key, "kind": "nested_density", "radius": RADIUS, "sample_size": SAMPLE_SIZE},
+            lambda: {"real": nested_counts(emb, prime_rows, first_cutoff(rows_list, prime_rows),
+                                           cumulative_membership(K), center_xy),
+                     "null": nested_counts(emb, null_rows, null_groups, null_member, center_xy)})
+    rho_real_all, rho_null_all = rho["real"], rho["null"]
+    n_null_all = np.bincount(null_groups, minlength=len(null_member)) @ null_member
 
-    rows_total = len(df_base)
     results = []
 
-    for N in N_VALUES:
-        if N > rows_total:
-            print(f"[skip] N={N} exceeds dataset rows={rows_total}")
-            continue
-
-        df_real = df_base[df_base["n"] <= N].copy()
-
-        # Generate null on same geometry for this N
-        df_null, c, n_real, n_null = make_null_same_geometry(df_real, seed=SEED)
+    for k, N in enumerate(n_values):
+        rows, c = rows_list[k], float(c_values[k])
+        pos = np.searchsorted(centers, samples[k])
+        sample_points = center_xy[pos]
 
-        # Sample centers from full embedding (real geometry)
-        sample_idx = np.random.choice(len(df_real), size=min(SAMPLE_SIZE, len(df_real)), replace=False)
-        sample_points = df_real.loc[sample_idx, ["x", "y"]].to_numpy()
+        rho_real = rho_real_all[pos, k]
+        rho_null = rho_null_all[pos, k]
+        n_null = int(n_null_all[k])
 
-        # Build event trees
-        coords_real = df_real[df_real[REAL_LABEL] == 1][["x", "y"]].to_numpy()
-        coords_null = df_null[df_null["is_prime_null"] == 1][["x", "y"]].to_numpy()
-
-        tree_real = KDTree(coords_real)
-        tree_null = KDTree(coords_null)
-
-        rho_real = density(sample_points, tree_real, RADIUS)
-        rho_null = density(sample_points, tree_null, RADIUS)
-
-        ks_stat, ks_p = ks_2samp(rho_real, rho_null)
+        with stage(f"ks:N={N}", items=len(rho_real)):
+            ks_stat, ks_p = ks_hist(count_histogram(rho_real), count_histogram(rho_null))
 
         mean_real = float(rho_real.mean())
         mean_null = float(rho_null.mean())
 
         print(
             f"N={N:>8d}: mean(real)={mean_real:>10.2f} | mean(null)={mean_null:>10.2f} "
-            f"| KS={ks_stat:.4f} | p={ks_p:.2e} | primes={n_real} | null={n_null} | c={c:.6f}"
+            f"| KS={ks_stat:.4f} | p={ks_p:.2e} | primes={n_real[k]} | null={n_null} | c={c:.6f}"
         )
 
-        results.append({
+        row = {
             "N": N,
             "R": RADIUS,
             "sample_size": int(len(sample_points)),
@@ -143,14 +209,28 @@ def main():
             "mean_rho_null": mean_null,
             "KS": float(ks_stat),
             "p_value": float(ks_p),
-            "n_real_primes": int(n_real),
+            "n_real_primes": int(n_real[k]),
             "n_null_events": int(n_null),
-            "c": float(c),
+            "c": c,
             "seed": SEED,
-        })
+        }
+
+        if N_REALIZATIONS > 0:
+            with stage(f"ensemble:N={N}", items=N_REALIZATIONS):
+                rho_ens, _ = run_ensemble(emb, rows, sample_points, RADIUS, int(n_real[k]),
+                                          N_REALIZATIONS, SEED, processes=PROCESSES, kind=INDEX)
+                env = ks_envelopes(rho_real, rho_ens)
+            print(
+                f"           ensemble of {N_REALIZATIONS}: KS(real,null) median={env['KS_real_null_q50']:.4f} "
+                f"| KS(null,null) 97.5%={env['KS_null_null_q97.5']:.4f} | p_emp={env['p_empirical']:.3g}"
+            )
+            row.update(env)
+
+        results.append(row)
 
     out = pd.DataFrame(results)
     out.to_csv(OUTCSV, index=False)
+    save_profile(OUTCSV)  # per-stage timings next to the CSV (GNM_PROFILE=1)
     print("\nSaved:", OUTCSV)
 
 if __name__ == "__main__":
@@ -6,80 +6,101 @@ Compares local prime densities around neutral sampled points
 for multiple radii, using:
 - real primes
 - null primes sampled on the SAME geometric embedding
+
+DENSITY = "grid" replaces the exact counts by the FFT grid approximation
+(grid_density.py): every radius costs a few FFTs, so dense sweeps (e.g. 100
+radii) are cheap. Counts are rounded for the statistics, and each row also
+reports the guaranteed error half-width, the rms / max error against exact
+counts on a subset of centers, and, for GRID_KS_CHECK radii spread over
+the sweep, the KS statistic of the exact path (KS_exact).
 """
 
 import numpy as np
 import pandas as pd
-from scipy.spatial import KDTree
-from scipy.stats import ks_2samp
+from config import apply_overrides
+from count_stats import ad_hist, count_histogram, cvm_hist, ks_hist
+from grid_density import sampled_grid_densities
+from instrument import save_profile, stage
+from sampled import sampled_densities
 
 # -----------------------------
 # CONFIGURATION
 # -----------------------------
-REAL_DATA = "./data/E1_base_log_espiral_1M.csv"
-REAL_LABEL = "is_prime"
-NULL_DATA = "./data/null_on_real_embedding.csv"
+REAL_DATA = "./data/E1_base_log_espiral_1M.cols"
+NULL_DATA = "./data/null_on_real_embedding.cols"
 
 RADII = [2.0, 5.0, 10.0, 20.0]
 SAMPLE_SIZE = 50_000
 SEED = 42
-
-np.random.seed(SEED)
-
-# -----------------------------
-# LOAD DATA
-# -----------------------------
-df_real = pd.read_csv(REAL_DATA)
-df_null = pd.read_csv(NULL_DATA)
-
-# Sample neutral points ONCE from the full embedding
-sample_idx = np.random.choice(len(df_real), size=SAMPLE_SIZE, replace=False)
-sample_points = df_real.loc[sample_idx, ["x", "y"]].values
-
-# Event coordinates
-coords_real = df_real[df_real[REAL_LABEL] == 1][["x", "y"]].values
-coords_null = df_null[df_null["is_prime_null"] == 1][["x", "y"]].values
-
-tree_real = KDTree(coords_real)
-tree_null = KDTree(coords_null)
-
-def density(points, tree, r):
-    return np.array([
-        len(tree.query_ball_point(pt, r=r))
-        for pt in points
-    ])
+WORKERS = -1  # density queries: -1 = all cores
+INDEX = "spiral"  # "spiral" (log-spiral band index) or "kdtree"
+DENSITY = "exact"  # "exact" or "grid" (FFT approximation, for dense sweeps)
+GRID_STEP = 0.05   # grid mode: grid step (embedding units)
+GRID_KS_CHECK = 4  # grid mode: radii also run on the exact path, for KS_exact
+OUT_CSV = "./data/radius_sweep_real_embedding.csv"
+apply_overrides(globals())  # CONFIG values passed by pipeline.py, if any
 
 # -----------------------------
 # SWEEP OVER RADII
 # -----------------------------
+# (centers x radii) counts around the same sampled points for every radius,
+# one traversal per event set; radii already in the cache are not recounted
+if DENSITY == "grid":
+    grid = sampled_grid_densities(REAL_DATA, NULL_DATA, RADII, SAMPLE_SIZE, SEED, step=GRID_STEP,
+                                  kind=INDEX, workers=WORKERS)
+    rho_real_all = np.rint(grid["rho_real"]).clip(0).astype(np.int64)
+    rho_null_all = np.rint(grid["rho_null"]).clip(0).astype(np.int64)
+    check = sorted({int(k) for k in np.linspace(0, len(RADII) - 1, min(GRID_KS_CHECK, len(RADII)))})
+    exact_real, exact_null = sampled_densities(REAL_DATA, NULL_DATA, [RADII[k] for k in check],
+                                               SAMPLE_SIZE, SEED, kind=INDEX, workers=WORKERS)
+else:
+    rho_real_all, rho_null_all = sampled_densities(REAL_DATA, NULL_DATA, RADII, SAMPLE_SIZE, SEED,
+                                                   kind=INDEX, workers=WORKERS)
+
 results = []
 
-for R in RADII:
-    rho_real = density(sample_points, tree_real, R)
-    rho_null = density(sample_points, tree_null, R)
+for k, R in enumerate(RADII):
+    rho_real = rho_real_all[:, k]
+    rho_null = rho_null_all[:, k]
 
-    ks_stat, ks_p = ks_2samp(rho_real, rho_null)
+    with stage(f"statistics:R={R:g}", items=len(rho_real)):
+        h_real, h_null = count_histogram(rho_real), count_histogram(rho_null)
+        ks_stat, ks_p = ks_hist(h_real, h_null)
+        cvm, ad = cvm_hist(h_real, h_null), ad_hist(h_real, h_null)
 
-    results.append({
+    row = {
         "R": R,
         "mean_rho_real": rho_real.mean(),
         "mean_rho_null": rho_null.mean(),
         "KS_statistic": ks_stat,
-        "p_value": ks_p
-    })
+        "p_value": ks_p,
+        "CvM_statistic": cvm,
+        "AD_statistic": ad,
+    }
+    if DENSITY == "grid":
+        row["count_half_width"] = max(grid["half_width_real"][k], grid["half_width_null"][k])
+        row["count_err_rms"] = max(grid["err_rms_real"][k], grid["err_rms_null"][k])
+        row["count_err_max"] = max(grid["err_max_real"][k], grid["err_max_null"][k])
+        row["KS_exact"] = np.nan
+        if k in check:
+            j = check.index(k)
+            row["KS_exact"] = ks_hist(count_histogram(exact_real[:, j]), count_histogram(exact_null[:, j]))[0]
+    results.append(row)
 
     print(
         f"R={R:>5}: "
         f"mean(real)={rho_real.mean():.2f} | "
         f"mean(null)={rho_null.mean():.2f} | "
         f"KS={ks_stat:.4f} | p={ks_p:.2e}"
+        + (f" | KS_exact={row['KS_exact']:.4f}" if DENSITY == "grid" and k in check else "")
     )
 
 # -----------------------------
 # SAVE RESULTS
 # -----------------------------
 df_out = pd.DataFrame(results)
-df_out.to_csv("./data/radius_sweep_real_embedding.csv", index=False)
+df_out.to_csv(OUT_CSV, index=False)
+save_profile(OUT_CSV)  # per-stage timings next to the CSV (GNM_PROFILE=1)
 
 print("\n✔ Radius sweep (same geometry null) saved to:")
-print("  ./data/radius_sweep_real_embedding.csv")
+print(f"  {OUT_CSV}")